@@ -4,78 +4,147 @@ from flask_login import LoginManager
 from flask_wtf import CSRFProtect
 from pathlib import Path
 from app.create_with_sql import init_db_with_raw_sql
-from sqlalchemy import text
+from app.db_pool import apply_pool_profiles, init_pool_metrics
+from app.db_routing import RoutingSession, init_db_routing
 from flask_apscheduler import APScheduler # [新增]
-import os
-import json
 
-db = SQLAlchemy()
+# RoutingSession：配置了只读副本时，把只读接口的查询路由到副本
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 csrf = CSRFProtect()
 scheduler = APScheduler()
 
-def create_app():
+# 进程角色 -> 需要注册的蓝图 (模块名, 蓝图变量名)
+# admin 进程同时承载用户端页面，便于单进程部署；web 进程不加载管理后台相关模块
+ROLE_BLUEPRINTS = {
+    "web": [("auth", "auth_bp"), ("routes", "main_bp")],
+    "admin": [("auth", "auth_bp"), ("routes", "main_bp"), ("admin", "admin_bp"), ("database_views", "db_views_bp")],
+    "scheduler": [],
+}
+
+# 用户端模板/路由中指向管理后台的链接：web 进程没有注册 admin 蓝图时，
+# 仍能通过 url_for 生成地址 (由反向代理转发到 admin 进程)
+ADMIN_LINK_ENDPOINTS = {
+    "admin.dashboard": "/admin/",
+}
+
+
+def parse_roles(roles):
+    """'web,admin' / ['web'] -> {'web', 'admin'}，未知角色直接报错。"""
+    items = roles.split(",") if isinstance(roles, str) else roles
+    parsed = {r.strip() for r in items if r and r.strip()}
+    if not parsed or parsed - set(ROLE_BLUEPRINTS):
+        raise ValueError(f"无效的 APP_ROLES: {roles!r}，可选 {', '.join(ROLE_BLUEPRINTS)}")
+    return parsed
+
+
+def _register_blueprints(app, roles):
+    from importlib import import_module
+    from werkzeug.routing import Rule
+
+    registered = []
+    for role in sorted(roles):
+        for module_name, attr in ROLE_BLUEPRINTS[role]:
+            if (module_name, attr) in registered:
+                continue
+            module = import_module(f".{module_name}", __name__)
+            app.register_blueprint(getattr(module, attr))
+            registered.append((module_name, attr))
+
+    if "admin" not in app.blueprints:
+        for endpoint, path in ADMIN_LINK_ENDPOINTS.items():
+            app.url_map.add(Rule(path, endpoint=endpoint, build_only=True))
+
+
+def create_app(config_object="config.Config", roles=None):
+    """应用工厂。
+
+    roles 缺省取配置 APP_ROLES (web / admin / scheduler 的任意组合)：
+      - web：用户端页面与接口
+      - admin：额外注册管理后台与数据中心
+      - scheduler：启动 APScheduler (自动备份、健康快照)，多进程部署时只在一个进程中开启
+    """
     app = Flask(__name__, static_folder="../static", template_folder="../templates")
-    app.config.from_object("config.Config")
+    app.config.from_object(config_object)
+    roles = parse_roles(roles if roles is not None else app.config.get("APP_ROLES", "web,admin,scheduler"))
+    app.config["APP_ROLES"] = ",".join(sorted(roles))
 
     Path(app.config["UPLOAD_FOLDER"]).mkdir(parents=True, exist_ok=True)
     Path(app.config["AVATAR_FOLDER"]).mkdir(parents=True, exist_ok=True)
     Path(app.config["MUSIC_FOLDER"]).mkdir(parents=True, exist_ok=True)
 
+    # 按 bind 应用连接池配置 (必须在 db.init_app 之前)
+    apply_pool_profiles(app)
     db.init_app(app)
+    init_db_routing(app)
     login_manager.init_app(app)
     csrf.init_app(app)
 
+    from .write_behind import write_buffer
+    write_buffer.init_app(app)
+
+    # 房间事件总线 (ROOM_EVENT_BUS)：路由发布一次，各进程的订阅者 (聊天缓冲等) 各自接收
+    from .room_events import room_events
+    room_events.init_app(app)
+
+    from .chat_store import init_chat_store
+    init_chat_store(app)
+
+    # 播放状态防抖：播放控制先写内存，按房间限频写回 room 表
+    from .playback_state import playback_store
+    playback_store.init_app(app)
+
+    # 写接口限流：令牌桶 (进程内或 Redis)，超限返回 429
+    from .rate_limit import rate_limiter
+    rate_limiter.init_app(app)
+
+    # 下一首预取：房间状态下发下一首，后台预热音乐文件到页缓存
+    from .track_prefetch import track_prefetcher
+    track_prefetcher.init_app(app)
+
+    # SQL 剖析：在默认引擎与 admin_db 引擎上挂载事件钩子
+    from .sql_profiler import sql_profiler
+    with app.app_context():
+        sql_profiler.init_app(app, db.engines)
+        init_pool_metrics(db.engines)
+
+        # 运行指标：请求耗时/SQL 条数/调度任务耗时，GET /metrics 输出
+        from .metrics import metrics
+        metrics.init_app(app, db.engines)
+
     login_manager.login_view = "auth.login"
 
     from . import models  # noqa: F401
-    from .routes import main_bp
-    from .auth import auth_bp
-    from .admin import admin_bp
-    from .database_views import db_views_bp
+    _register_blueprints(app, roles)
 
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(main_bp)
-    app.register_blueprint(admin_bp)
-    app.register_blueprint(db_views_bp)
+    # 发布前手动执行迁移：flask migrate-schema
+    from .schema_migrations import migrate_schema_command
+    app.cli.add_command(migrate_schema_command)
 
     with app.app_context():
-        # 创建数据库
+        # 检查 schema 版本，只应用未执行的迁移
         init_db_with_raw_sql(db)
 
-#________________________________________________________________
-        # [新增] 初始化调度器
-        scheduler.init_app(app)
+    if "scheduler" in roles:
+        _start_scheduler(app)
+    return app
 
-        from app.backup_service import execute_save_backup
 
-        def run_scheduled_backup():
-            with app.app_context():
-                execute_save_backup()
+def _start_scheduler(app):
+    """初始化并启动调度器 (全局单例，同一进程内只启动一次)。"""
+    import logging
+    logging.getLogger('apscheduler').setLevel(logging.WARNING)
 
+    from .metrics import metrics
+    if not scheduler.running:
+        scheduler.init_app(app)
+        metrics.init_scheduler(scheduler)
         scheduler.start()
 
-        # [新增] 启动时读取 JSON 配置
-        with app.app_context():
-            import logging
-            logging.getLogger('apscheduler').setLevel(logging.WARNING)
-            try:
-                interval = 24
-                config_path = os.path.join(app.root_path, '..', 'backup_config.json')
-                if os.path.exists(config_path):
-                    with open(config_path, 'r') as f:
-                        conf = json.load(f)
-                        interval = int(conf.get('backup_interval_hours', 24))
-
-                if not scheduler.get_job('auto_backup_job'):
-                    scheduler.add_job(
-                        id='auto_backup_job',
-                        func=run_scheduled_backup,
-                        trigger='interval',
-                        hours=interval
-                    )
-            except Exception:
-                pass
-#______________________________________________________________
-    return app
+    # 数据库健康快照：后台定时刷新，db_health 页面只读缓存
+    from .health_snapshot import init_health_snapshot
+    init_health_snapshot(app, scheduler)
 
+    # 自动备份：间隔取自 backup_config.json
+    from .backup_service import init_backup_schedule
+    init_backup_schedule(app, scheduler)
@@ -3,6 +3,7 @@ from flask_login import current_user, login_required
 from sqlalchemy import text
 from . import db
 from .models import Music, User, Room
+from .health_snapshot import health_cache
 import json
 import io
 from datetime import datetime
@@ -52,25 +53,16 @@ def db_health():
             return redirect(url_for('admin.db_health'))
 
         try:
-            # 1. 获取索引详情
-            indexes = db.session.execute(text(f"SHOW INDEX FROM {target_table}")).mappings().all()
-
-            # 2. 获取外键详情 (额外查询 KEY_COLUMN_USAGE 表)
-            fk_sql = text("""
-                SELECT CONSTRAINT_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
-                FROM information_schema.KEY_COLUMN_USAGE
-                WHERE TABLE_SCHEMA = DATABASE() 
-                  AND TABLE_NAME = :t 
-                  AND REFERENCED_TABLE_NAME IS NOT NULL
-            """)
-            fks = db.session.execute(fk_sql, {"t": target_table}).mappings().all()
+            # 索引与外键信息按表缓存，?refresh=1 时强制重新查询
+            detail = health_cache.get_table_detail(target_table, force=request.args.get('refresh') == '1')
 
             return render_template("admin/dba_module.html",
                                    active_page='health',
                                    detail_mode=True,
                                    table_name=target_table,
-                                   indexes=indexes,
-                                   fks=fks,
+                                   indexes=detail["indexes"],
+                                   fks=detail["fks"],
+                                   snapshot_time=detail["updated_at"],
                                    title=f"表详情: {target_table}",
                                    subtitle="索引结构与完整性约束明细",
                                    icon="ri-table-line")
@@ -87,7 +79,8 @@ def db_health():
                 'room': '存储房间信息、在线状态及播放进度',
                 'musics': '存储音乐元数据、文件路径及审核状态',
                 'room_member': '记录当前房间内的在线成员关联',
-                'room_message': '存储所有房间的历史聊天弹幕',
+                'room_message': '旧版聊天弹幕表 (仅保留历史数据)',
+                'room_chat_event': '只追加的房间聊天事件，按房间聚簇存储',
                 'listen_record': '记录用户的听歌历史流水',
                 'room_participation_record': '记录用户的房间访问足迹',
                 'room_playlist': '存储各房间当前的排队播放列表',
@@ -97,41 +90,18 @@ def db_health():
                 'v_room_stats': '统计视图：计算房间实时热度和在线人数'
             }
 
-            # [修复] 修正后的 SQL 查询 (增加了 TABLE_TYPE)
-            sql = """
-            SELECT 
-                T.TABLE_NAME,
-                T.TABLE_TYPE,  -- [新增] 关键字段：区分 BASE TABLE 或 VIEW
-                T.TABLE_ROWS,
-                T.DATA_LENGTH,
-                -- 统计索引个数 (去重索引名)
-                (SELECT COUNT(DISTINCT INDEX_NAME) 
-                 FROM information_schema.STATISTICS S 
-                 WHERE S.TABLE_NAME = T.TABLE_NAME 
-                   AND S.TABLE_SCHEMA = DATABASE()) as index_count,
-                -- 统计主键个数 (实体完整性)
-                (SELECT COUNT(*) 
-                 FROM information_schema.TABLE_CONSTRAINTS C 
-                 WHERE C.TABLE_NAME = T.TABLE_NAME 
-                   AND C.TABLE_SCHEMA = DATABASE() 
-                   AND C.CONSTRAINT_TYPE = 'PRIMARY KEY') as pk_count,
-                -- 统计外键个数 (参照完整性)
-                (SELECT COUNT(*) 
-                 FROM information_schema.TABLE_CONSTRAINTS C 
-                 WHERE C.TABLE_NAME = T.TABLE_NAME 
-                   AND C.TABLE_SCHEMA = DATABASE() 
-                   AND C.CONSTRAINT_TYPE = 'FOREIGN KEY') as fk_count
-            FROM information_schema.TABLES T
-            WHERE T.TABLE_SCHEMA = DATABASE();
-            """
-
-            tables_stats = db.session.execute(text(sql)).mappings().all()
+            # 概览读取后台刷新的快照，不在请求内扫描 information_schema
+            snapshot = health_cache.get_overview()
+            if snapshot["error"]:
+                flash(f"最近一次快照刷新失败: {snapshot['error']}", "error")
 
             return render_template("admin/dba_module.html",
                                    active_page='health',
                                    detail_mode=False,
-                                   tables=tables_stats,
+                                   tables=snapshot["tables"],
                                    table_desc=table_desc,  # 传递描述字典
+                                   snapshot_time=snapshot["updated_at"],
+                                   snapshot_refreshing=health_cache.is_refreshing(),
                                    title="数据库健康全景",
                                    subtitle="核心表索引、实体完整性与参照完整性概览",
                                    icon="ri-heart-pulse-line")
@@ -146,6 +116,69 @@ def db_health():
                                    icon="ri-error-warning-line")
 
 
+@admin_bp.route("/db-health/refresh", methods=["POST"])
+@login_required
+def refresh_db_health():
+    """手动刷新健康快照 (后台执行，页面稍后刷新即可看到新数据)"""
+    _admin_required()
+    if health_cache.refresh_overview_async():
+        flash("已开始刷新健康快照，请稍后刷新页面查看", "success")
+    else:
+        flash("健康快照正在刷新中", "info")
+    return redirect(url_for('admin.db_health'))
+
+
+@admin_bp.route("/db-profiler")
+@login_required
+def db_profiler():
+    """SQL 剖析页面：按语句指纹汇总的耗时统计"""
+    _admin_required()
+    from .sql_profiler import sql_profiler
+
+    order_by = request.args.get('order', 'total_ms')
+    if order_by not in ('total_ms', 'count', 'p99_ms', 'avg_ms', 'rows'):
+        order_by = 'total_ms'
+
+    return render_template("admin/dba_module.html",
+                           active_page='profiler',
+                           statements=sql_profiler.top(limit=50, order_by=order_by),
+                           order_by=order_by,
+                           profiler_enabled=sql_profiler.enabled,
+                           profiler_since=sql_profiler.started_at.strftime("%Y-%m-%d %H:%M:%S"),
+                           title="SQL 性能剖析",
+                           subtitle="按语句指纹统计执行次数、耗时分布与来源路由",
+                           icon="ri-speed-up-line")
+
+
+@admin_bp.route("/db-profiler/explain", methods=["POST"])
+@login_required
+def db_profiler_explain():
+    """对某个语句指纹的样例执行 EXPLAIN (AJAX)"""
+    _admin_required()
+    from .sql_profiler import sql_profiler
+
+    data = request.get_json(silent=True) or {}
+    try:
+        plan = sql_profiler.explain(data.get('bind'), data.get('id'))
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"EXPLAIN 失败: {e}"}), 500
+
+    if plan is None:
+        return jsonify({"status": "error", "message": "该语句没有可用于 EXPLAIN 的样例 (仅支持 SELECT)"}), 404
+    columns, rows = plan
+    return jsonify({"status": "success", "data": {"columns": columns, "rows": rows}})
+
+
+@admin_bp.route("/db-profiler/reset", methods=["POST"])
+@login_required
+def db_profiler_reset():
+    _admin_required()
+    from .sql_profiler import sql_profiler
+    sql_profiler.reset()
+    flash("SQL 剖析统计已清空", "success")
+    return redirect(url_for('admin.db_profiler'))
+
+
 @admin_bp.route("/db-automation")
 @login_required
 def db_automation():
@@ -191,40 +224,42 @@ def db_backup():
 
 
 
-# --- [模块：自动化] 1. 执行存储过程 (AJAX版) ---
+# --- [模块：自动化] 1. 执行每日维护 (AJAX版，后台分批执行) ---
 @admin_bp.route("/maintenance/exec", methods=["POST"])
 @login_required
 def exec_maintenance():
     _admin_required()
-    try:
-        # [修改后 - 正确写法] 切换到 vs_admin 特权连接执行
-        # 1. 获取管理员引擎
-        admin_engine = db.get_engine(bind='admin_db')
+    from .maintenance_service import get_maintenance_job, start_maintenance
 
-        # 2. 使用原生连接执行
-        with admin_engine.connect() as conn:
-            # 开启事务（虽然存储过程内部可能有逻辑，但最好在调用层也明确）
-            trans = conn.begin()
-            try:
-                conn.execute(text("CALL sp_daily_maintenance()"))
-                trans.commit()
-            except Exception as e:
-                trans.rollback()
-                raise e
+    # 维护任务在后台线程中分批执行 (vs_admin 特权连接)，这里只负责启动并立即返回任务状态
+    started = start_maintenance()
+    return jsonify({
+        "status": "accepted" if started else "running",
+        "message": "维护任务已启动" if started else "已有维护任务正在执行",
+        "job": get_maintenance_job(),
+    }), 202
 
-        # [修改] 不再用 flash+redirect，而是返回 JSON
-        return jsonify({
-            "status": "success",
-            "message": "每日维护存储过程执行成功！\n已清理 1 天前的过期记录与僵尸房间。"
-        })
-    except Exception as e:
-        # 注意：这里不需要 db.session.rollback()，因为我们用的是 admin_engine 的 conn
-        print(f"执行维护脚本失败: {e}")
-        return jsonify({
-            "status": "error",
-            "message": f"执行失败: {str(e)}"
-        }), 500
 
+# --- [模块：自动化] 1.0 查询维护任务进度 (AJAX 轮询) ---
+@admin_bp.route("/maintenance/status")
+@login_required
+def maintenance_status():
+    _admin_required()
+    from .maintenance_service import get_maintenance_job
+
+    job = get_maintenance_job()
+    if job is None:
+        return jsonify({"status": "idle", "job": None})
+    return jsonify({"status": job["status"], "job": job})
+
+
+# --- [模块：自动化] 1.1 写后缓冲运行指标 (AJAX) ---
+@admin_bp.route("/write-behind/stats")
+@login_required
+def write_behind_stats():
+    _admin_required()
+    from .write_behind import write_buffer
+    return jsonify({"status": "success", "data": write_buffer.stats()})
 
 
 # --- [模块：自动化] 2. 查看审计日志 ---
@@ -318,7 +353,7 @@ def backup_db():
         # 定义需要备份的所有表名
         tables = [
             'user', 'musics', 'room',
-            'room_member', 'room_playlist', 'room_message',
+            'room_member', 'room_playlist', 'room_message', 'room_chat_event',
             'listen_record', 'room_participation_record',
             'system_audit_log'  # 关键：这个表只有 admin 能看
         ]
@@ -379,7 +414,7 @@ def restore_db():
 
         # 3. 定义恢复顺序 (与备份时一致即可，因为我们会关闭外键检查)
         tables = [
-            'room_participation_record', 'listen_record', 'room_message',
+            'room_participation_record', 'listen_record', 'room_message', 'room_chat_event',
             'room_playlist', 'room_member', 'system_audit_log',
             'room', 'musics', 'user'
         ]
@@ -398,16 +433,21 @@ def restore_db():
 
         # --- [核心修改] 原生 SQL 操作 ---
         with admin_engine.connect() as conn:
+            # SQLite (测试库) 没有 TRUNCATE 与 FOREIGN_KEY_CHECKS，外键默认不强制，改用 DELETE
+            is_mysql = conn.dialect.name == "mysql"
+            clear_sql = "TRUNCATE TABLE {}" if is_mysql else "DELETE FROM {}"
+
             # 开启事务 (ACID 特性)
             trans = conn.begin()
             try:
                 # A. 关闭外键约束检查 (否则无法随意清空表)
-                conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+                if is_mysql:
+                    conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
 
                 # B. 清空旧数据 (使用 TRUNCATE，比 DELETE 更彻底，需要高权限)
                 for t in tables:
                     # 使用原生 SQL 执行
-                    conn.execute(text(f"TRUNCATE TABLE {t}"))
+                    conn.execute(text(clear_sql.format(t)))
 
                 # C. 插入新数据
                 for t in tables:
@@ -416,7 +456,7 @@ def restore_db():
                     # 原因：前面恢复 room_member 时，触发器(trg_room_join_audit)自动写入了新日志，
                     # 导致表里产生了 ID=1,2... 的数据。如果不清空，会和备份文件里的 ID 冲突。
                     if t == 'system_audit_log':
-                        conn.execute(text("TRUNCATE TABLE system_audit_log"))
+                        conn.execute(text(clear_sql.format("system_audit_log")))
                     # ========================================================================
 
                     rows = data.get(t, [])
@@ -435,17 +475,24 @@ def restore_db():
                     conn.execute(sql, rows)
 
                 # D. 恢复外键约束检查
-                conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+                if is_mysql:
+                    conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
 
                 # E. 提交事务
                 trans.commit()
 
+                # F. 数据已整体替换，通知所有进程清空聊天环形缓冲，并清空健康快照
+                from .room_events import ALL_ROOMS, room_events
+                room_events.publish(ALL_ROOMS, "room", {"action": "reset"})
+                health_cache.clear()
+
             except Exception as db_err:
                 # 发生错误回滚事务
                 trans.rollback()
                 # 尝试恢复外键检查（防止连接池复用时影响后续）
                 try:
-                    conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+                    if is_mysql:
+                        conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
                 except:
                     pass
                 raise db_err
@@ -495,6 +542,10 @@ def reject_music(music_id):
 @login_required
 def get_security_grants():
     _admin_required()
+    if db.engine.dialect.name != "mysql":
+        # SQLite (测试库) 没有账号与授权体系
+        note = [f"{db.engine.dialect.name} 不支持 SHOW GRANTS (测试库无账号权限体系)"]
+        return jsonify({"status": "success", "data": {"normal": note, "admin": note}})
     try:
         # 1. 获取【普通通道】的权限 (vs_normal)
         # 使用默认的 db.session 执行
@@ -556,12 +607,14 @@ def update_backup_config_new():
 
         # 2. 更新调度 [核心修改点]
         # 不要直接调用 scheduler.reschedule_job，而是先获取 job 对象
-        job = scheduler.get_job('auto_backup_job')
+        job = scheduler.get_job('auto_backup_job') if scheduler.running else None
         if job:
             # 调用 Job 对象自带的 reschedule 方法
             job.reschedule(trigger='interval', hours=hours)
-
-        flash(f"设置已保存：每 {hours} 小时自动备份一次", "success")
+            flash(f"设置已保存：每 {hours} 小时自动备份一次", "success")
+        else:
+            # 调度器运行在其他进程 (APP_ROLES 未含 scheduler)：由其每分钟读取配置文件生效
+            flash(f"设置已保存：每 {hours} 小时自动备份一次 (1 分钟内由调度进程生效)", "success")
     except Exception as e:
         flash(f"保存失败: {str(e)}", "error")
 
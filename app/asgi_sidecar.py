@@ -0,0 +1,521 @@
+# app/asgi_sidecar.py
+# ==============================================================================
+# 模块名称：房间轮询 ASGI 服务
+# 描述：把房间页的热点接口从 Flask 线程模型中拆出，由 asyncio 单线程事件循环承载：
+#         - GET /rooms/<code>/state   与 Flask 路由 routes.room_state 返回完全一致 (room_state.py)
+#         - GET /rooms/<code>/events  SSE 推送通道：房间状态变化时推送完整状态，空闲时发心跳
+#         - GET /healthz
+#       连接数不再受线程数限制，一个长连接只占一个协程与一个 socket。
+#       与 Flask 应用共用 app.models 中的表定义、数据库与登录 session (同一个 SECRET_KEY 签名的 cookie)，
+#       数据库使用异步驱动 (MySQL: aiomysql，SQLite: aiosqlite)。
+#       推送：每个房间在本进程内只有一个后台任务按 ROOM_PUSH_POLL_SECONDS 查询一次「版本行」，
+#       有变化时才查询完整状态并广播给该房间的全部订阅者，数据库压力与在线人数无关。
+#       ROOM_EVENT_BUS=database 时改为读取 room_event (整个进程一条增量查询)，有事件的房间才检查版本行，
+#       版本行轮询降为 ROOM_PUSH_FALLBACK_SECONDS 一次的兜底。
+#       HTML 页面与所有写接口仍由 Flask 提供；部署方式见 asgi.py 与 README。
+# ==============================================================================
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs, unquote
+
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import make_url
+from werkzeug.http import parse_cookie
+from werkzeug.utils import import_string
+
+from .chat_store import _to_payload
+from .playback_state import PlaybackView
+from .playlist_store import can_send_delta
+from .models import Music, Room, RoomChatEvent, RoomMember, RoomPlaylist
+from .room_events import ALL_ROOMS, GAP_EVENTS_QUERY, POLL_EVENTS_SQL, EventCursor
+from .room_state import playback_timing, room_state_payload
+from .state_encoding import encode_state
+from .track_prefetch import NEXT_TRACK_SQL, track_prefetcher
+
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+JSON_HEADERS = [(b"content-type", b"application/json; charset=utf-8"), (b"cache-control", b"no-store")]
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-store"),
+    (b"x-accel-buffering", b"no"),  # 关闭 nginx 的响应缓冲，事件才能立即送达
+]
+
+
+def async_database_url(url):
+    """把 Flask 使用的同步连接串换成对应的异步驱动。"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    if driver is None:
+        raise ValueError(f"ASGI 服务不支持的数据库驱动: {url.drivername}")
+    return url.set(drivername=driver)
+
+
+def _sidecar_database_url(config):
+    """ASGI_DATABASE_URL > 只读副本 > 主库。"""
+    binds = config.get("SQLALCHEMY_BINDS") or {}
+    replica = binds.get("replica_db")
+    if isinstance(replica, dict):
+        replica = replica.get("url")
+    return config.get("ASGI_DATABASE_URL") or replica or config["SQLALCHEMY_DATABASE_URI"]
+
+
+# ==============================================================================
+# 查询
+# ==============================================================================
+_room_table = Room.__table__
+_member_table = RoomMember.__table__
+_chat_table = RoomChatEvent.__table__
+_playlist_table = RoomPlaylist.__table__
+_music_table = Music.__table__
+
+ROOM_COLUMNS = [
+    _room_table.c.id, _room_table.c.owner_id, _room_table.c.is_active,
+    _room_table.c.playback_status, _room_table.c.current_track_name, _room_table.c.current_track_file,
+    _room_table.c.current_position, _room_table.c.position_at, _room_table.c.updated_at,
+    _room_table.c.playlist_version, _room_table.c.playlist_floor,
+]
+
+
+def _version_query(room_id):
+    """房间「版本行」：任一字段变化即说明需要重新推送 (单条语句，走主键/room_id 索引)。"""
+    return select(
+        _room_table.c.updated_at,
+        _room_table.c.position_at,  # updated_at 只精确到秒，同一秒内的多次操作靠锚点时间区分
+        _room_table.c.is_active,
+        select(func.max(_chat_table.c.id)).where(_chat_table.c.room_id == room_id).scalar_subquery(),
+        select(func.count()).select_from(_member_table).where(_member_table.c.room_id == room_id).scalar_subquery(),
+        _room_table.c.playlist_version,  # 歌单每次变更都会 +1
+    ).where(_room_table.c.id == room_id)
+
+
+class RoomStateReader:
+    """用异步引擎读取房间状态。"""
+
+    def __init__(self, engine, chat_limit):
+        self.engine = engine
+        self.chat_limit = chat_limit
+
+    async def find_room(self, code):
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(select(*ROOM_COLUMNS).where(_room_table.c.code == code))).first()
+        return row
+
+    async def max_event_id(self):
+        async with self.engine.connect() as conn:
+            return (await conn.execute(text("SELECT MAX(id) FROM room_event"))).scalar() or 0
+
+    async def events_after(self, floor, batch):
+        async with self.engine.connect() as conn:
+            return (await conn.execute(text(POLL_EVENTS_SQL), {"floor": floor, "batch": batch})).all()
+
+    async def events_in(self, ids):
+        async with self.engine.connect() as conn:
+            return (await conn.execute(GAP_EVENTS_QUERY, {"ids": ids})).all()
+
+    async def version(self, room_id):
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(_version_query(room_id))).first()
+        return tuple(row) if row is not None else None
+
+    async def state(self, room_id, playback=None, playlist_since=None):
+        """返回 (room 行, 状态 dict)；房间已删除时返回 (None, None)。
+
+        playback 为 playback 事件中的播放状态：Flask 进程的防抖层可能还没写回 room 表，比表中新时以它为准。
+        playlist_since 为客户端已有的歌单版本，可以增量返回时只查询之后变化的条目 (推送通道总是发送完整歌单)。
+        """
+        async with self.engine.connect() as conn:
+            room = (await conn.execute(select(*ROOM_COLUMNS).where(_room_table.c.id == room_id))).first()
+            if room is None:
+                return None, None
+            member_count = (await conn.execute(
+                select(func.count()).select_from(_member_table).where(_member_table.c.room_id == room_id)
+            )).scalar() + 1  # 房主 + 成员
+            chat_rows = (await conn.execute(
+                select(
+                    _chat_table.c.id, _chat_table.c.user_id, _chat_table.c.author_name,
+                    _chat_table.c.author_avatar, _chat_table.c.content, _chat_table.c.created_at,
+                ).where(_chat_table.c.room_id == room_id)
+                .order_by(_chat_table.c.id.desc()).limit(self.chat_limit)
+            )).mappings().all()
+            playlist_delta = can_send_delta(room, playlist_since)
+            playlist_query = (
+                select(
+                    _playlist_table.c.id, _music_table.c.id.label("music_id"), _music_table.c.title,
+                    _playlist_table.c.position,
+                )
+                .join(_music_table, _music_table.c.id == _playlist_table.c.music_id)
+                .where(_playlist_table.c.room_id == room_id)
+                .order_by(_playlist_table.c.position.asc(), _playlist_table.c.id.asc())
+            )
+            if playlist_delta:
+                playlist_query = playlist_query.where(_playlist_table.c.version > playlist_since)
+            playlist_rows = (await conn.execute(playlist_query)).mappings().all()
+
+            if playback and (playback.get("position_at") or 0) > (room.position_at or 0):
+                room = PlaybackView(room, playback)
+            # 下一首：与 Flask 进程共用缓存逻辑，未命中时在同一连接上查询
+            next_track = None
+            if track_prefetcher.enabled and room.current_track_file:
+                hit, next_track = track_prefetcher.cached(room)
+                if not hit:
+                    row = (await conn.execute(
+                        text(NEXT_TRACK_SQL), {"room_id": room_id, "current_file": room.current_track_file}
+                    )).first()
+                    next_track = track_prefetcher.store(room, row)
+
+        messages = [_to_payload(row) for row in reversed(chat_rows)]
+        playlist = [dict(row) for row in playlist_rows]
+        return room, room_state_payload(
+            room, member_count, messages, playlist, playlist_delta, track_prefetcher.hint(next_track)
+        )
+
+
+def _access_error(room, user_id):
+    """与 Flask 路由一致：房间不存在 404，已关闭且不是房主 403。"""
+    if room is None:
+        return 404
+    if not room.is_active and room.owner_id != user_id:
+        return 403
+    return None
+
+
+# ==============================================================================
+# 推送
+# ==============================================================================
+class RoomHub:
+    """本进程内的房间订阅表：每个房间一个轮询任务，状态变化时广播给全部订阅者。"""
+
+    def __init__(self, reader, poll_seconds):
+        self.reader = reader
+        self.poll_seconds = poll_seconds
+        self._subscribers = {}  # room_id -> set(asyncio.Queue)
+        self._watchers = {}     # room_id -> asyncio.Task
+        self._latest = {}       # room_id -> (room 行, 状态)
+        self._wakeups = {}      # room_id -> asyncio.Event (收到房间事件时置位)
+        self._playback = {}     # room_id -> playback 事件中的最新播放状态 (尚未写回 room 表时使用)
+        self._tail = None
+        self.events_received = 0
+
+    def subscribe(self, room_id):
+        # 队列长度为 1：慢客户端只拿最新状态，旧状态直接丢弃
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(room_id, set()).add(queue)
+        if room_id in self._latest:
+            self._offer(queue, self._latest[room_id])
+        if room_id not in self._watchers:
+            self._wakeups[room_id] = asyncio.Event()
+            self._watchers[room_id] = asyncio.create_task(self._watch(room_id))
+        return queue
+
+    def unsubscribe(self, room_id, queue):
+        subscribers = self._subscribers.get(room_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+
+    @staticmethod
+    def _offer(queue, item):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(item)
+
+    def _broadcast(self, room_id, item):
+        self._latest[room_id] = item
+        for queue in list(self._subscribers.get(room_id, ())):
+            self._offer(queue, item)
+
+    async def _watch(self, room_id):
+        last_version = None
+        try:
+            while self._subscribers.get(room_id):
+                try:
+                    version = await self.reader.version(room_id)
+                    if version is None:
+                        self._broadcast(room_id, (None, None))
+                        break
+                    playback = self._playback.get(room_id)
+                    version += (playback.get("position_at") if playback else None,)
+                    if version != last_version:
+                        self._broadcast(room_id, await self.reader.state(room_id, playback))
+                        last_version = version
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # 数据库暂时不可用：保持连接，下个周期重试
+                    print(f"[ASGI] room {room_id} poll failed: {e}")
+                await self._wait(room_id)
+        finally:
+            self._watchers.pop(room_id, None)
+            self._wakeups.pop(room_id, None)
+            self._playback.pop(room_id, None)
+            self._latest.pop(room_id, None)
+            self._subscribers.pop(room_id, None)
+
+    def playback_overlay(self, room_id):
+        return self._playback.get(room_id)
+
+    async def _wait(self, room_id):
+        """等到下一次检查：有房间事件时立即返回，否则等待轮询间隔。"""
+        wakeup = self._wakeups.get(room_id)
+        try:
+            await asyncio.wait_for(wakeup.wait(), self.poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+
+    def start_event_tail(self, poll_seconds, fallback_seconds, gap_seconds, batch_size):
+        """改由 room_event 驱动：版本行轮询间隔放宽到 fallback_seconds。"""
+        self.poll_seconds = fallback_seconds
+        self._tail = asyncio.create_task(self._tail_events(poll_seconds, gap_seconds, batch_size))
+
+    async def _tail_events(self, poll_seconds, gap_seconds, batch_size):
+        cursor = None
+        while True:
+            try:
+                if cursor is None:
+                    cursor = EventCursor(await self.reader.max_event_id(), gap_seconds)
+                for ids in cursor.pending(batch_size):
+                    self._receive(cursor.accept(await self.reader.events_in(ids)))
+                while True:
+                    rows = await self.reader.events_after(cursor.floor(), batch_size)
+                    fresh = cursor.accept(rows)
+                    self._receive(fresh)
+                    if len(rows) < batch_size or not fresh:
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ASGI] room_event poll failed: {e}")
+            await asyncio.sleep(poll_seconds)
+
+    def _receive(self, rows):
+        for row in rows:
+            self.events_received += 1
+            room_id = row[1]
+            if row[2] == "playback" and room_id in self._wakeups and row[4]:
+                self._playback[room_id] = json.loads(row[4])
+            targets = list(self._wakeups) if room_id == ALL_ROOMS else [room_id]
+            for target in targets:
+                if target in self._wakeups:
+                    self._wakeups[target].set()
+
+    async def close(self):
+        if self._tail is not None:
+            self._tail.cancel()
+        for task in list(self._watchers.values()):
+            task.cancel()
+        await asyncio.gather(*self._watchers.values(), return_exceptions=True)
+
+    def stats(self):
+        return {
+            "rooms": len(self._watchers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "events_received": self.events_received,
+        }
+
+
+# ==============================================================================
+# ASGI 应用
+# ==============================================================================
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({"type": "http.response.start", "status": status, "headers": JSON_HEADERS})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+class RoomSidecar:
+    """最小 ASGI 应用 (不依赖 Web 框架)，由 uvicorn 等 ASGI 服务器加载。"""
+
+    def __init__(self, config):
+        self.config = config
+        self.engine = None
+        self.hub = None
+        # 借用 Flask 的 session 序列化器校验 cookie 签名，与 Flask 进程共用登录状态
+        signer_app = Flask(__name__)
+        signer_app.config.update(config)
+        self._session_cookie = signer_app.config["SESSION_COOKIE_NAME"]
+        self._session_max_age = int(signer_app.permanent_session_lifetime.total_seconds())
+        self._serializer = SecureCookieSessionInterface().get_signing_serializer(signer_app)
+        # 下一首预取：与 Flask 进程使用相同的预取窗口，本机有音乐文件时同样预热页缓存
+        track_prefetcher.configure(config)
+
+    # ---- 生命周期 ----
+    async def startup(self):
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        url = async_database_url(_sidecar_database_url(self.config))
+        options = {}
+        if url.get_backend_name() == "mysql":
+            connect_args = (self.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}).get("connect_args") or {}
+            options = {
+                "connect_args": connect_args,
+                "pool_size": self.config.get("ASGI_DB_POOL_SIZE", 10),
+                "max_overflow": self.config.get("ASGI_DB_MAX_OVERFLOW", 10),
+                "pool_recycle": 280,
+            }
+        self.engine = create_async_engine(url, **options)
+        reader = RoomStateReader(self.engine, self.config.get("CHAT_RING_SIZE", 50))
+        self.hub = RoomHub(reader, self.config.get("ROOM_PUSH_POLL_SECONDS", 1.0))
+        if self.config.get("ROOM_EVENT_BUS") == "database":
+            self.hub.start_event_tail(
+                self.config.get("ROOM_EVENT_POLL_SECONDS", 0.5),
+                self.config.get("ROOM_PUSH_FALLBACK_SECONDS", 10),
+                self.config.get("ROOM_EVENT_GAP_SECONDS", 5.0),
+                self.config.get("ROOM_EVENT_BATCH_SIZE", 500),
+            )
+        print(f"[ASGI] Room sidecar ready ({url.drivername})")
+
+    async def shutdown(self):
+        if self.hub is not None:
+            await self.hub.close()
+        if self.engine is not None:
+            await self.engine.dispose()
+
+    # ---- 登录状态 ----
+    def current_user_id(self, scope):
+        """从 Flask session cookie 中取出 Flask-Login 的 _user_id，未登录返回 None。"""
+        for name, value in scope.get("headers", ()):
+            if name == b"cookie":
+                cookie = parse_cookie(value.decode("latin-1")).get(self._session_cookie)
+                if not cookie or self._serializer is None:
+                    return None
+                try:
+                    data = self._serializer.loads(cookie, max_age=self._session_max_age)
+                    return int(data["_user_id"])
+                except Exception:
+                    return None
+        return None
+
+    # ---- 路由 ----
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = unquote(scope["path"]).rstrip("/")
+        parts = path.split("/")
+        if path == "/healthz":
+            await _send_json(send, 200, {"status": "ok", **(self.hub.stats() if self.hub else {})})
+            return
+        if scope["method"] != "GET" or len(parts) != 4 or parts[1] != "rooms" or parts[3] not in ("state", "events"):
+            await _send_json(send, 404, {"status": "error", "message": "Not Found"})
+            return
+
+        user_id = self.current_user_id(scope)
+        if user_id is None:
+            await _send_json(send, 401, {"status": "error", "message": "请先登录"})
+            return
+
+        room = await self.hub.reader.find_room(parts[2])
+        status = _access_error(room, user_id)
+        if status is not None:
+            await _send_json(send, status, {"status": "error", "message": "房间不存在或已关闭"})
+            return
+
+        if parts[3] == "state":
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            since = query.get("playlist_since", [""])[0]
+            _, state = await self.hub.reader.state(
+                room.id, self.hub.playback_overlay(room.id), int(since) if since.isdigit() else None
+            )
+            if state is None:
+                await _send_json(send, 404, {"status": "error", "message": "房间不存在或已关闭"})
+                return
+            request_headers = dict(scope.get("headers", ()))
+            body, headers = encode_state(
+                state,
+                request_headers.get(b"accept", b"").decode("latin-1"),
+                request_headers.get(b"accept-encoding", b"").decode("latin-1"),
+                self.config,
+            )
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+            })
+            await send({"type": "http.response.body", "body": body})
+        else:
+            await self._stream_events(room.id, user_id, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _stream_events(self, room_id, user_id, receive, send):
+        """SSE：event: state 推送完整状态；event: gone 表示房间已删除 (404) 或已关闭 (403)。"""
+        heartbeat = self.config.get("ROOM_PUSH_HEARTBEAT_SECONDS", 15)
+        await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+        # 客户端断线后按 retry 毫秒重连
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+
+        queue = self.hub.subscribe(room_id)
+        disconnected = asyncio.create_task(_wait_disconnect(receive))
+        try:
+            while True:
+                getter = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait(
+                    {getter, disconnected}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected in done:
+                    getter.cancel()
+                    return
+                if getter not in done:
+                    getter.cancel()
+                    chunk = f": ping {int(time.time())}\n\n".encode("utf-8")
+                else:
+                    room, state = getter.result()
+                    status = _access_error(room, user_id)
+                    if status is not None:
+                        await send({"type": "http.response.body", "body": _sse_event("gone", {"status": status}),
+                                    "more_body": False})
+                        return
+                    # 缓存的状态可能是几秒前查询的，按发送时刻重新生成 server_time 与进度
+                    chunk = _sse_event("state", {**state, **playback_timing(room)})
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        except OSError:
+            # 客户端已断开，写入失败
+            return
+        finally:
+            disconnected.cancel()
+            self.hub.unsubscribe(room_id, queue)
+
+
+def create_asgi_app(config_object="config.Config"):
+    """ASGI 应用工厂；config_object 与 create_app 相同 (导入路径或配置类)。"""
+    if isinstance(config_object, str):
+        config_object = import_string(config_object)
+    config = {key: getattr(config_object, key) for key in dir(config_object) if key.isupper()}
+    return RoomSidecar(config)
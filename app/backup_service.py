@@ -12,7 +12,7 @@ def execute_save_backup():
     # 1. 定义要备份的表
     tables = [
         'user', 'musics', 'room',
-        'room_member', 'room_playlist', 'room_message',
+        'room_member', 'room_playlist', 'room_message', 'room_chat_event',
         'listen_record', 'room_participation_record',
         'system_audit_log'
     ]
@@ -51,4 +51,48 @@ def execute_save_backup():
         print(f"[AutoBackup] Success: {filepath}")
 
     except Exception as e:
-        print(f"[AutoBackup] Failed: {e}")
\ No newline at end of file
+        print(f"[AutoBackup] Failed: {e}")
+
+def read_backup_interval(app):
+    """读取 backup_config.json 中的自动备份间隔 (小时)，缺省 24。"""
+    try:
+        config_path = os.path.join(app.root_path, '..', 'backup_config.json')
+        if os.path.exists(config_path):
+            with open(config_path, 'r') as f:
+                return int(json.load(f).get('backup_interval_hours', 24))
+    except Exception:
+        pass
+    return 24
+
+
+def init_backup_schedule(app, scheduler):
+    """注册自动备份任务 (只在 scheduler 角色的进程中调用)。
+
+    管理后台可能运行在没有调度器的进程里，修改配置只会写 backup_config.json，
+    这里每分钟检查一次文件中的间隔，有变化时重新调度。
+    """
+    def run_scheduled_backup():
+        with app.app_context():
+            execute_save_backup()
+
+    def sync_backup_interval():
+        job = scheduler.get_job('auto_backup_job')
+        hours = read_backup_interval(app)
+        if job and job.trigger.interval.total_seconds() != hours * 3600:
+            job.reschedule(trigger='interval', hours=hours)
+            print(f"[AutoBackup] Rescheduled: every {hours}h")
+
+    if not scheduler.get_job('auto_backup_job'):
+        scheduler.add_job(
+            id='auto_backup_job',
+            func=run_scheduled_backup,
+            trigger='interval',
+            hours=read_backup_interval(app)
+        )
+    if not scheduler.get_job('backup_config_sync_job'):
+        scheduler.add_job(
+            id='backup_config_sync_job',
+            func=sync_backup_interval,
+            trigger='interval',
+            seconds=60
+        )
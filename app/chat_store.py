@@ -0,0 +1,160 @@
+# app/chat_store.py
+# ==============================================================================
+# 模块名称：房间聊天事件存储
+# 描述：聊天与进出房间提示写入只追加的 room_chat_event 表 (按 (room_id, id) 聚簇)，
+#       作者昵称/头像在写入时冗余保存；每个房间最近 N 条消息同时保存在进程内环形缓冲中，
+#       房间轮询与进房渲染直接读缓冲，不再访问数据库。
+#       缓冲经房间事件总线 (room_events.py) 更新，多 worker 部署时各进程的缓冲保持一致。
+# ==============================================================================
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import text
+
+from . import db
+from .db_routing import primary_reads
+from .dialect import select_sql
+
+KIND_CHAT = 0
+KIND_SYSTEM = 1  # 进入/离开房间等系统提示
+
+MAX_CONTENT_LENGTH = 500
+
+
+class ChatRingBuffer:
+    """按房间保存最近 N 条消息的环形缓冲，房间数量按 LRU 淘汰。"""
+
+    def __init__(self, size=50, max_rooms=1000):
+        self.size = size
+        self.max_rooms = max_rooms
+        self._rooms = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, room_id):
+        with self._lock:
+            ring = self._rooms.get(room_id)
+            if ring is None:
+                return None
+            self._rooms.move_to_end(room_id)
+            return list(ring)
+
+    def load(self, room_id, messages):
+        with self._lock:
+            self._rooms[room_id] = deque(messages, maxlen=self.size)
+            self._rooms.move_to_end(room_id)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+
+    def append(self, room_id, message):
+        with self._lock:
+            ring = self._rooms.get(room_id)
+            # 未加载的房间不建半截缓冲，下次读取时从数据库完整加载
+            if ring is None:
+                return
+            # 缓冲可能刚从数据库加载过这条消息；并发提交也可能乱序到达
+            if any(m["id"] == message["id"] for m in ring):
+                return
+            ring.append(message)
+            if len(ring) > 1 and ring[-2]["id"] > message["id"]:
+                ordered = sorted(ring, key=lambda m: m["id"])
+                ring.clear()
+                ring.extend(ordered)
+
+    def drop(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+
+ring_buffer = ChatRingBuffer()
+
+
+def init_chat_store(app):
+    from .room_events import room_events
+
+    ring_buffer.size = app.config.get("CHAT_RING_SIZE", 50)
+    ring_buffer.max_rooms = app.config.get("CHAT_RING_MAX_ROOMS", 1000)
+    room_events.subscribe(_on_room_event, kinds=("message", "membership", "room"))
+
+
+def _to_payload(row):
+    """数据库行 -> 前端消息格式 (与 room_state 返回的字段一致)。"""
+    return {
+        "id": row["id"],
+        "author_id": row["user_id"],
+        "author_name": row["author_name"],
+        "author_avatar": row["author_avatar"],
+        "created_at": (row["created_at"] + timedelta(hours=8)).strftime('%H:%M'),
+        "content": row["content"],
+    }
+
+
+def append_message(room_id, user, content, kind=KIND_CHAT):
+    """写入一条消息 (单条 INSERT，不提交事务)，返回前端格式；提交后再发布 message 事件。"""
+    now = datetime.utcnow()
+    row = {
+        "room_id": room_id,
+        "user_id": user.id,
+        "author_name": user.nickname or user.username,
+        "author_avatar": user.avatar_url,
+        "kind": kind,
+        "content": content[:MAX_CONTENT_LENGTH],
+        "created_at": now,
+    }
+    result = db.session.execute(text("""
+        INSERT INTO room_chat_event (room_id, user_id, author_name, author_avatar, kind, content, created_at)
+        VALUES (:room_id, :user_id, :author_name, :author_avatar, :kind, :content, :created_at)
+    """), row)
+    row["id"] = result.lastrowid
+    return _to_payload(row)
+
+
+def _on_room_event(event):
+    """房间事件 (由 room_events 分发到每个进程)：新消息进入本进程的环形缓冲，房间删除/数据恢复时清空。"""
+    from .room_events import ALL_ROOMS
+
+    data = event["data"] or {}
+    if event["kind"] == "message":
+        ring_buffer.append(event["room_id"], data)
+    elif event["kind"] == "membership" and data.get("message"):
+        ring_buffer.append(event["room_id"], data["message"])
+    elif event["kind"] == "room" and data.get("action") in ("delete", "reset"):
+        if event["room_id"] == ALL_ROOMS:
+            ring_buffer.clear()
+        else:
+            ring_buffer.drop(event["room_id"])
+
+
+def recent_messages(room_id):
+    """返回房间最近 N 条消息 (旧 -> 新)，缓冲未命中时按主键倒序加载一次。
+
+    加载总是读主库：缓冲之后只靠 message 事件追加，若从有延迟的副本加载，
+    已提交但尚未同步到副本的消息会永久缺失 (事件已先于加载到达并被忽略)。
+    """
+    cached = ring_buffer.get(room_id)
+    if cached is not None:
+        return cached
+
+    limit = current_app.config.get("CHAT_RING_SIZE", 50)
+    with primary_reads():
+        rows = db.session.execute(select_sql("""
+            SELECT id, user_id, author_name, author_avatar, content, created_at
+            FROM room_chat_event
+            WHERE room_id = :rid
+            ORDER BY id DESC
+            LIMIT :limit
+        """), {"rid": room_id, "limit": limit}).mappings().all()
+    messages = [_to_payload(row) for row in reversed(rows)]
+    ring_buffer.load(room_id, messages)
+    return messages
+
+
+def delete_room_messages(room_id):
+    """删除房间全部消息 (不提交事务) 并清空缓冲。"""
+    db.session.execute(text("DELETE FROM room_chat_event WHERE room_id = :rid"), {"rid": room_id})
+    ring_buffer.drop(room_id)
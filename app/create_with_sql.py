@@ -1,16 +1,99 @@
+from datetime import date, timedelta
+
+from flask import current_app
 from sqlalchemy import text
 
+# 只追加的历史表 -> 分区时间列
+HISTORY_TABLES = {
+    "listen_record": "played_at",
+    "room_participation_record": "participated_at",
+    "room_message": "created_at",
+    "room_chat_event": "created_at",
+    "system_audit_log": "action_time",
+}
 
-# 定义所有表的创建语句
-def init_db_with_raw_sql(db):
-    # MySQL 建表语句
-    # 变化点：
-    # 1. AUTOINCREMENT -> AUTO_INCREMENT
-    # 2. INTEGER -> INT
-    # 3. 必须指定 ENGINE=InnoDB 以支持外键
-    # 4. 外键约束语法调整
-
-    sql_statements = [
+# 主键不是单独 id 的历史表 (分区改造时需保留原主键列顺序)
+HISTORY_TABLE_KEYS = {
+    "room_chat_event": ("room_id", "id"),
+}
+
+
+def build_history_partition_ddl(table, column, today, days_ahead, key_columns=("id",)):
+    """生成把历史表改造为按天 RANGE 分区的 DDL。
+
+    MySQL 分区表要求分区列出现在每个唯一键 (含主键) 中，且不支持外键，
+    因此先去掉外键、把主键改为 (id, 时间列)，再按 TO_DAYS(时间列) 分区。
+    外键名由调用方从 information_schema 查出后单独删除。
+    key_columns 为原主键列，分区列追加在其后。
+    """
+    partitions = [f"PARTITION p_past VALUES LESS THAN (TO_DAYS('{today.isoformat()}'))"]
+    for offset in range(days_ahead + 1):
+        day = today + timedelta(days=offset)
+        upper = day + timedelta(days=1)
+        partitions.append(
+            f"PARTITION p{day.strftime('%Y%m%d')} VALUES LESS THAN (TO_DAYS('{upper.isoformat()}'))"
+        )
+    partitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+    partition_sql = ",\n            ".join(partitions)
+
+    return [
+        f"UPDATE {table} SET {column} = CURRENT_TIMESTAMP WHERE {column} IS NULL",
+        f"""
+        ALTER TABLE {table}
+            MODIFY {column} DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY ({", ".join(key_columns)}, {column})
+        """,
+        f"""
+        ALTER TABLE {table}
+        PARTITION BY RANGE (TO_DAYS({column})) (
+            {partition_sql}
+        )
+        """,
+    ]
+
+
+def ensure_history_partitions(connection, days_ahead):
+    """对尚未分区的历史表执行一次性分区改造，已分区的表直接跳过。
+
+    离线迁移 (只由 `flask migrate-schema` 执行)：会重建整张表，并删除表上所有外键，
+    room_message / listen_record / room_participation_record 不再随 user、room 级联删除，
+    删除用户或房间时需由应用显式清理这些表 (见 routes.delete_room 与 README)。
+    """
+    today = date.today()
+    for table, column in HISTORY_TABLES.items():
+        partitioned = connection.execute(text("""
+            SELECT COUNT(*) FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL
+        """), {"t": table}).scalar()
+        if partitioned:
+            continue
+
+        fk_names = connection.execute(text("""
+            SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND CONSTRAINT_TYPE = 'FOREIGN KEY'
+        """), {"t": table}).scalars().all()
+        for fk in fk_names:
+            connection.execute(text(f"ALTER TABLE {table} DROP FOREIGN KEY {fk}"))
+
+        key_columns = HISTORY_TABLE_KEYS.get(table, ("id",))
+        for sql in build_history_partition_ddl(table, column, today, days_ahead, key_columns):
+            connection.execute(text(sql))
+        print(f"提示: 历史表 {table} 已按 {column} 改造为日分区")
+
+
+# MySQL 建表语句
+# 变化点 (相对早期的 SQLite 版本)：
+# 1. AUTOINCREMENT -> AUTO_INCREMENT
+# 2. INTEGER -> INT
+# 3. 必须指定 ENGINE=InnoDB 以支持外键
+# 4. 外键约束语法调整
+def build_mysql_schema_statements():
+    """基线 schema：表、视图、索引与审计触发器 (迁移 0001_baseline)。
+
+    早于 schema_migrations 的旧库上重复执行是安全的：对象已存在的错误会被跳过。
+    """
+    return [
         # 1. 用户表 (User)
         """
         CREATE TABLE IF NOT EXISTS user (
@@ -88,6 +171,42 @@ def init_db_with_raw_sql(db):
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """,
 
+        # 5.1 房间聊天事件表 (RoomChatEvent)
+        # 只追加：无 updated_at、无外键；主键 (room_id, id) 使同一房间的消息物理相邻，
+        # 作者昵称与头像在写入时冗余保存，读取无需再关联 user 表
+        """
+        CREATE TABLE IF NOT EXISTS room_chat_event (
+            room_id INT NOT NULL,
+            id BIGINT NOT NULL AUTO_INCREMENT,
+            user_id INT NOT NULL,
+            author_name VARCHAR(32) NOT NULL,
+            author_avatar VARCHAR(256),
+            kind TINYINT NOT NULL DEFAULT 0,
+            content VARCHAR(500) NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (room_id, id),
+            KEY idx_chat_event_id (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """,
+
+        # 5.2 旧消息迁移：仅在新表为空时把 room_message 的历史消息搬过来 (保留原 ID)
+        """
+        INSERT INTO room_chat_event (room_id, id, user_id, author_name, author_avatar, kind, content, created_at)
+        SELECT
+            m.room_id,
+            m.id,
+            m.user_id,
+            COALESCE(u.nickname, u.username),
+            CASE WHEN u.avatar_path IS NULL THEN 'https://placehold.co/80x80?text=VS'
+                 ELSE CONCAT('/static/uploads/avatars/', u.avatar_path) END,
+            CASE WHEN m.content IN ('进入了房间', '离开了房间') THEN 1 ELSE 0 END,
+            LEFT(m.content, 500),
+            COALESCE(m.created_at, CURRENT_TIMESTAMP)
+        FROM room_message m
+        JOIN user u ON u.id = m.user_id
+        WHERE NOT EXISTS (SELECT 1 FROM room_chat_event);
+        """,
+
         # 6. 房间成员表 (RoomMember)
         """
         CREATE TABLE IF NOT EXISTS room_member (
@@ -95,12 +214,18 @@ def init_db_with_raw_sql(db):
             room_id INT NOT NULL,
             user_id INT NOT NULL,
             joined_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             UNIQUE KEY uniq_room_member (room_id, user_id),
             FOREIGN KEY(room_id) REFERENCES room(id) ON DELETE CASCADE,
             FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """,
 
+        # 6.1 旧库补列：访问会话时间 (重复执行时报 1060，跳过)
+        """
+        ALTER TABLE room_member ADD COLUMN last_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP;
+        """,
+
         # 7. 听歌记录表 (ListenRecord)
         """
         CREATE TABLE IF NOT EXISTS listen_record (
@@ -198,6 +323,21 @@ def init_db_with_raw_sql(db):
         CREATE INDEX idx_user_username ON user(username);
         """,
 
+        # 4.全文索引 (ngram 分词，支持中文子串检索)
+        # 关闭停用词：ngram 会丢弃包含停用词 (如 "a") 的所有分词，英文歌名会大量漏检
+        """
+        SET SESSION innodb_ft_enable_stopword = OFF;
+        """,
+        """
+        CREATE FULLTEXT INDEX ft_music_title ON musics(title) WITH PARSER ngram;
+        """,
+        """
+        CREATE FULLTEXT INDEX ft_user_nickname ON user(nickname) WITH PARSER ngram;
+        """,
+        """
+        CREATE FULLTEXT INDEX ft_user_username ON user(username) WITH PARSER ngram;
+        """,
+
         # 存储过程与触发器 (自动化与审计)
         # 1. 创建审计日志表
         """
@@ -211,28 +351,7 @@ def init_db_with_raw_sql(db):
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         """,
 
-        # 2. 定义存储过程: 每日维护 (sp_daily_maintenance)
-        # [修改点] 将 30 DAY 改为了 1 DAY
-        """
-        DROP PROCEDURE IF EXISTS sp_daily_maintenance;
-        """,
-
-        """
-        CREATE PROCEDURE sp_daily_maintenance()
-        BEGIN
-            -- 1. 清理过期听歌记录 (保留最近 1 天)
-            DELETE FROM listen_record 
-            WHERE played_at < DATE_SUB(NOW(), INTERVAL 1 DAY);
-
-            -- 2. 自动关闭“僵尸”房间 (超过 7 天没有更新的活跃房间)
-            UPDATE room 
-            SET is_active = 0, playback_status = 'paused'
-            WHERE is_active = 1 
-              AND updated_at < DATE_SUB(NOW(), INTERVAL 7 DAY);
-        END;
-        """,
-
-        # 3. 定义触发器: 房间成员审计 (trg_room_join_audit)
+        # 4. 定义触发器: 房间成员审计 (trg_room_join_audit)
         # 功能：每当有人加入房间，自动在审计表中记录
         """
         CREATE TRIGGER trg_room_join_audit 
@@ -252,40 +371,268 @@ def init_db_with_raw_sql(db):
     ]
 
 
-    from sqlalchemy import text
-    # [新增] 导入 SQL 执行时的运行错误异常
-    from sqlalchemy.exc import OperationalError
+def build_mysql_room_event_statements():
+    """房间事件表 (迁移 0003_room_event)：多进程部署时的事件总线，只保留最近一段时间 (见 room_events.py)。"""
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS room_event (
+            id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            room_id INT NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            origin VARCHAR(96) NOT NULL,
+            payload TEXT,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_room_event_created (created_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """,
+    ]
+
+
+def build_mysql_room_position_statements():
+    """播放锚点时间 (迁移 0004_room_position_at)：DATETIME 只有秒级精度，锚点另存为 DOUBLE Unix 秒。"""
+    return [
+        """
+        ALTER TABLE room ADD COLUMN position_at DOUBLE NULL AFTER current_position;
+        """,
+    ]
+
+
+def build_mysql_playlist_order_statements():
+    """歌单顺序与版本 (迁移 0005_playlist_order)：position 排序键、行版本，房间歌单版本号与增量下限。
+    旧数据按 id (即加入顺序) 编号。"""
+    return [
+        """
+        ALTER TABLE room_playlist
+            ADD COLUMN position DOUBLE NOT NULL DEFAULT 0 AFTER music_id,
+            ADD COLUMN version INT NOT NULL DEFAULT 0 AFTER position;
+        """,
+        """
+        UPDATE room_playlist SET position = id * 1024;
+        """,
+        """
+        ALTER TABLE room_playlist ADD KEY idx_room_playlist_position (room_id, position);
+        """,
+        """
+        ALTER TABLE room
+            ADD COLUMN playlist_version INT NOT NULL DEFAULT 0 AFTER position_at,
+            ADD COLUMN playlist_floor INT NOT NULL DEFAULT 0 AFTER playlist_version;
+        """,
+    ]
+
+
+def build_mysql_maintenance_job_statements():
+    """维护任务记录 (迁移 0007_maintenance_job)：多个 admin worker 共享任务进度。
+    running_slot 在任务执行期间为 1、结束后置 NULL，唯一索引保证同一时刻只有一个任务在执行。"""
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS maintenance_job (
+            id VARCHAR(32) NOT NULL PRIMARY KEY,
+            status VARCHAR(16) NOT NULL,
+            running_slot TINYINT NULL,
+            current_step VARCHAR(64),
+            steps TEXT,
+            message VARCHAR(255),
+            started_at DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL,
+            finished_at DATETIME NULL,
+            UNIQUE KEY uniq_maintenance_running (running_slot),
+            KEY idx_maintenance_started (started_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """,
+    ]
+
+
+def build_mysql_health_snapshot_statements():
+    """数据库健康概览快照 (迁移 0008_db_health_snapshot)：调度器写入，所有 worker 读取。
+    只保存最新一份 (id 固定为 1)。"""
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS db_health_snapshot (
+            id TINYINT NOT NULL PRIMARY KEY,
+            tables_json MEDIUMTEXT NOT NULL,
+            error VARCHAR(500) NULL,
+            duration_ms DOUBLE NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """,
+    ]
+
+
+def build_mysql_listen_song_name_statements():
+    """听歌流水歌名检索表 (迁移 0006_listen_song_name)。
+
+    listen_record 是分区表，MySQL 不支持在分区表上建 FULLTEXT 索引。这里把出现过的歌名去重后
+    存入一张不分区的小表并建 ngram 全文索引，由触发器在 listen_record 插入时同步维护
+    (写后缓冲、数据恢复、压测数据生成等所有写入路径都会经过)，再按 idx_listen_song 等值回查流水。
+    只增不删：歌名对应的流水过期后，残留的歌名只会在子查询中多匹配一个值，不影响结果。
+    """
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS listen_song_name (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            song_name VARCHAR(255) NOT NULL,
+            UNIQUE KEY uniq_listen_song_name (song_name)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        """,
+        # 与 ft_music_title 相同：关闭停用词后再建 ngram 全文索引
+        """
+        SET SESSION innodb_ft_enable_stopword = OFF;
+        """,
+        """
+        CREATE FULLTEXT INDEX ft_listen_song_name ON listen_song_name(song_name) WITH PARSER ngram;
+        """,
+        """
+        DROP TRIGGER IF EXISTS trg_listen_song_name;
+        """,
+        """
+        CREATE TRIGGER trg_listen_song_name
+        AFTER INSERT ON listen_record
+        FOR EACH ROW
+        BEGIN
+            INSERT IGNORE INTO listen_song_name (song_name) VALUES (NEW.song_name);
+        END;
+        """,
+        # 回填已有流水中的歌名
+        """
+        INSERT IGNORE INTO listen_song_name (song_name)
+        SELECT DISTINCT song_name FROM listen_record WHERE song_name IS NOT NULL;
+        """,
+    ]
+
+
+def build_mysql_procedure_statements(config):
+    """维护存储过程。保留天数与批大小写在过程体内，配置变化后由迁移校验和触发重建。"""
+    retention = config["HISTORY_RETENTION_DAYS"]
+    days_ahead = config["HISTORY_PARTITION_DAYS_AHEAD"]
+    batch_size = config["MAINTENANCE_BATCH_SIZE"]
+
+    return [
+        # 2. 定义存储过程: 历史数据清理 (sp_purge_history)
+        # 已分区的表：整块 DROP 过期日分区 (只改元数据)，并预建未来日分区；
+        # 尚未分区的旧表：退化为按时间 DELETE ... LIMIT p_batch 循环，每批提交一次。
+        """
+        DROP PROCEDURE IF EXISTS sp_purge_history;
+        """,
+
+        """
+        CREATE PROCEDURE sp_purge_history(
+            IN p_table VARCHAR(64),
+            IN p_column VARCHAR(64),
+            IN p_keep_days INT,
+            IN p_days_ahead INT,
+            IN p_batch INT
+        )
+        BEGIN
+            DECLARE v_parts INT DEFAULT 0;
+            DECLARE v_rows INT DEFAULT 0;
+            DECLARE v_expired TEXT;
+            DECLARE v_max INT;
+            DECLARE v_target INT;
+
+            SELECT COUNT(*) INTO v_parts
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME = p_table
+              AND PARTITION_NAME IS NOT NULL;
+
+            IF v_parts = 0 THEN
+                SET @purge_sql = CONCAT('DELETE FROM ', p_table, ' WHERE ', p_column,
+                                        ' < DATE_SUB(NOW(), INTERVAL ', p_keep_days, ' DAY)',
+                                        ' LIMIT ', p_batch);
+                PREPARE purge_stmt FROM @purge_sql;
+                REPEAT
+                    EXECUTE purge_stmt;
+                    SET v_rows = ROW_COUNT();
+                    COMMIT;
+                UNTIL v_rows < p_batch END REPEAT;
+                DEALLOCATE PREPARE purge_stmt;
+            ELSE
+                -- 1. 删除整体早于保留期的分区
+                SELECT GROUP_CONCAT(PARTITION_NAME) INTO v_expired
+                FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = p_table
+                  AND PARTITION_DESCRIPTION <> 'MAXVALUE'
+                  AND CAST(PARTITION_DESCRIPTION AS SIGNED) <= TO_DAYS(CURDATE()) - p_keep_days;
+
+                IF v_expired IS NOT NULL THEN
+                    SET @purge_sql = CONCAT('ALTER TABLE ', p_table, ' DROP PARTITION ', v_expired);
+                    PREPARE purge_stmt FROM @purge_sql;
+                    EXECUTE purge_stmt;
+                    DEALLOCATE PREPARE purge_stmt;
+                END IF;
+
+                -- 2. 从 p_future 中拆出未来 N 天的日分区
+                SELECT MAX(CAST(PARTITION_DESCRIPTION AS SIGNED)) INTO v_max
+                FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = p_table
+                  AND PARTITION_DESCRIPTION <> 'MAXVALUE';
+
+                IF v_max IS NULL THEN
+                    SET v_max = TO_DAYS(CURDATE());
+                END IF;
+                SET v_target = TO_DAYS(CURDATE()) + p_days_ahead + 1;
+
+                WHILE v_max < v_target DO
+                    SET @purge_sql = CONCAT(
+                        'ALTER TABLE ', p_table, ' REORGANIZE PARTITION p_future INTO (',
+                        'PARTITION p', REPLACE(FROM_DAYS(v_max), '-', ''),
+                        ' VALUES LESS THAN (', v_max + 1, '), ',
+                        'PARTITION p_future VALUES LESS THAN MAXVALUE)');
+                    PREPARE purge_stmt FROM @purge_sql;
+                    EXECUTE purge_stmt;
+                    DEALLOCATE PREPARE purge_stmt;
+                    SET v_max = v_max + 1;
+                END WHILE;
+            END IF;
+        END;
+        """,
 
-    # ... (上面的 sql_statements 列表定义保持不变) ...
+        # 3. 定义存储过程: 每日维护 (sp_daily_maintenance)
+        # 保留天数取自 config.HISTORY_RETENTION_DAYS，听歌记录与 main.records 的 30 天窗口保持一致
+        """
+        DROP PROCEDURE IF EXISTS sp_daily_maintenance;
+        """,
 
-    # ... (前面的 sql_statements 列表定义保持不变)
+        # 每一步都是有上限的小批次并逐批提交，避免一个大事务长期持有行锁
+        f"""
+        CREATE PROCEDURE sp_daily_maintenance()
+        BEGIN
+            DECLARE v_rows INT DEFAULT 0;
 
-    from sqlalchemy import text
-    from sqlalchemy.exc import OperationalError
+            -- 1. 清理过期历史数据 (按分区整体删除)
+            CALL sp_purge_history('listen_record', 'played_at', {retention['listen_record']}, {days_ahead}, {batch_size});
+            CALL sp_purge_history('room_participation_record', 'participated_at', {retention['room_participation_record']}, {days_ahead}, {batch_size});
+            CALL sp_purge_history('room_message', 'created_at', {retention['room_message']}, {days_ahead}, {batch_size});
+            CALL sp_purge_history('room_chat_event', 'created_at', {retention['room_chat_event']}, {days_ahead}, {batch_size});
+            CALL sp_purge_history('system_audit_log', 'action_time', {retention['system_audit_log']}, {days_ahead}, {batch_size});
+
+            -- 2. 自动关闭“僵尸”房间 (超过 7 天没有更新的活跃房间)
+            REPEAT
+                UPDATE room 
+                SET is_active = 0, playback_status = 'paused'
+                WHERE is_active = 1 
+                  AND updated_at < DATE_SUB(NOW(), INTERVAL 7 DAY)
+                LIMIT {batch_size};
+                SET v_rows = ROW_COUNT();
+                COMMIT;
+            UNTIL v_rows < {batch_size} END REPEAT;
+        END;
+        """,
+
+    ]
+
+
+def init_db_with_raw_sql(db):
+    """启动时的 schema 检查：一次版本查询，只执行尚未应用的迁移 (见 schema_migrations.py)。"""
+    from .schema_migrations import migrate_schema
 
     try:
         # [核心修改] 显式获取 'admin_db' (即 vs_admin) 的引擎来执行建表
         # 注意：这里 bind='admin_db' 必须与 config.py 中 SQLALCHEMY_BINDS 的键名一致
         admin_engine = db.get_engine(bind='admin_db')
-
-        # 使用管理员引擎建立连接
-        with admin_engine.connect() as connection:
-            for sql in sql_statements:
-                try:
-                    connection.execute(text(sql))
-                except OperationalError as e:
-                    # 错误码 1061: Duplicate key name (索引已存在)
-                    # 错误码 1050: Table already exists (表已存在)
-                    # 错误码 1304: PROCEDURE already exists (存储过程已存在)
-                    # 错误码 1359: TRIGGER already exists (触发器已存在)
-                    if e.orig.args[0] in (1061, 1050, 1304, 1359):
-                        print(f"提示: 对象已存在，跳过 -> {str(e.orig.args)}")
-                    else:
-                        print(f"执行 SQL 出错: {sql[:50]}...")
-                        raise e
-
-            connection.commit()
-        print("数据库表、索引及自动化脚本校验完成 (Success)。")
+        migrate_schema(admin_engine, current_app.config)
     except Exception as e:
         print(f"初始化过程发生未处理错误: {e}")
-        print("建议检查: 1. config.py 是否配置了 SQLALCHEMY_BINDS; 2. .env 中 DATABASE_URL_ADMIN 是否正确。")
\ No newline at end of file
+        print("建议检查: 1. config.py 是否配置了 SQLALCHEMY_BINDS; 2. .env 中 DATABASE_URL_ADMIN 是否正确。")
@@ -0,0 +1,327 @@
+# app/create_with_sqlite.py
+# ==============================================================================
+# 模块名称：SQLite 建表脚本
+# 描述：create_with_sql.py 中 MySQL 建表脚本的 SQLite 等价版本，供 config.TestConfig、
+#       单元/性能回归测试与 benchmarks 在没有 MySQL 的机器上运行完整应用。
+#       差异说明：
+#         - AUTO_INCREMENT / ENGINE=InnoDB -> INTEGER PRIMARY KEY AUTOINCREMENT
+#         - ON UPDATE CURRENT_TIMESTAMP -> AFTER UPDATE 触发器补写 updated_at
+#         - room_chat_event 的 (room_id, id) 聚簇主键 -> 自增 id + (room_id, id) 索引
+#         - 不建 FULLTEXT 索引 (search.py 在 SQLite 下退回 LIKE)、不做分区
+#         - 没有存储过程，每日维护由 maintenance_service 在应用层分批执行
+#       由 schema_migrations.py 作为 SQLite 的基线迁移执行。
+# ==============================================================================
+
+# 含 updated_at 的表：MySQL 用 ON UPDATE CURRENT_TIMESTAMP，SQLite 用触发器模拟
+TOUCH_TABLES = ("user", "musics", "room", "room_playlist", "room_message")
+
+SQLITE_STATEMENTS = [
+    # 1. 用户表 (User)
+    """
+    CREATE TABLE IF NOT EXISTS user (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username VARCHAR(64) NOT NULL UNIQUE,
+        password_hash VARCHAR(256) NOT NULL,
+        is_admin BOOLEAN DEFAULT 0,
+        nickname VARCHAR(32) DEFAULT '新用户',
+        avatar_path VARCHAR(256),
+        notification_message VARCHAR(256),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+
+    # 2. 音乐表 (Music)
+    """
+    CREATE TABLE IF NOT EXISTS musics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title VARCHAR(128) NOT NULL,
+        original_filename VARCHAR(255) NOT NULL,
+        stored_filename VARCHAR(255) NOT NULL,
+        status VARCHAR(32) DEFAULT 'pending',
+        rejection_reason VARCHAR(255),
+        uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
+    )
+    """,
+
+    # 3. 房间表 (Room)
+    """
+    CREATE TABLE IF NOT EXISTS room (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        owner_id INTEGER NOT NULL,
+        name VARCHAR(64) NOT NULL,
+        code VARCHAR(6) NOT NULL UNIQUE,
+        is_active BOOLEAN DEFAULT 1,
+        playback_status VARCHAR(16) DEFAULT 'paused',
+        current_track_name VARCHAR(255),
+        current_track_file VARCHAR(255),
+        current_position FLOAT DEFAULT 0.0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(owner_id) REFERENCES user(id) ON DELETE CASCADE
+    )
+    """,
+
+    # 4. 房间播放列表 (RoomPlaylist)
+    """
+    CREATE TABLE IF NOT EXISTS room_playlist (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id INTEGER NOT NULL,
+        music_id INTEGER NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(room_id) REFERENCES room(id) ON DELETE CASCADE,
+        FOREIGN KEY(music_id) REFERENCES musics(id) ON DELETE CASCADE
+    )
+    """,
+
+    # 5. 旧版房间消息表 (RoomMessage)
+    """
+    CREATE TABLE IF NOT EXISTS room_message (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(room_id) REFERENCES room(id) ON DELETE CASCADE,
+        FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
+    )
+    """,
+
+    # 5.1 房间聊天事件表 (RoomChatEvent)：SQLite 不支持复合主键自增，用 (room_id, id) 索引代替聚簇
+    """
+    CREATE TABLE IF NOT EXISTS room_chat_event (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        author_name VARCHAR(32) NOT NULL,
+        author_avatar VARCHAR(256),
+        kind SMALLINT NOT NULL DEFAULT 0,
+        content VARCHAR(500) NOT NULL,
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_chat_event_room ON room_chat_event(room_id, id)
+    """,
+
+    # 6. 房间成员表 (RoomMember)
+    """
+    CREATE TABLE IF NOT EXISTS room_member (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        joined_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT uniq_room_member UNIQUE (room_id, user_id),
+        FOREIGN KEY(room_id) REFERENCES room(id) ON DELETE CASCADE,
+        FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
+    )
+    """,
+
+    # 7. 听歌记录表 (ListenRecord)
+    """
+    CREATE TABLE IF NOT EXISTS listen_record (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        song_name VARCHAR(255) NOT NULL,
+        played_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
+    )
+    """,
+
+    # 8. 房间参与记录表 (RoomParticipationRecord)
+    """
+    CREATE TABLE IF NOT EXISTS room_participation_record (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        room_code VARCHAR(6) NOT NULL,
+        participated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES user(id) ON DELETE CASCADE
+    )
+    """,
+
+    # 9. 审计日志表
+    """
+    CREATE TABLE IF NOT EXISTS system_audit_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        action_type VARCHAR(32) NOT NULL,
+        table_name VARCHAR(64) NOT NULL,
+        record_id INTEGER,
+        details TEXT,
+        action_time DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+
+    # 视图 (与 MySQL 定义一致)
+    """
+    CREATE VIEW IF NOT EXISTS v_music_full_info AS
+    SELECT
+        m.id AS music_id,
+        m.title,
+        m.original_filename,
+        m.status,
+        m.uploaded_at,
+        m.rejection_reason,
+        u.id AS uploader_id,
+        u.username AS uploader_name,
+        u.nickname AS uploader_nickname
+    FROM musics m
+    JOIN user u ON m.user_id = u.id
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS v_room_stats AS
+    SELECT
+        r.id AS room_id,
+        r.code,
+        r.name,
+        r.is_active,
+        r.owner_id,
+        (SELECT nickname FROM user WHERE id = r.owner_id) AS owner_name,
+        COUNT(rm.user_id) + 1 AS member_count
+    FROM room r
+    LEFT JOIN room_member rm ON r.id = rm.room_id
+    GROUP BY r.id, r.code, r.name, r.is_active, r.owner_id
+    """,
+
+    # 索引 (与 MySQL 的 B-tree 索引一致，FULLTEXT 索引除外)
+    "CREATE INDEX IF NOT EXISTS idx_music_title ON musics(title)",
+    "CREATE INDEX IF NOT EXISTS idx_music_status ON musics(status)",
+    "CREATE INDEX IF NOT EXISTS idx_music_uploaded_at ON musics(uploaded_at)",
+    "CREATE INDEX IF NOT EXISTS idx_user_nickname ON user(nickname)",
+    "CREATE INDEX IF NOT EXISTS idx_room_name ON room(name)",
+    "CREATE INDEX IF NOT EXISTS idx_room_code ON room(code)",
+    "CREATE INDEX IF NOT EXISTS idx_room_active ON room(is_active)",
+    "CREATE INDEX IF NOT EXISTS idx_listen_song ON listen_record(song_name)",
+    "CREATE INDEX IF NOT EXISTS idx_listen_time ON listen_record(played_at)",
+    "CREATE INDEX IF NOT EXISTS idx_user_username ON user(username)",
+
+    # 触发器：房间成员审计 (trg_room_join_audit)
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_room_join_audit
+    AFTER INSERT ON room_member
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO system_audit_log (action_type, table_name, record_id, details, action_time)
+        VALUES (
+            'JOIN',
+            'room',
+            NEW.room_id,
+            'User (ID: ' || NEW.user_id || ') joined the room.',
+            CURRENT_TIMESTAMP
+        );
+    END
+    """,
+]
+
+
+def _touch_trigger(table):
+    """UPDATE 未显式修改 updated_at 时补写当前时间 (等价于 ON UPDATE CURRENT_TIMESTAMP)。"""
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{table}_touch
+    AFTER UPDATE ON {table}
+    FOR EACH ROW
+    WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN
+        UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+    END
+    """
+
+
+def build_sqlite_room_event_statements():
+    """房间事件表 (迁移 0002_room_event)。"""
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS room_event (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            room_id INTEGER NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            origin VARCHAR(96) NOT NULL,
+            payload TEXT,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_room_event_created ON room_event(created_at)
+        """,
+    ]
+
+
+def build_sqlite_room_position_statements():
+    """播放锚点时间 (迁移 0003_room_position_at)。"""
+    return [
+        """
+        ALTER TABLE room ADD COLUMN position_at REAL
+        """,
+    ]
+
+
+def build_sqlite_playlist_order_statements():
+    """歌单顺序与版本 (迁移 0004_playlist_order)。"""
+    return [
+        """
+        ALTER TABLE room_playlist ADD COLUMN position REAL NOT NULL DEFAULT 0
+        """,
+        """
+        ALTER TABLE room_playlist ADD COLUMN version INTEGER NOT NULL DEFAULT 0
+        """,
+        """
+        UPDATE room_playlist SET position = id * 1024
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_room_playlist_position ON room_playlist(room_id, position)
+        """,
+        """
+        ALTER TABLE room ADD COLUMN playlist_version INTEGER NOT NULL DEFAULT 0
+        """,
+        """
+        ALTER TABLE room ADD COLUMN playlist_floor INTEGER NOT NULL DEFAULT 0
+        """,
+    ]
+
+
+def build_sqlite_maintenance_job_statements():
+    """维护任务记录 (迁移 0005_maintenance_job)。"""
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS maintenance_job (
+            id VARCHAR(32) NOT NULL PRIMARY KEY,
+            status VARCHAR(16) NOT NULL,
+            running_slot INTEGER NULL UNIQUE,
+            current_step VARCHAR(64),
+            steps TEXT,
+            message VARCHAR(255),
+            started_at DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL,
+            finished_at DATETIME NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_maintenance_started ON maintenance_job(started_at)
+        """,
+    ]
+
+
+def build_sqlite_health_snapshot_statements():
+    """数据库健康概览快照 (迁移 0006_db_health_snapshot)。"""
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS db_health_snapshot (
+            id INTEGER NOT NULL PRIMARY KEY,
+            tables_json TEXT NOT NULL,
+            error VARCHAR(500) NULL,
+            duration_ms REAL NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL
+        )
+        """,
+    ]
+
+
+def build_sqlite_schema_statements():
+    """SQLite 基线 schema (迁移 0001_baseline，全部语句幂等)。"""
+    return SQLITE_STATEMENTS + [_touch_trigger(t) for t in TOUCH_TABLES]
@@ -4,10 +4,27 @@
 # 描述：基于数据库视图 (View) 和原生 SQL 的高级数据检索接口
 # ==============================================================================
 
-from flask import Blueprint, render_template, request  # [新增] 导入 request
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+
+from flask import (  # [新增] 导入 request
+    Blueprint,
+    Response,
+    current_app,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
 from sqlalchemy import text
 from flask_login import login_required, current_user
 from app import db
+from app.db_routing import read_engine, replica_reads
+from app.dialect import select_sql
+from app.search import song_name_condition, text_search_condition
 
 db_views_bp = Blueprint("db_views", __name__, url_prefix="/data-center")
 
@@ -28,288 +45,505 @@ def admin_query_center():
 
 
 # ------------------------------------------------------------------------------
-# 2. 全局音乐视图查询 (升级版 Pro Max：多维度搜索 + 动态排序)
+# 分页工具：游标 (Keyset) 分页，不做 COUNT(*)
 # ------------------------------------------------------------------------------
-@db_views_bp.route("/music-list")
-@login_required
-def admin_music_view_query():
-    _admin_required()
+# 思路：按 "排序字段 + ID 倒序" 的组合键翻页，下一页条件为 "排在上一页最后一行之后"，
+#      每次只取 page_size + 1 行即可判断是否还有下一页，深翻页成本与首页相同。
+
+def _encode_cursor(spec, row):
+    values = []
+    for key in (spec['sort_key'], spec['tiebreak_key']):
+        value = row[key]
+        if isinstance(value, datetime):
+            value = {'__dt__': value.isoformat()}
+        values.append(value)
+    payload = {'s': spec['sort_by'], 'o': spec['sort_order'], 'v': values}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def _decode_cursor(spec, token):
+    """解析游标；格式非法或与当前排序不一致时返回 None (回到第一页)。"""
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        if payload['s'] != spec['sort_by'] or payload['o'] != spec['sort_order']:
+            return None
+        values = []
+        for value in payload['v']:
+            if isinstance(value, dict) and '__dt__' in value:
+                value = datetime.fromisoformat(value['__dt__'])
+            values.append(value)
+        return values
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _keyset_condition(spec, last_sort, last_tie, params):
+    """生成 "排在游标之后" 的 WHERE 条件 (二级排序固定为 ID 倒序，兼容 NULL 值)。"""
+    sort_sql = spec['sort_field']
+    tie_sql = spec['tiebreak_sql']
+    asc = spec['direction'] == 'ASC'
+    params['ks_tie'] = last_tie
+
+    if sort_sql == tie_sql:
+        return f"{tie_sql} {'>' if asc else '<'} :ks_tie"
+
+    tie_cond = f"{tie_sql} < :ks_tie"
+    # MySQL 中 NULL 在升序时排最前、降序时排最后
+    if last_sort is None:
+        if asc:
+            return f"(({sort_sql} IS NULL AND {tie_cond}) OR {sort_sql} IS NOT NULL)"
+        return f"({sort_sql} IS NULL AND {tie_cond})"
+
+    params['ks_sort'] = last_sort
+    op = '>' if asc else '<'
+    cond = f"({sort_sql} {op} :ks_sort OR ({sort_sql} = :ks_sort AND {tie_cond})"
+    if not asc:
+        cond += f" OR {sort_sql} IS NULL"
+    return cond + ")"
+
+
+def _select_list(spec):
+    """只查询勾选列所需的字段，外加排序字段与 ID (游标需要)。"""
+    column_map = spec['column_map']
+    exprs = []
+    keys = list(spec['selected_cols'])
+    if spec['sort_by'] not in keys:
+        keys.append(spec['sort_by'])
+    for key in keys:
+        for expr in column_map[key]['select']:
+            if expr not in exprs:
+                exprs.append(expr)
+    if spec['tiebreak_select'] not in exprs:
+        exprs.append(spec['tiebreak_select'])
+    return ", ".join(exprs)
+
+
+def _order_by(spec):
+    order_sql = f" ORDER BY {spec['sort_field']} {spec['direction']}"
+    # 二级排序：ID倒序 (保证分页/排序稳定性)
+    if spec['sort_field'] != spec['tiebreak_sql']:
+        order_sql += f", {spec['tiebreak_sql']} DESC"
+    return order_sql
+
+
+def _build_sql(spec, extra_where=None):
+    where = list(spec['where']) + (extra_where or [])
+    sql = f"SELECT {_select_list(spec)} FROM {spec['from_sql']}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + _order_by(spec)
+
+
+def _fetch_page(spec, cursor_token):
+    """按游标取一页数据，返回 (rows, next_cursor)。"""
+    page_size = current_app.config['DATA_CENTER_PAGE_SIZE']
+    params = dict(spec['params'])
+    extra_where = []
+
+    cursor_values = _decode_cursor(spec, cursor_token)
+    if cursor_values:
+        extra_where.append(_keyset_condition(spec, cursor_values[0], cursor_values[1], params))
+
+    params['page_limit'] = page_size + 1
+    sql = _build_sql(spec, extra_where) + " LIMIT :page_limit"
+    # 数据中心只读查询：配置了只读副本时走副本
+    with replica_reads():
+        datetime_params = [name for name, value in params.items() if isinstance(value, datetime)]
+        rows = db.session.execute(select_sql(sql, datetime_params), params).mappings().all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = _encode_cursor(spec, rows[-1])
+    return rows, next_cursor
+
+
+def _page_links(cursor, next_cursor):
+    """生成 "首页 / 下一页" 链接，保留全部筛选、排序与列参数 (cols 为多值参数)。"""
+    args = request.args.to_dict(flat=False)
+    args.pop('cursor', None)
+    return {
+        'first_page_url': url_for(request.endpoint, **args) if cursor else None,
+        'next_page_url': url_for(request.endpoint, cursor=next_cursor, **args) if next_cursor else None,
+    }
+
+
+def _export_links(export_endpoint):
+    """生成导出链接：沿用当前的筛选、排序与列参数 (不含分页游标)。"""
+    args = request.args.to_dict(flat=False)
+    args.pop('cursor', None)
+    args.pop('fmt', None)
+    return {
+        'export_csv_url': url_for(export_endpoint, fmt='csv', **args),
+        'export_ndjson_url': url_for(export_endpoint, fmt='ndjson', **args),
+    }
+
+
+# ------------------------------------------------------------------------------
+# 导出工具：服务端游标 + 生成器流式输出 (CSV / NDJSON)
+# ------------------------------------------------------------------------------
+EXPORT_BATCH_ROWS = 1000
+
+
+def _stream_export(spec, name):
+    """以流式响应导出完整查询结果，内存占用与总行数无关。"""
+    fmt = request.args.get('fmt', 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        fmt = 'csv'
+    sql = select_sql(_build_sql(spec))
+    params = dict(spec['params'])
+    engine = read_engine()
+
+    def generate():
+        # stream_results=True 使用 pymysql 的 SSCursor，边读边发，不在内存中缓存整表
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(sql, params)
+            keys = list(result.keys())
+
+            if fmt == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                # BOM 让 Excel 正确识别中文
+                buffer.write('\ufeff')
+                writer.writerow(keys)
+                for rows in result.partitions(EXPORT_BATCH_ROWS):
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                yield buffer.getvalue()
+            else:
+                for rows in result.partitions(EXPORT_BATCH_ROWS):
+                    yield "".join(
+                        json.dumps(dict(zip(keys, row)), default=str, ensure_ascii=False) + "\n"
+                        for row in rows
+                    )
+
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            # 关闭反向代理缓冲，下载立即开始
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+def _resolve_sort(spec, default_sort):
+    """校验排序参数：只允许 column_map 中的字段，防止 SQL 注入。"""
+    column_map = spec['column_map']
+    if spec['sort_by'] not in column_map:
+        spec['sort_by'] = default_sort
+    spec['sort_order'] = 'asc' if spec['sort_order'] == 'asc' else 'desc'
+    spec['sort_field'] = column_map[spec['sort_by']]['sql_field']
+    spec['sort_key'] = column_map[spec['sort_by']]['field']
+    spec['direction'] = 'ASC' if spec['sort_order'] == 'asc' else 'DESC'
+
+
+def _selected_cols(args, column_map, default_cols):
+    selected_keys = args.getlist('cols') or default_cols
+    final_cols = [k for k in selected_keys if k in column_map]
+    return final_cols or default_cols
 
-    # 1. 定义列映射 (增加 'sql_field' 用于排序)
+
+# ------------------------------------------------------------------------------
+# 2. 全局音乐视图查询 (升级版 Pro Max：多维度搜索 + 动态排序 + 游标分页)
+# ------------------------------------------------------------------------------
+def _music_query_spec(args):
+    # 1. 定义列映射 ('sql_field' 用于排序，'select' 为该列需要查询的字段)
     column_map = {
-        'id': {'field': 'music_id', 'name': 'ID', 'sql_field': 'music_id'},
-        'title': {'field': 'title', 'name': '歌曲信息', 'sql_field': 'title'},
-        'uploader': {'field': 'uploader_nickname', 'name': '上传者', 'sql_field': 'uploader_nickname'},
-        'status': {'field': 'status', 'name': '当前状态', 'sql_field': 'status'},
-        'time': {'field': 'uploaded_at', 'name': '上传时间', 'sql_field': 'uploaded_at'},
-        'reason': {'field': 'rejection_reason', 'name': '驳回原因', 'sql_field': 'rejection_reason'}
+        'id': {'field': 'music_id', 'name': 'ID', 'sql_field': 'music_id',
+               'select': ['music_id']},
+        'title': {'field': 'title', 'name': '歌曲信息', 'sql_field': 'title',
+                  'select': ['title', 'original_filename']},
+        'uploader': {'field': 'uploader_nickname', 'name': '上传者', 'sql_field': 'uploader_nickname',
+                     'select': ['uploader_nickname', 'uploader_id']},
+        'status': {'field': 'status', 'name': '当前状态', 'sql_field': 'status',
+                   'select': ['status']},
+        'time': {'field': 'uploaded_at', 'name': '上传时间', 'sql_field': 'uploaded_at',
+                 'select': ['uploaded_at']},
+        'reason': {'field': 'rejection_reason', 'name': '驳回原因', 'sql_field': 'rejection_reason',
+                   'select': ['rejection_reason']}
     }
 
     # 2. 获取筛选参数
     default_cols = ['id', 'title', 'uploader', 'status', 'time']
-    selected_keys = request.args.getlist('cols') or default_cols
-    final_cols = [k for k in selected_keys if k in column_map]
-    if not final_cols: final_cols = default_cols
 
     # 获取搜索四剑客
-    q_title = request.args.get('q_title', '').strip()
-    q_uploader = request.args.get('q_uploader', '').strip()
-    q_uid = request.args.get('q_uid', '').strip()
-    filter_status = request.args.get('status', '').strip()
-
-    # [新增] 获取排序参数
-    sort_by = request.args.get('sort', 'time')  # 默认按时间排
-    sort_order = request.args.get('order', 'desc').lower()  # 默认降序
+    q_title = args.get('q_title', '').strip()
+    q_uploader = args.get('q_uploader', '').strip()
+    q_uid = args.get('q_uid', '').strip()
+    filter_status = args.get('status', '').strip()
 
-    # 3. 构建动态 SQL
-    base_sql = "SELECT * FROM v_music_full_info WHERE 1=1"
+    # 3. WHERE 子句
+    where = []
     params = {}
-
-    # WHERE 子句
+    # 模糊搜索走全文索引 (ngram)，见 app/search.py
     if q_title:
-        base_sql += " AND title LIKE :q_title"
-        params['q_title'] = f"%{q_title}%"
+        where.append(text_search_condition('title', q_title, 'q_title', params,
+                                           id_sql='music_id', table='musics', table_column='title'))
     if q_uploader:
-        base_sql += " AND uploader_nickname LIKE :q_uploader"
-        params['q_uploader'] = f"%{q_uploader}%"
+        where.append(text_search_condition('uploader_nickname', q_uploader, 'q_uploader', params,
+                                           id_sql='uploader_id', table='user', table_column='nickname'))
     if q_uid and q_uid.isdigit():
-        base_sql += " AND uploader_id = :q_uid"
+        where.append("uploader_id = :q_uid")
         params['q_uid'] = q_uid
     if filter_status:
-        base_sql += " AND status = :status"
+        where.append("status = :status")
         params['status'] = filter_status
 
-    # [新增] ORDER BY 子句构建
-    if sort_by in column_map:
-        target_field = column_map[sort_by]['sql_field']
-    else:
-        target_field = 'uploaded_at'  # 默认字段
-
-    direction = 'ASC' if sort_order == 'asc' else 'DESC'
+    spec = {
+        'column_map': column_map,
+        'selected_cols': _selected_cols(args, column_map, default_cols),
+        'from_sql': 'v_music_full_info',
+        'where': where,
+        'params': params,
+        'sort_by': args.get('sort', 'time'),  # 默认按时间排
+        'sort_order': args.get('order', 'desc').lower(),  # 默认降序
+        'tiebreak_sql': 'music_id',
+        'tiebreak_select': 'music_id',
+        'tiebreak_key': 'music_id',
+        'echo': {
+            'q_title': q_title,
+            'q_uploader': q_uploader,
+            'q_uid': q_uid,
+            'filter_status': filter_status,
+        },
+    }
+    _resolve_sort(spec, 'time')
+    return spec
 
-    base_sql += f" ORDER BY {target_field} {direction}"
 
-    # 二级排序：ID倒序 (保证分页/排序稳定性)
-    if target_field != 'music_id':
-        base_sql += ", music_id DESC"
+@db_views_bp.route("/music-list")
+@login_required
+def admin_music_view_query():
+    _admin_required()
 
-    # 执行查询
-    results = db.session.execute(text(base_sql), params).mappings().all()
+    spec = _music_query_spec(request.args)
+    cursor = request.args.get('cursor')
+    results, next_cursor = _fetch_page(spec, cursor)
 
     return render_template(
         "database_views/music_view_list.html",
         musics=results,
-        all_columns=column_map,
-        selected_cols=final_cols,
+        all_columns=spec['column_map'],
+        selected_cols=spec['selected_cols'],
+        # 回显排序参数
+        current_sort=spec['sort_by'],
+        current_order=spec['sort_order'],
+        # 分页
+        **_page_links(cursor, next_cursor),
+        **_export_links('db_views.admin_music_view_export'),
         # 回显搜索参数
-        q_title=q_title,
-        q_uploader=q_uploader,
-        q_uid=q_uid,
-        filter_status=filter_status,
-        # [新增] 回显排序参数
-        current_sort=sort_by,
-        current_order=sort_order
+        **spec['echo']
     )
 
 
-
+@db_views_bp.route("/music-list/export")
+@login_required
+def admin_music_view_export():
+    _admin_required()
+    return _stream_export(_music_query_spec(request.args), "music")
 
 
 # ------------------------------------------------------------------------------
-# 3. 房间热度视图查询 (升级版 Pro Max：多维度搜索 + 动态排序)
+# 3. 房间热度视图查询 (升级版 Pro Max：多维度搜索 + 动态排序 + 游标分页)
 # ------------------------------------------------------------------------------
-@db_views_bp.route("/room-stats")
-@login_required
-def admin_room_view_query():
-    _admin_required()
-
+def _room_query_spec(args):
     # 1. 定义列映射 (前端 key -> 数据库字段 & 显示名称)
-    # [新增] 'sql_field' 用于排序时的 SQL 字段名
     column_map = {
-        'id': {'field': 'room_id', 'name': '系统ID', 'sql_field': 'room_id'},
-        'code': {'field': 'code', 'name': '房间号', 'sql_field': 'code'},
-        'name': {'field': 'name', 'name': '房间名称', 'sql_field': 'name'},
-        'owner': {'field': 'owner_name', 'name': '房主', 'sql_field': 'owner_name'},
-        'status': {'field': 'is_active', 'name': '营业状态', 'sql_field': 'is_active'},
-        'heat': {'field': 'member_count', 'name': '实时热度', 'sql_field': 'member_count'}
+        'id': {'field': 'room_id', 'name': '系统ID', 'sql_field': 'room_id',
+               'select': ['room_id']},
+        'code': {'field': 'code', 'name': '房间号', 'sql_field': 'code',
+                 'select': ['code']},
+        'name': {'field': 'name', 'name': '房间名称', 'sql_field': 'name',
+                 'select': ['name']},
+        'owner': {'field': 'owner_name', 'name': '房主', 'sql_field': 'owner_name',
+                  'select': ['owner_name']},
+        'status': {'field': 'is_active', 'name': '营业状态', 'sql_field': 'is_active',
+                   'select': ['is_active']},
+        'heat': {'field': 'member_count', 'name': '实时热度', 'sql_field': 'member_count',
+                 'select': ['member_count']}
     }
 
     # 2. 获取筛选参数
     default_cols = ['code', 'name', 'owner', 'status', 'heat']
-    selected_keys = request.args.getlist('cols') or default_cols
-    final_cols = [k for k in selected_keys if k in column_map]
-    if not final_cols: final_cols = default_cols
 
     # 获取搜索三剑客 + 状态
-    q_name = request.args.get('q_name', '').strip()
-    q_owner = request.args.get('q_owner', '').strip()
-    q_code = request.args.get('q_code', '').strip()
-    filter_status = request.args.get('status', '').strip()
-
-    # [新增] 获取排序参数
-    # sort_by: 前端传来的列 key (例如 'heat', 'id')
-    # sort_order: 'asc' 或 'desc'
-    sort_by = request.args.get('sort', 'heat')  # 默认按热度排
-    sort_order = request.args.get('order', 'desc').lower()  # 默认降序
-
-    # 3. 构建动态 SQL
-    base_sql = "SELECT * FROM v_room_stats WHERE 1=1"
-    params = {}
+    q_name = args.get('q_name', '').strip()
+    q_owner = args.get('q_owner', '').strip()
+    q_code = args.get('q_code', '').strip()
+    filter_status = args.get('status', '').strip()
 
-    # WHERE 子句 (保持不变)
+    # 3. WHERE 子句
+    where = []
+    params = {}
     if q_name:
-        base_sql += " AND name LIKE :q_name"
+        where.append("name LIKE :q_name")
         params['q_name'] = f"%{q_name}%"
     if q_owner:
-        base_sql += " AND owner_name LIKE :q_owner"
-        params['q_owner'] = f"%{q_owner}%"
+        where.append(text_search_condition('owner_name', q_owner, 'q_owner', params,
+                                           id_sql='owner_id', table='user', table_column='nickname'))
     if q_code:
-        base_sql += " AND code = :q_code"
+        where.append("code = :q_code")
         params['q_code'] = q_code
-    if filter_status:
-        base_sql += " AND is_active = :status"
+    if filter_status in ('0', '1'):
+        where.append("is_active = :status")
         params['status'] = int(filter_status)
 
-    # [新增] ORDER BY 子句构建
-    # 安全校验：防止 SQL 注入，只允许 column_map 中的字段
-    if sort_by in column_map:
-        target_field = column_map[sort_by]['sql_field']
-    else:
-        target_field = 'member_count'  # 默认字段
-
-    # 校验排序方向
-    direction = 'ASC' if sort_order == 'asc' else 'DESC'
+    spec = {
+        'column_map': column_map,
+        'selected_cols': _selected_cols(args, column_map, default_cols),
+        'from_sql': 'v_room_stats',
+        'where': where,
+        'params': params,
+        'sort_by': args.get('sort', 'heat'),  # 默认按热度排
+        'sort_order': args.get('order', 'desc').lower(),  # 默认降序
+        'tiebreak_sql': 'room_id',
+        'tiebreak_select': 'room_id',
+        'tiebreak_key': 'room_id',
+        'echo': {
+            'q_name': q_name,
+            'q_owner': q_owner,
+            'q_code': q_code,
+            'filter_status': filter_status,
+        },
+    }
+    _resolve_sort(spec, 'heat')
+    return spec
 
-    # 拼接 SQL
-    base_sql += f" ORDER BY {target_field} {direction}"
 
-    # 为了稳定性，当主排序字段相同时，追加二级排序
-    if target_field != 'room_id':
-        base_sql += ", room_id DESC"
+@db_views_bp.route("/room-stats")
+@login_required
+def admin_room_view_query():
+    _admin_required()
 
-    # 执行查询
-    results = db.session.execute(text(base_sql), params).mappings().all()
+    spec = _room_query_spec(request.args)
+    cursor = request.args.get('cursor')
+    results, next_cursor = _fetch_page(spec, cursor)
 
     return render_template(
         "database_views/room_view_list.html",
         rooms=results,
-        all_columns=column_map,
-        selected_cols=final_cols,
+        all_columns=spec['column_map'],
+        selected_cols=spec['selected_cols'],
+        # 回显排序参数
+        current_sort=spec['sort_by'],
+        current_order=spec['sort_order'],
+        # 分页
+        **_page_links(cursor, next_cursor),
+        **_export_links('db_views.admin_room_view_export'),
         # 回显搜索参数
-        q_name=q_name,
-        q_owner=q_owner,
-        q_code=q_code,
-        filter_status=filter_status,
-        # [新增] 回显排序参数
-        current_sort=sort_by,
-        current_order=sort_order
+        **spec['echo']
     )
 
 
-# ------------------------------------------------------------------------------
-# 4. 用户听歌流水查询 (升级版 Pro Max：多维度搜索 + 动态排序)
-# ------------------------------------------------------------------------------
-@db_views_bp.route("/listen-records")
+@db_views_bp.route("/room-stats/export")
 @login_required
-def admin_record_view_query():
+def admin_room_view_export():
     _admin_required()
+    return _stream_export(_room_query_spec(request.args), "room_stats")
+
 
+# ------------------------------------------------------------------------------
+# 4. 用户听歌流水查询 (升级版 Pro Max：多维度搜索 + 动态排序 + 游标分页)
+# ------------------------------------------------------------------------------
+def _record_query_spec(args):
     # 1. 定义列映射 (注意：sql_field 需要带表别名 lr. 或 u.)
     column_map = {
-        'id': {'field': 'id', 'name': '记录ID', 'sql_field': 'lr.id'},
-        'song': {'field': 'song_name', 'name': '歌曲名称', 'sql_field': 'lr.song_name'},
-        'nickname': {'field': 'nickname', 'name': '用户昵称', 'sql_field': 'u.nickname'},
-        'username': {'field': 'username', 'name': '用户账号', 'sql_field': 'u.username'},
-        'uid': {'field': 'user_id', 'name': '用户ID', 'sql_field': 'u.id'},
-        'time': {'field': 'played_at', 'name': '播放时间', 'sql_field': 'lr.played_at'}
+        'id': {'field': 'id', 'name': '记录ID', 'sql_field': 'lr.id',
+               'select': ['lr.id']},
+        'song': {'field': 'song_name', 'name': '歌曲名称', 'sql_field': 'lr.song_name',
+                 'select': ['lr.song_name']},
+        'nickname': {'field': 'nickname', 'name': '用户昵称', 'sql_field': 'u.nickname',
+                     'select': ['u.nickname']},
+        'username': {'field': 'username', 'name': '用户账号', 'sql_field': 'u.username',
+                     'select': ['u.username']},
+        'uid': {'field': 'user_id', 'name': '用户ID', 'sql_field': 'u.id',
+                'select': ['u.id AS user_id']},
+        'time': {'field': 'played_at', 'name': '播放时间', 'sql_field': 'lr.played_at',
+                 'select': ['lr.played_at']}
     }
 
     # 2. 获取筛选参数
     default_cols = ['id', 'time', 'nickname', 'song']
-    selected_keys = request.args.getlist('cols') or default_cols
-    final_cols = [k for k in selected_keys if k in column_map]
-    if not final_cols: final_cols = default_cols
 
     # 获取搜索参数
-    q_song = request.args.get('q_song', '').strip()
-    q_nickname = request.args.get('q_nickname', '').strip()
-    q_username = request.args.get('q_username', '').strip()
-    q_uid = request.args.get('q_uid', '').strip()
-
-    # 获取排序参数
-    sort_by = request.args.get('sort', 'time')  # 默认按时间排
-    sort_order = request.args.get('order', 'desc').lower()
-
-    # 3. 构建动态 SQL (基于 JOIN 查询)
-    base_sql = """
-        SELECT 
-            lr.id,
-            lr.song_name,
-            lr.played_at,
-            u.id AS user_id,
-            u.username,
-            u.nickname
-        FROM listen_record lr
-        JOIN user u ON lr.user_id = u.id
-        WHERE 1=1
-    """
-    params = {}
+    q_song = args.get('q_song', '').strip()
+    q_nickname = args.get('q_nickname', '').strip()
+    q_username = args.get('q_username', '').strip()
+    q_uid = args.get('q_uid', '').strip()
 
-    # 动态拼接 WHERE
+    # 3. 动态拼接 WHERE (基于 JOIN 查询)
+    where = []
+    params = {}
+    # 模糊搜索走全文索引 (ngram)，见 app/search.py
     if q_song:
-        base_sql += " AND lr.song_name LIKE :q_song"
-        params['q_song'] = f"%{q_song}%"
-
+        where.append(song_name_condition('lr.song_name', q_song, 'q_song', params))
     if q_nickname:
-        base_sql += " AND u.nickname LIKE :q_nickname"
-        params['q_nickname'] = f"%{q_nickname}%"
-
+        where.append(text_search_condition('u.nickname', q_nickname, 'q_nickname', params,
+                                           id_sql='u.id', table='user', table_column='nickname'))
     if q_username:
-        base_sql += " AND u.username LIKE :q_username"
-        params['q_username'] = f"%{q_username}%"
-
+        where.append(text_search_condition('u.username', q_username, 'q_username', params,
+                                           id_sql='u.id', table='user', table_column='username'))
     if q_uid and q_uid.isdigit():
-        base_sql += " AND u.id = :q_uid"
+        where.append("u.id = :q_uid")
         params['q_uid'] = q_uid
 
-    # 动态拼接 ORDER BY
-    if sort_by in column_map:
-        target_field = column_map[sort_by]['sql_field']
-    else:
-        target_field = 'lr.played_at'
+    spec = {
+        'column_map': column_map,
+        'selected_cols': _selected_cols(args, column_map, default_cols),
+        'from_sql': 'listen_record lr JOIN user u ON lr.user_id = u.id',
+        'where': where,
+        'params': params,
+        'sort_by': args.get('sort', 'time'),  # 默认按时间排
+        'sort_order': args.get('order', 'desc').lower(),
+        'tiebreak_sql': 'lr.id',
+        'tiebreak_select': 'lr.id',
+        'tiebreak_key': 'id',
+        'echo': {
+            'q_song': q_song,
+            'q_nickname': q_nickname,
+            'q_username': q_username,
+            'q_uid': q_uid,
+        },
+    }
+    _resolve_sort(spec, 'time')
+    return spec
 
-    direction = 'ASC' if sort_order == 'asc' else 'DESC'
-    base_sql += f" ORDER BY {target_field} {direction}"
 
-    # 限制返回数量，防止爆表 (实际生产环境应使用分页)
-    base_sql += " LIMIT 200"
+@db_views_bp.route("/listen-records")
+@login_required
+def admin_record_view_query():
+    _admin_required()
 
-    results = db.session.execute(text(base_sql), params).mappings().all()
+    # 不再硬性 LIMIT 200：按游标逐页浏览全部历史
+    spec = _record_query_spec(request.args)
+    cursor = request.args.get('cursor')
+    results, next_cursor = _fetch_page(spec, cursor)
 
     return render_template(
         "database_views/record_view_list.html",
         records=results,
-        all_columns=column_map,
-        selected_cols=final_cols,
+        all_columns=spec['column_map'],
+        selected_cols=spec['selected_cols'],
+        current_sort=spec['sort_by'],
+        current_order=spec['sort_order'],
+        # 分页
+        **_page_links(cursor, next_cursor),
+        **_export_links('db_views.admin_record_view_export'),
         # 回显参数
-        q_song=q_song,
-        q_nickname=q_nickname,
-        q_username=q_username,
-        q_uid=q_uid,
-        current_sort=sort_by,
-        current_order=sort_order
+        **spec['echo']
     )
 
 
-
-# ------------------------------------------------------------------------------
-# 辅助函数：供首页 Dashboard 使用
-# ------------------------------------------------------------------------------
-def get_hot_rooms_data(limit=5):
-    sql = text("""
-        SELECT * FROM v_room_stats 
-        WHERE is_active = 1 
-        ORDER BY member_count DESC 
-        LIMIT :limit
-    """)
-    return db.session.execute(sql, {"limit": limit}).mappings().all()
\ No newline at end of file
+@db_views_bp.route("/listen-records/export")
+@login_required
+def admin_record_view_export():
+    _admin_required()
+    return _stream_export(_record_query_spec(request.args), "listen_records")
@@ -0,0 +1,193 @@
+# app/db_pool.py
+# ==============================================================================
+# 模块名称：连接池配置与指标
+# 描述：按 bind 分别配置连接池 (config.DB_POOL_PROFILES)，并统计连接池运行指标。
+#         - default / replica_db：服务 2 秒一次的房间轮询，连接周转快，使用「乐观」存活检测：
+#           不做 pre-ping，靠 pool_recycle 在 MySQL wait_timeout 之前回收；
+#           万一拿到已断开的连接，SQLAlchemy 会在该次报错时让整个池失效并重连
+#         - admin_db：备份/恢复/维护长时间占用连接、调用间隔长，使用「悲观」检测 (pre-ping)
+#       指标 (经 /metrics 输出)：取连接等待时间、池饱和度、溢出连接数、取连接超时与断线次数。
+#       内存 SQLite (测试库) 保持 SQLAlchemy 默认连接池，只统计事件类指标。
+# ==============================================================================
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import QueuePool
+
+# 取连接等待时间分桶 (秒)
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+LIVENESS_MODES = ("pessimistic", "optimistic")
+
+
+class PoolStats:
+    """单个 bind 的连接池计数 (事件钩子中更新)。"""
+
+    def __init__(self, bind):
+        from .metrics import _Histogram
+
+        self.bind = bind
+        self.lock = threading.Lock()
+        self.wait = _Histogram(WAIT_BUCKETS)
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.disconnects = 0
+
+    def observe_wait(self, seconds):
+        with self.lock:
+            self.wait.observe(seconds)
+
+    def wait_copy(self):
+        """等待时间直方图的副本 (调用方需持有 lock)。"""
+        from .metrics import _Histogram
+
+        hist = _Histogram(WAIT_BUCKETS)
+        hist.counts, hist.sum, hist.count = list(self.wait.counts), self.wait.sum, self.wait.count
+        return hist
+
+    def incr(self, field):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录取连接等待时间 (含池满排队与新建连接) 与超时次数的 QueuePool。"""
+
+    stats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            if self.stats is not None:
+                self.stats.incr("timeouts")
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.observe_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() 会重建连接池，统计对象沿用
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def _is_memory_sqlite(url):
+    url = str(url or "")
+    return url.startswith("sqlite") and (":memory:" in url or "mode=memory" in url or url == "sqlite://")
+
+
+def profile_engine_options(profile):
+    """连接池配置 -> create_engine 参数。"""
+    liveness = profile.get("liveness", "pessimistic")
+    if liveness not in LIVENESS_MODES:
+        raise ValueError(f"liveness 只能是 {' / '.join(LIVENESS_MODES)}，当前为 {liveness!r}")
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": profile.get("pool_size", 5),
+        "max_overflow": profile.get("max_overflow", 10),
+        "pool_timeout": profile.get("pool_timeout", 30),
+        "pool_recycle": profile.get("pool_recycle", 300),
+        "pool_pre_ping": liveness == "pessimistic",
+        "pool_use_lifo": profile.get("pool_use_lifo", False),
+    }
+
+
+def apply_pool_profiles(app):
+    """在 db.init_app 之前调用：把 DB_POOL_PROFILES 合并进默认引擎与各 bind 的引擎参数。"""
+    profiles = app.config.get("DB_POOL_PROFILES") or {}
+    if not profiles:
+        return
+
+    default_url = app.config.get("SQLALCHEMY_DATABASE_URI")
+    if "default" in profiles and not _is_memory_sqlite(default_url):
+        options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+        options.update(profile_engine_options(profiles["default"]))
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+    binds = {}
+    for key, value in (app.config.get("SQLALCHEMY_BINDS") or {}).items():
+        bind = dict(value) if isinstance(value, dict) else {"url": value}
+        # 未单独配置的 bind 沿用 default 的连接池参数
+        profile = profiles.get(key, profiles.get("default"))
+        if profile and not _is_memory_sqlite(bind.get("url")):
+            bind.update(profile_engine_options(profile))
+        binds[key] = bind
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+# ==============================================================================
+# 指标
+# ==============================================================================
+_stats = {}  # bind 名称 -> PoolStats
+_engines = {}  # bind 名称 -> Engine
+
+
+def init_pool_metrics(engines):
+    """在各引擎的连接池上挂载事件钩子 (需在 app 上下文中调用，engines 即 db.engines)。"""
+    for key, engine in engines.items():
+        name = key or "default"
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = PoolStats(name)
+        _engines[name] = engine
+        if isinstance(engine.pool, InstrumentedQueuePool):
+            engine.pool.stats = stats
+
+        if not event.contains(engine, "handle_error", _on_error):
+            event.listen(engine, "handle_error", _on_error)
+            event.listen(engine.pool, "checkout", _make_checkout_listener(stats, engine))
+            event.listen(engine.pool, "connect", lambda *args, s=stats: s.incr("connects"))
+
+
+def _make_checkout_listener(stats, engine):
+    def on_checkout(dbapi_conn, record, proxy):
+        stats.incr("checkouts")
+        pool = engine.pool
+        if isinstance(pool, QueuePool) and pool.checkedout() > pool.size():
+            stats.incr("overflow_checkouts")
+    return on_checkout
+
+
+def _on_error(context):
+    if context.is_disconnect:
+        for name, engine in _engines.items():
+            if engine is context.engine:
+                _stats[name].incr("disconnects")
+
+
+def pool_snapshot():
+    """各 bind 连接池的当前状态 (供 /metrics 与后台页面使用)。"""
+    snapshot = {}
+    for name, engine in sorted(_engines.items()):
+        pool = engine.pool
+        stats = _stats[name]
+        with stats.lock:
+            item = {
+                "pool": type(pool).__name__,
+                "pre_ping": bool(getattr(pool, "_pre_ping", False)),
+                "checkouts": stats.checkouts,
+                "overflow_checkouts": stats.overflow_checkouts,
+                "timeouts": stats.timeouts,
+                "connects": stats.connects,
+                "disconnects": stats.disconnects,
+                "wait": stats.wait_copy(),
+            }
+        if isinstance(pool, QueuePool):
+            size, max_overflow, checked_out = pool.size(), pool._max_overflow, pool.checkedout()
+            capacity = size + max_overflow if max_overflow >= 0 else size
+            item.update({
+                "size": size,
+                "max_overflow": max_overflow,
+                "checked_out": checked_out,
+                "overflow": max(pool.overflow(), 0),
+                "saturation": checked_out / capacity if capacity else 0.0,
+            })
+        snapshot[name] = item
+    return snapshot
@@ -0,0 +1,113 @@
+# app/db_routing.py
+# ==============================================================================
+# 模块名称：读写分离路由
+# 描述：配置了只读副本 (SQLALCHEMY_BINDS["replica_db"]，环境变量 DATABASE_URL_REPLICA) 时，
+#       把标记为只读的接口 (房间轮询、首页热门房间、数据中心查询) 的查询发到副本，
+#       其余语句仍走主库。
+#         - 只在 @replica_reads / with replica_reads() 范围内才会读副本，默认全部走主库
+#         - 范围内遇到 INSERT/UPDATE/DELETE、非 SELECT 的原生 SQL 或 ORM flush 仍然走主库
+#         - 读己之写：用户在主库上写入后，REPLICA_STICKY_SECONDS 秒内的读取仍走主库
+#           (时间戳记在 Flask session 中，跨进程有效)，避免刚写完就从有延迟的副本读到旧数据
+#         - primary_reads()：只读范围内必须读主库的查询 (如填充进程内缓存)
+#       未配置副本时所有函数都是空操作。
+# ==============================================================================
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.elements import TextClause
+
+REPLICA_BIND = "replica_db"
+LAST_WRITE_KEY = "_db_last_write"
+
+
+def _is_write(clause):
+    if clause is None:
+        return False
+    if getattr(clause, "is_dml", False):
+        return True
+    if isinstance(clause, TextClause):
+        return not clause.text.lstrip().upper().startswith(("SELECT", "WITH"))
+    return False
+
+
+def _sticky_to_primary():
+    """当前用户最近在主库写过数据 (本请求内或 REPLICA_STICKY_SECONDS 秒内)。"""
+    if g.get("_db_wrote"):
+        return True
+    last_write = session.get(LAST_WRITE_KEY)
+    window = current_app.config.get("REPLICA_STICKY_SECONDS", 5)
+    return bool(last_write) and time.time() - last_write < window
+
+
+class RoutingSession(Session):
+    """在 Flask-SQLAlchemy 的 bind 选择之前，按请求状态决定是否读副本。"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or _is_write(clause):
+                # 记录本请求发生过写入，after_request 时写入 session 时间戳
+                g._db_wrote = True
+            elif g.get("_db_read_replica") and not _sticky_to_primary():
+                replica = self._db.engines.get(REPLICA_BIND)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def _replica_scope(enabled=True):
+    previous = g.get("_db_read_replica", False)
+    g._db_read_replica = enabled
+    try:
+        yield
+    finally:
+        g._db_read_replica = previous
+
+
+def primary_reads():
+    """在只读范围内临时改回主库，例如填充之后只靠事件增量更新的进程内缓存 (不能从有延迟的副本加载)。"""
+    if not has_request_context():
+        return _null_scope()
+    return _replica_scope(enabled=False)
+
+
+@contextmanager
+def _null_scope():
+    yield
+
+
+def replica_reads(view=None):
+    """只读范围：既可作视图装饰器 (@replica_reads)，也可作上下文管理器 (with replica_reads():)。"""
+    if view is None:
+        return _replica_scope()
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with _replica_scope():
+            return view(*args, **kwargs)
+
+    return wrapper
+
+
+def read_engine():
+    """直接使用引擎 (如流式导出) 时的只读引擎：有副本且用户不需要读己之写时返回副本。"""
+    engines = current_app.extensions["sqlalchemy"].engines
+    replica = engines.get(REPLICA_BIND)
+    if replica is not None and not (has_request_context() and _sticky_to_primary()):
+        return replica
+    return engines[None]
+
+
+def init_db_routing(app):
+    """注册 after_request：本请求在主库写过数据时记录时间戳，实现读己之写。"""
+    if REPLICA_BIND not in (app.config.get("SQLALCHEMY_BINDS") or {}):
+        return
+
+    @app.after_request
+    def _remember_last_write(response):
+        if g.get("_db_wrote"):
+            session[LAST_WRITE_KEY] = time.time()
+        return response
@@ -0,0 +1,58 @@
+# app/dialect.py
+# ==============================================================================
+# 模块名称：数据库方言适配
+# 描述：生产环境使用 MySQL，测试与压测使用 SQLite (config.TestConfig)。
+#       业务中的原生 SQL 绝大多数两边通用，少数差异集中在这里：
+#         - SQLite 原生 SQL 查询返回的 DATETIME 是字符串，需要声明列类型才能得到 datetime；
+#           同理，与时间列比较的 datetime 参数也要声明类型，才能按列中存储的格式比较
+#         - SQLite 的 DELETE/UPDATE 不支持 LIMIT，分批语句改为按 rowid 子查询限量
+# ==============================================================================
+from sqlalchemy import DateTime, bindparam, text
+
+from . import db
+
+# 原生查询结果中出现的时间列 (按列名声明类型，未出现的列名不影响查询)
+DATETIME_COLUMNS = (
+    "created_at", "updated_at", "uploaded_at", "played_at", "participated_at",
+    "joined_at", "last_seen_at", "action_time",
+)
+
+
+def dialect_name(bind=None):
+    """返回默认引擎 (或指定 bind) 的方言名：mysql / sqlite。"""
+    return db.engines[bind].dialect.name
+
+
+def is_mysql(bind=None):
+    return dialect_name(bind) == "mysql"
+
+
+def select_sql(sql, datetime_params=()):
+    """原生 SELECT：在 text() 基础上声明时间列类型，MySQL 下无额外开销。
+
+    datetime_params 为与时间列比较的参数名 (如游标中的时间值)。
+    """
+    clause = text(sql)
+    if datetime_params:
+        clause = clause.bindparams(*(bindparam(name, type_=DateTime()) for name in datetime_params))
+    return clause.columns(**{name: DateTime() for name in DATETIME_COLUMNS})
+
+
+def batched_delete_sql(dialect, table, where):
+    """每次最多删除 :batch 行的 DELETE 语句。"""
+    if dialect == "mysql":
+        return text(f"DELETE FROM {table} WHERE {where} LIMIT :batch")
+    return text(
+        f"DELETE FROM {table} WHERE rowid IN "
+        f"(SELECT rowid FROM {table} WHERE {where} LIMIT :batch)"
+    )
+
+
+def batched_update_sql(dialect, table, assignments, where):
+    """每次最多更新 :batch 行的 UPDATE 语句。"""
+    if dialect == "mysql":
+        return text(f"UPDATE {table} SET {assignments} WHERE {where} LIMIT :batch")
+    return text(
+        f"UPDATE {table} SET {assignments} WHERE rowid IN "
+        f"(SELECT rowid FROM {table} WHERE {where} LIMIT :batch)"
+    )
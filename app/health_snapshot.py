@@ -0,0 +1,300 @@
+# app/health_snapshot.py
+# ==============================================================================
+# 模块名称：数据库健康快照
+# 描述：db_health 概览需要扫描 information_schema (TABLES / STATISTICS / TABLE_CONSTRAINTS)，
+#       在 MySQL 上代价高，还可能卡在元数据锁上。这里把结果缓存为快照：
+#         - 概览：由调度器定时在后台刷新并写入 db_health_snapshot 表，所有 worker 的页面只读这一份，
+#           管理员可手动触发刷新；调度器未按时刷新时，打开页面的 worker 返回旧数据并在后台刷新
+#         - 详情：SHOW INDEX 与外键信息按表缓存，超过有效期后再查询
+#       SQLite (测试库) 下改用 sqlite_master 与 pragma 表值函数得到同样字段。
+# ==============================================================================
+import json
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from . import db
+
+# 概览查询：先按表分组统计索引/约束，再与 TABLES 关联，避免每张表三次相关子查询
+OVERVIEW_SQL = text("""
+    SELECT
+        T.TABLE_NAME,
+        T.TABLE_TYPE,
+        T.TABLE_ROWS,
+        T.DATA_LENGTH,
+        COALESCE(S.index_count, 0) AS index_count,
+        COALESCE(C.pk_count, 0) AS pk_count,
+        COALESCE(C.fk_count, 0) AS fk_count
+    FROM information_schema.TABLES T
+    LEFT JOIN (
+        SELECT TABLE_NAME, COUNT(DISTINCT INDEX_NAME) AS index_count
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+        GROUP BY TABLE_NAME
+    ) S ON S.TABLE_NAME = T.TABLE_NAME
+    LEFT JOIN (
+        SELECT TABLE_NAME,
+               SUM(CONSTRAINT_TYPE = 'PRIMARY KEY') AS pk_count,
+               SUM(CONSTRAINT_TYPE = 'FOREIGN KEY') AS fk_count
+        FROM information_schema.TABLE_CONSTRAINTS
+        WHERE TABLE_SCHEMA = DATABASE()
+        GROUP BY TABLE_NAME
+    ) C ON C.TABLE_NAME = T.TABLE_NAME
+    WHERE T.TABLE_SCHEMA = DATABASE()
+    ORDER BY T.TABLE_NAME
+""")
+
+FK_SQL = text("""
+    SELECT CONSTRAINT_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+    FROM information_schema.KEY_COLUMN_USAGE
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = :t
+      AND REFERENCED_TABLE_NAME IS NOT NULL
+""")
+
+
+# SQLite (测试库) 的等价查询：sqlite_master + pragma 表值函数
+SQLITE_OVERVIEW_SQL = text("""
+    SELECT
+        m.name AS TABLE_NAME,
+        CASE m.type WHEN 'view' THEN 'VIEW' ELSE 'BASE TABLE' END AS TABLE_TYPE,
+        NULL AS TABLE_ROWS,
+        NULL AS DATA_LENGTH,
+        (SELECT COUNT(*) FROM pragma_index_list(m.name))
+            + EXISTS (SELECT 1 FROM pragma_table_info(m.name) WHERE pk > 0) AS index_count,
+        EXISTS (SELECT 1 FROM pragma_table_info(m.name) WHERE pk > 0) AS pk_count,
+        (SELECT COUNT(DISTINCT id) FROM pragma_foreign_key_list(m.name)) AS fk_count
+    FROM sqlite_master m
+    WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite_%'
+    ORDER BY m.name
+""")
+
+SQLITE_INDEX_SQL = text("""
+    SELECT 'PRIMARY' AS Key_name, pk AS Seq_in_index, name AS Column_name,
+           0 AS Non_unique, 'BTREE' AS Index_type, NULL AS Cardinality
+    FROM pragma_table_info(:t) WHERE pk > 0
+    UNION ALL
+    SELECT il.name, ii.seqno + 1, ii.name, 1 - il."unique", 'BTREE', NULL
+    FROM pragma_index_list(:t) il, pragma_index_info(il.name) ii
+    WHERE il.origin <> 'pk'
+""")
+
+SQLITE_FK_SQL = text("""
+    SELECT 'fk_' || id AS CONSTRAINT_NAME, "from" AS COLUMN_NAME,
+           "table" AS REFERENCED_TABLE_NAME, "to" AS REFERENCED_COLUMN_NAME
+    FROM pragma_foreign_key_list(:t)
+""")
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+LOAD_OVERVIEW_SQL = text("""
+    SELECT tables_json, error, duration_ms, updated_at FROM db_health_snapshot WHERE id = 1
+""")
+
+STORE_OVERVIEW_SQL = {
+    "mysql": text("""
+        INSERT INTO db_health_snapshot (id, tables_json, error, duration_ms, updated_at)
+        VALUES (1, :tables_json, :error, :duration_ms, :updated_at)
+        ON DUPLICATE KEY UPDATE
+            tables_json = VALUES(tables_json), error = VALUES(error),
+            duration_ms = VALUES(duration_ms), updated_at = VALUES(updated_at)
+    """),
+    "sqlite": text("""
+        INSERT INTO db_health_snapshot (id, tables_json, error, duration_ms, updated_at)
+        VALUES (1, :tables_json, :error, :duration_ms, :updated_at)
+        ON CONFLICT (id) DO UPDATE SET
+            tables_json = excluded.tables_json, error = excluded.error,
+            duration_ms = excluded.duration_ms, updated_at = excluded.updated_at
+    """),
+}
+
+
+def _now_str():
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+def _snapshot_engine():
+    # 快照表只有 vs_admin 有写权限
+    return db.get_engine(bind="admin_db")
+
+
+class HealthSnapshotCache:
+    """健康快照：概览存于 db_health_snapshot (进程内只保留最近读到的一份作为刷新失败时的兜底)，
+    详情按表缓存在进程内。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._overview = None
+        self._details = {}
+        self._refreshing = False
+
+    # --------------------------------------------------------------------------
+    # 概览
+    # --------------------------------------------------------------------------
+    def get_overview(self):
+        """返回 db_health_snapshot 中的概览快照；表中还没有快照时同步计算一次。
+
+        快照超过两个刷新周期仍未更新 (调度器进程没有运行) 时，本次返回旧数据并在本进程后台刷新。
+        """
+        snapshot, updated_at = self._load_overview()
+        if snapshot is None:
+            return self.refresh_overview()
+        interval = current_app.config.get("HEALTH_SNAPSHOT_INTERVAL_SECONDS", 300)
+        if (datetime.now() - updated_at).total_seconds() > interval * 2:
+            self.refresh_overview_async()
+        return snapshot
+
+    def _load_overview(self):
+        """读取共享的概览快照，返回 (snapshot, 更新时间)；没有时为 (None, None)。"""
+        with _snapshot_engine().connect() as conn:
+            row = conn.execute(LOAD_OVERVIEW_SQL).mappings().first()
+        if row is None:
+            return None, None
+        updated_at = row["updated_at"]
+        if not isinstance(updated_at, datetime):
+            updated_at = datetime.strptime(str(updated_at)[:19], TIME_FORMAT)
+        snapshot = {
+            "tables": json.loads(row["tables_json"]),
+            "updated_at": updated_at.strftime(TIME_FORMAT),
+            "duration_ms": row["duration_ms"],
+            "error": row["error"],
+        }
+        with self._lock:
+            self._overview = snapshot
+        return snapshot, updated_at
+
+    def _store_overview(self, snapshot):
+        engine = _snapshot_engine()
+        with engine.begin() as conn:
+            conn.execute(STORE_OVERVIEW_SQL[engine.dialect.name], {
+                "tables_json": json.dumps(snapshot["tables"], ensure_ascii=False, default=str),
+                "error": snapshot["error"][:500] if snapshot["error"] else None,
+                "duration_ms": snapshot["duration_ms"],
+                "updated_at": snapshot["updated_at"],
+            })
+
+    def refresh_overview(self):
+        """查询 information_schema 并写入共享的概览快照 (需要应用上下文)。"""
+        start = time.perf_counter()
+        try:
+            sql = OVERVIEW_SQL if db.engine.dialect.name == "mysql" else SQLITE_OVERVIEW_SQL
+            with db.engine.connect() as conn:
+                rows = conn.execute(sql).mappings().all()
+            tables = [
+                dict(row, pk_count=int(row["pk_count"]), fk_count=int(row["fk_count"]))
+                for row in rows
+            ]
+            error = None
+        except Exception as e:
+            print(f"[HealthSnapshot] Overview refresh failed: {e}")
+            with self._lock:
+                previous = self._overview
+            if previous is None:
+                try:
+                    previous = self._load_overview()[0]
+                except Exception:
+                    previous = None
+            # 刷新失败时保留上一次的数据，只记录错误
+            tables = previous["tables"] if previous else []
+            error = str(e)
+
+        snapshot = {
+            "tables": tables,
+            "updated_at": _now_str(),
+            "duration_ms": (time.perf_counter() - start) * 1000,
+            "error": error,
+        }
+        try:
+            self._store_overview(snapshot)
+        except Exception as e:
+            print(f"[HealthSnapshot] Saving overview failed: {e}")
+        with self._lock:
+            self._overview = snapshot
+        return snapshot
+
+    def refresh_overview_async(self):
+        """在后台线程刷新概览；已有刷新在进行时返回 False。"""
+        app = current_app._get_current_object()
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+
+        def _run():
+            try:
+                with app.app_context():
+                    self.refresh_overview()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=_run, name="health-snapshot", daemon=True).start()
+        return True
+
+    def is_refreshing(self):
+        with self._lock:
+            return self._refreshing
+
+    # --------------------------------------------------------------------------
+    # 单表详情
+    # --------------------------------------------------------------------------
+    def get_table_detail(self, table_name, force=False):
+        """返回单表的索引与外键信息，缓存超过 HEALTH_DETAIL_TTL_SECONDS 后重新查询。"""
+        ttl = current_app.config.get("HEALTH_DETAIL_TTL_SECONDS", 300)
+        with self._lock:
+            cached = self._details.get(table_name)
+        if cached and not force and time.monotonic() - cached["_loaded"] < ttl:
+            return cached
+
+        with db.engine.connect() as conn:
+            if conn.dialect.name == "mysql":
+                indexes = conn.execute(text(f"SHOW INDEX FROM `{table_name}`")).mappings().all()
+                fks = conn.execute(FK_SQL, {"t": table_name}).mappings().all()
+            else:
+                indexes = conn.execute(SQLITE_INDEX_SQL, {"t": table_name}).mappings().all()
+                fks = conn.execute(SQLITE_FK_SQL, {"t": table_name}).mappings().all()
+
+        detail = {
+            "indexes": [dict(row) for row in indexes],
+            "fks": [dict(row) for row in fks],
+            "updated_at": _now_str(),
+            "_loaded": time.monotonic(),
+        }
+        with self._lock:
+            self._details[table_name] = detail
+        return detail
+
+    def clear(self):
+        """表结构变化 (如恢复备份) 后清空全部快照 (需要应用上下文)，下次打开页面时重新计算概览。"""
+        with self._lock:
+            self._overview = None
+            self._details.clear()
+        try:
+            with _snapshot_engine().begin() as conn:
+                conn.execute(text("DELETE FROM db_health_snapshot"))
+        except Exception as e:
+            print(f"[HealthSnapshot] Clearing overview failed: {e}")
+
+
+health_cache = HealthSnapshotCache()
+
+
+def init_health_snapshot(app, scheduler):
+    """注册定时刷新概览快照的调度任务 (写入 db_health_snapshot，供所有 worker 读取)。"""
+    interval = app.config.get("HEALTH_SNAPSHOT_INTERVAL_SECONDS", 300)
+
+    def run_snapshot_refresh():
+        with app.app_context():
+            health_cache.refresh_overview()
+
+    if not scheduler.get_job('db_health_snapshot_job'):
+        scheduler.add_job(
+            id='db_health_snapshot_job',
+            func=run_snapshot_refresh,
+            trigger='interval',
+            seconds=interval,
+        )
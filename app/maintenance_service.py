@@ -0,0 +1,230 @@
+# app/maintenance_service.py
+# ==============================================================================
+# 模块名称：分批维护任务
+# 描述：sp_daily_maintenance 的应用层执行器。每一步都拆成有上限的小批次
+#       (DELETE/UPDATE ... LIMIT N)，每批单独提交，避免长事务长期持锁、撑大 undo log；
+#       任务在后台线程运行，前端通过轮询获取每一步处理的行数。
+#       任务状态与进度保存在 maintenance_job 表中 (每批提交后更新)，多个 admin worker 都能查询；
+#       running_slot 唯一索引保证同一时刻只有一个任务在执行 (不论由哪个 worker 启动)。
+#       执行任务的进程意外退出时，超过 MAINTENANCE_JOB_STALE_SECONDS 没有进度的任务在下次启动时标记为中断。
+#       SQLite (测试库) 没有分区与存储过程，全部走分批 DELETE/UPDATE。
+# ==============================================================================
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .create_with_sql import HISTORY_TABLES
+from .dialect import batched_delete_sql, batched_update_sql
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SAVE_JOB_SQL = """
+    UPDATE maintenance_job
+    SET status = :status, running_slot = :running_slot, current_step = :current_step, steps = :steps,
+        message = :message, updated_at = :updated_at, finished_at = :finished_at
+    WHERE id = :id
+"""
+
+
+def _now():
+    # 时间按固定格式的字符串写入，MySQL / SQLite 下比较与显示一致
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+def _format_time(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime(TIME_FORMAT)
+    return str(value)[:19]
+
+
+def _admin_engine():
+    return db.get_engine(bind="admin_db")
+
+
+def _new_job():
+    return {
+        "id": uuid.uuid4().hex[:12],
+        "status": "running",  # running / success / error
+        "started_at": _now(),
+        "finished_at": None,
+        "current_step": None,
+        "steps": [],
+        "message": "",
+    }
+
+
+def _save(job):
+    """把任务进度写入 maintenance_job (同时作为心跳)。"""
+    with _admin_engine().begin() as conn:
+        conn.execute(text(SAVE_JOB_SQL), {
+            "id": job["id"],
+            "status": job["status"],
+            "running_slot": 1 if job["status"] == "running" else None,
+            "current_step": job["current_step"],
+            "steps": json.dumps(job["steps"], ensure_ascii=False),
+            "message": job["message"],
+            "updated_at": _now(),
+            "finished_at": job["finished_at"],
+        })
+
+
+def get_maintenance_job():
+    """返回最近一次维护任务的快照 (没有则为 None)。"""
+    with _admin_engine().connect() as conn:
+        row = conn.execute(text("""
+            SELECT id, status, current_step, steps, message, started_at, finished_at
+            FROM maintenance_job
+            ORDER BY started_at DESC, updated_at DESC
+            LIMIT 1
+        """)).mappings().first()
+    if row is None:
+        return None
+    return {
+        "id": row["id"],
+        "status": row["status"],
+        "started_at": _format_time(row["started_at"]),
+        "finished_at": _format_time(row["finished_at"]),
+        "current_step": row["current_step"],
+        "steps": json.loads(row["steps"] or "[]"),
+        "message": row["message"] or "",
+    }
+
+
+def start_maintenance():
+    """启动后台维护任务；已有任务在运行 (任意 worker 上) 时不重复启动，返回 False。"""
+    app = current_app._get_current_object()
+    engine = _admin_engine()
+    stale = (datetime.now() - timedelta(seconds=app.config["MAINTENANCE_JOB_STALE_SECONDS"])).strftime(TIME_FORMAT)
+    job = _new_job()
+
+    with engine.begin() as conn:
+        # 执行任务的进程已退出 (长时间没有进度)：释放占位，允许重新启动
+        conn.execute(text("""
+            UPDATE maintenance_job
+            SET status = 'error', running_slot = NULL, current_step = NULL,
+                message = '任务中断：执行进程长时间没有进度', finished_at = :now
+            WHERE running_slot = 1 AND updated_at < :stale
+        """), {"now": job["started_at"], "stale": stale})
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO maintenance_job (id, status, running_slot, steps, message, started_at, updated_at)
+                VALUES (:id, 'running', 1, '[]', '', :now, :now)
+            """), {"id": job["id"], "now": job["started_at"]})
+    except IntegrityError:
+        # running_slot 唯一：其他任务正在执行
+        return False
+
+    thread = threading.Thread(target=_run_job, args=(app, job), name="maintenance", daemon=True)
+    thread.start()
+    return True
+
+
+def _run_job(app, job):
+    with app.app_context():
+        try:
+            run_maintenance_steps(job)
+            job["status"] = "success"
+            total = sum(step["rows"] for step in job["steps"])
+            job["message"] = f"维护完成，共处理 {total} 行数据。"
+        except Exception as e:
+            job["status"] = "error"
+            job["message"] = f"执行失败: {e}"[:255]
+            print(f"[Maintenance] Failed: {e}")
+        finally:
+            job["current_step"] = None
+            job["finished_at"] = _now()
+            try:
+                _save(job)
+            except Exception as e:
+                print(f"[Maintenance] Saving job {job['id']} failed: {e}")
+
+
+def run_maintenance_steps(job):
+    """按步骤执行维护，每一步的进度写入 job["steps"]。"""
+    config = current_app.config
+    batch_size = config["MAINTENANCE_BATCH_SIZE"]
+    retention = config["HISTORY_RETENTION_DAYS"]
+    days_ahead = config["HISTORY_PARTITION_DAYS_AHEAD"]
+    admin_engine = db.get_engine(bind="admin_db")
+    dialect = admin_engine.dialect.name
+
+    # 1. 历史表：已分区的整块删除分区，未分区的分批 DELETE
+    for table, column in HISTORY_TABLES.items():
+        step = _begin_step(job, f"清理 {table}")
+        partitioned = 0
+        if dialect == "mysql":
+            with admin_engine.connect() as conn:
+                partitioned = conn.execute(text("""
+                    SELECT COUNT(*) FROM information_schema.PARTITIONS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL
+                """), {"t": table}).scalar()
+
+        if partitioned:
+            step["mode"] = "drop_partition"
+            with admin_engine.begin() as conn:
+                conn.execute(
+                    text("CALL sp_purge_history(:t, :c, :keep, :ahead, :batch)"),
+                    {"t": table, "c": column, "keep": retention[table],
+                     "ahead": days_ahead, "batch": batch_size},
+                )
+        else:
+            step["mode"] = "batched_delete"
+            cutoff = datetime.utcnow() - timedelta(days=retention[table])
+            _run_batches(
+                admin_engine,
+                job,
+                step,
+                batched_delete_sql(dialect, table, f"{column} < :cutoff"),
+                {"cutoff": cutoff, "batch": batch_size},
+                batch_size,
+            )
+        step["status"] = "done"
+        _save(job)
+
+    # 2. 僵尸房间：超过 7 天没有更新的活跃房间，分批关闭
+    step = _begin_step(job, "关闭僵尸房间")
+    step["mode"] = "batched_update"
+    _run_batches(
+        admin_engine,
+        job,
+        step,
+        batched_update_sql(
+            dialect,
+            "room",
+            "is_active = 0, playback_status = 'paused'",
+            "is_active = 1 AND updated_at < :cutoff",
+        ),
+        {"cutoff": datetime.utcnow() - timedelta(days=7), "batch": batch_size},
+        batch_size,
+    )
+    step["status"] = "done"
+    _save(job)
+
+
+def _begin_step(job, name):
+    step = {"name": name, "mode": None, "rows": 0, "batches": 0, "status": "running"}
+    job["steps"].append(step)
+    job["current_step"] = name
+    _save(job)
+    return step
+
+
+def _run_batches(engine, job, step, sql, params, batch_size):
+    """循环执行带 LIMIT 的语句，每批独立提交并记录进度，直到影响行数不足一批。"""
+    while True:
+        with engine.begin() as conn:
+            affected = conn.execute(sql, params).rowcount
+        step["rows"] += affected
+        step["batches"] += 1
+        _save(job)
+        if affected < batch_size:
+            break
@@ -0,0 +1,338 @@
+# app/metrics.py
+# ==============================================================================
+# 模块名称：运行指标 (Prometheus 文本格式)
+# 描述：按 Flask endpoint (main.room_state、main.toggle_playback、auth.login ...) 统计
+#         - 请求耗时直方图、按状态码的请求计数、正在处理的请求数 (in-flight)
+#         - 每个请求执行的 SQL 条数 (默认引擎 + admin_db)
+#         - 调度任务 (自动备份、健康快照等) 的执行耗时与失败次数
+#         - 各 bind 连接池的取连接等待、饱和度与溢出 (见 db_pool.py)
+#       通过 GET /metrics 以 Prometheus 文本格式输出。指标保存在进程内，
+#       多进程部署时每个 worker 各自输出一份。
+# ==============================================================================
+import threading
+import time
+
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+
+# 请求/任务耗时分桶 (秒)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每个请求的 SQL 条数分桶
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_PREFIX = "voice_share"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f"{name}_bucket{_labels(labels, le=_fmt(bound))} {cumulative}"
+        yield f'{name}_bucket{_labels(labels, le="+Inf")} {self.count}'
+        yield f"{name}_sum{_labels(labels)} {_fmt(self.sum)}"
+        yield f"{name}_count{_labels(labels)} {self.count}"
+
+
+def _fmt(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Metrics:
+    """进程内指标注册表。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._request_duration = {}   # (endpoint, method) -> _Histogram
+        self._request_queries = {}    # endpoint -> _Histogram
+        self._requests_total = {}     # (endpoint, method, status) -> int
+        self._queries_total = {}      # endpoint -> int
+        self._in_flight = {}          # endpoint -> int
+        self._job_duration = {}       # job_id -> _Histogram
+        self._job_failures = {}       # job_id -> int
+        self._job_starts = {}         # (job_id, scheduled_run_time) -> perf_counter
+        self.started_at = time.time()
+        self.enabled = True
+        self.token = None
+
+    def init_app(self, app, engines):
+        self.enabled = app.config.get("METRICS_ENABLED", True)
+        self.token = app.config.get("METRICS_TOKEN")
+        app.extensions["metrics"] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule("/metrics", "metrics", self._metrics_view)
+
+        for engine in engines.values():
+            if not event.contains(engine, "before_cursor_execute", _count_query):
+                event.listen(engine, "before_cursor_execute", _count_query)
+
+    def init_scheduler(self, scheduler):
+        """监听 APScheduler 事件，记录调度任务耗时。"""
+        if not self.enabled:
+            return
+        from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_SUBMITTED
+        scheduler.add_listener(self._on_job_submitted, EVENT_JOB_SUBMITTED)
+        scheduler.add_listener(self._on_job_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+    # --------------------------------------------------------------------------
+    # 请求钩子
+    # --------------------------------------------------------------------------
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_queries = 0
+        g._metrics_status = 500
+        endpoint = request.endpoint or "unmatched"
+        with self._lock:
+            self._in_flight[endpoint] = self._in_flight.get(endpoint, 0) + 1
+
+    def _after_request(self, response):
+        g._metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        queries = g.pop("_metrics_queries", 0)
+        status = g.pop("_metrics_status", 500)
+        endpoint = request.endpoint or "unmatched"
+        method = request.method
+
+        with self._lock:
+            self._in_flight[endpoint] = self._in_flight.get(endpoint, 1) - 1
+            hist = self._request_duration.get((endpoint, method))
+            if hist is None:
+                hist = self._request_duration[(endpoint, method)] = _Histogram(DURATION_BUCKETS)
+            hist.observe(elapsed)
+            key = (endpoint, method, str(status))
+            self._requests_total[key] = self._requests_total.get(key, 0) + 1
+            qhist = self._request_queries.get(endpoint)
+            if qhist is None:
+                qhist = self._request_queries[endpoint] = _Histogram(QUERY_BUCKETS)
+            qhist.observe(queries)
+            self._queries_total[endpoint] = self._queries_total.get(endpoint, 0) + queries
+
+    # --------------------------------------------------------------------------
+    # 调度任务
+    # --------------------------------------------------------------------------
+    def _on_job_submitted(self, ev):
+        now = time.perf_counter()
+        with self._lock:
+            for run_time in ev.scheduled_run_times:
+                self._job_starts[(ev.job_id, run_time)] = now
+            # 防止异常情况下 (任务丢失) 起始时间无限堆积
+            while len(self._job_starts) > 1000:
+                self._job_starts.pop(next(iter(self._job_starts)))
+
+    def _on_job_finished(self, ev):
+        with self._lock:
+            start = self._job_starts.pop((ev.job_id, ev.scheduled_run_time), None)
+            if start is not None:
+                hist = self._job_duration.get(ev.job_id)
+                if hist is None:
+                    hist = self._job_duration[ev.job_id] = _Histogram(DURATION_BUCKETS)
+                hist.observe(time.perf_counter() - start)
+            if ev.exception is not None:
+                self._job_failures[ev.job_id] = self._job_failures.get(ev.job_id, 0) + 1
+
+    # --------------------------------------------------------------------------
+    # 输出
+    # --------------------------------------------------------------------------
+    def endpoint_summary(self):
+        """按 endpoint 汇总请求数、SQL 条数与总耗时 (供压测脚本读取)。"""
+        summary = {}
+        with self._lock:
+            for (endpoint, _method), hist in self._request_duration.items():
+                item = summary.setdefault(endpoint, {"requests": 0, "seconds": 0.0, "queries": 0})
+                item["requests"] += hist.count
+                item["seconds"] += hist.sum
+            for endpoint, n in self._queries_total.items():
+                summary.setdefault(endpoint, {"requests": 0, "seconds": 0.0, "queries": 0})["queries"] = n
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._request_duration.clear()
+            self._request_queries.clear()
+            self._requests_total.clear()
+            self._queries_total.clear()
+
+    def render(self):
+        """生成 Prometheus 文本格式的全部指标。"""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            name = f"{_PREFIX}_http_request_duration_seconds"
+            header(name, "histogram", "Request latency by Flask endpoint.")
+            for (endpoint, method), hist in sorted(self._request_duration.items()):
+                lines.extend(hist.lines(name, [("endpoint", endpoint), ("method", method)]))
+
+            name = f"{_PREFIX}_http_requests_total"
+            header(name, "counter", "Requests by Flask endpoint and status code.")
+            for (endpoint, method, status), n in sorted(self._requests_total.items()):
+                lines.append(f"{name}{_labels([('endpoint', endpoint), ('method', method), ('status', status)])} {n}")
+
+            name = f"{_PREFIX}_http_requests_in_flight"
+            header(name, "gauge", "Requests currently being handled.")
+            for endpoint, n in sorted(self._in_flight.items()):
+                lines.append(f"{name}{_labels([('endpoint', endpoint)])} {n}")
+
+            name = f"{_PREFIX}_http_request_db_queries"
+            header(name, "histogram", "SQL statements executed per request.")
+            for endpoint, hist in sorted(self._request_queries.items()):
+                lines.extend(hist.lines(name, [("endpoint", endpoint)]))
+
+            name = f"{_PREFIX}_db_queries_total"
+            header(name, "counter", "SQL statements executed inside requests.")
+            for endpoint, n in sorted(self._queries_total.items()):
+                lines.append(f"{name}{_labels([('endpoint', endpoint)])} {n}")
+
+            name = f"{_PREFIX}_scheduler_job_duration_seconds"
+            header(name, "histogram", "APScheduler job run time.")
+            for job_id, hist in sorted(self._job_duration.items()):
+                lines.extend(hist.lines(name, [("job", job_id)]))
+
+            name = f"{_PREFIX}_scheduler_job_failures_total"
+            header(name, "counter", "APScheduler job runs that raised.")
+            for job_id, n in sorted(self._job_failures.items()):
+                lines.append(f"{name}{_labels([('job', job_id)])} {n}")
+
+        from .write_behind import write_buffer
+        wb = write_buffer.stats()
+        name = f"{_PREFIX}_write_behind_backlog"
+        header(name, "gauge", "Rows waiting in the write-behind buffer.")
+        lines.append(f"{name} {wb['backlog']}")
+        name = f"{_PREFIX}_write_behind_flushed_total"
+        header(name, "counter", "Rows flushed by the write-behind buffer.")
+        lines.append(f"{name} {wb['flushed']}")
+        name = f"{_PREFIX}_write_behind_failed_rows_total"
+        header(name, "counter", "Rows dropped by the write-behind buffer after repeated insert failures.")
+        lines.append(f"{name} {wb['failed_rows']}")
+
+        from .playback_state import playback_store
+        pb = playback_store.stats()
+        name = f"{_PREFIX}_playback_updates_total"
+        header(name, "counter", "Playback control updates accepted into the debounced state.")
+        lines.append(f"{name} {pb['updates']}")
+        name = f"{_PREFIX}_playback_writes_total"
+        header(name, "counter", "Debounced playback state writes to the room table.")
+        lines.append(f"{name} {pb['writes']}")
+        name = f"{_PREFIX}_playback_pending_rooms"
+        header(name, "gauge", "Rooms whose latest playback state is not yet persisted.")
+        lines.append(f"{name} {pb['pending']}")
+
+        from .track_prefetch import track_prefetcher
+        tp = track_prefetcher.stats()
+        for key, help_text in (
+            ("warmed", "Music files read ahead into the page cache."),
+            ("warmed_bytes", "Bytes of music files read ahead into the page cache."),
+            ("missing", "Next-track files that were not found on this host."),
+        ):
+            name = f"{_PREFIX}_track_prefetch_{key}_total"
+            header(name, "counter", help_text)
+            lines.append(f"{name} {tp[key]}")
+        name = f"{_PREFIX}_track_prefetch_next_lookups_total"
+        header(name, "counter", "Next-track lookups, by whether the per-process cache answered them.")
+        lines.append(f'{name}{{result="hit"}} {tp["next_hits"]}')
+        lines.append(f'{name}{{result="miss"}} {tp["next_misses"]}')
+
+        from .rate_limit import rate_limiter
+        rl = rate_limiter.stats()
+        for key, kind, help_text in (
+            ("limited", "counter", "Requests rejected with 429 because the token bucket was empty."),
+            ("overloaded", "counter", "Requests rejected with 429 because too many were already in flight."),
+            ("inflight", "gauge", "Rate-limited requests currently being handled."),
+        ):
+            name = f"{_PREFIX}_rate_limit_{key}" + ("_total" if kind == "counter" else "")
+            header(name, kind, help_text)
+            for limit_name, item in sorted(rl.items()):
+                lines.append(f"{name}{_labels([('limit', limit_name)])} {item[key]}")
+
+        from .room_events import room_events
+        ev = room_events.stats()
+        for key, help_text in (
+            ("published", "Room events published by this process."),
+            ("received", "Room events received from other processes."),
+            ("handler_errors", "Room event handlers that raised."),
+        ):
+            name = f"{_PREFIX}_room_events_{key}_total"
+            header(name, "counter", help_text)
+            lines.append(f'{name}{{bus="{ev["bus"]}"}} {ev[key]}')
+
+        from .db_pool import pool_snapshot
+        pools = pool_snapshot()
+        name = f"{_PREFIX}_db_pool_checkout_wait_seconds"
+        header(name, "histogram", "Time spent waiting for a pooled connection (incl. new connects).")
+        for bind, item in pools.items():
+            lines.extend(item["wait"].lines(name, [("bind", bind)]))
+        for key, kind, help_text in (
+            ("checked_out", "gauge", "Connections currently checked out."),
+            ("size", "gauge", "Configured pool size."),
+            ("overflow", "gauge", "Overflow connections currently open beyond pool_size."),
+            ("saturation", "gauge", "Checked-out connections / (pool_size + max_overflow)."),
+            ("checkouts", "counter", "Connection checkouts."),
+            ("overflow_checkouts", "counter", "Checkouts served by an overflow connection."),
+            ("timeouts", "counter", "Checkouts that timed out waiting for a connection."),
+            ("disconnects", "counter", "Errors detected as a dropped database connection."),
+        ):
+            name = f"{_PREFIX}_db_pool_{key}" + ("_total" if kind == "counter" else "")
+            header(name, kind, help_text)
+            for bind, item in pools.items():
+                if key in item:
+                    lines.append(f"{name}{_labels([('bind', bind)])} {_fmt(item[key])}")
+
+        name = f"{_PREFIX}_process_start_time_seconds"
+        header(name, "gauge", "Start time of the process since unix epoch.")
+        lines.append(f"{name} {_fmt(self.started_at)}")
+        return "\n".join(lines) + "\n"
+
+    def _metrics_view(self):
+        # 配置了 METRICS_TOKEN 时要求 Authorization: Bearer <token>
+        if self.token and request.headers.get("Authorization") != f"Bearer {self.token}":
+            abort(403)
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "_metrics_queries" in g:
+        g._metrics_queries += 1
+
+
+metrics = Metrics()
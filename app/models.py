@@ -67,6 +67,11 @@ class Room(TimestampMixin, db.Model):
     current_track_name = db.Column(db.String(255), nullable=True)
     current_track_file = db.Column(db.String(255), nullable=True)
     current_position = db.Column(db.Float, default=0.0)
+    # current_position 对应的服务器时间 (Unix 秒，毫秒精度)，播放同步的锚点
+    position_at = db.Column(db.Float, nullable=True)
+    # 歌单版本号 (每次歌单变更 +1)；版本早于 playlist_floor 的客户端需重新获取完整歌单 (见 playlist_store.py)
+    playlist_version = db.Column(db.Integer, nullable=False, default=0)
+    playlist_floor = db.Column(db.Integer, nullable=False, default=0)
 
     owner = db.relationship("User", backref="rooms")
     members = db.relationship("RoomMember", backref="room", lazy=True)
@@ -79,11 +84,15 @@ class RoomPlaylist(TimestampMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.Integer, db.ForeignKey("room.id"), nullable=False)
     music_id = db.Column(db.Integer, db.ForeignKey("musics.id"), nullable=False)
+    # 排序键 (可插入到任意两首之间) 与最后一次新增/移动时的房间歌单版本
+    position = db.Column(db.Float, nullable=False, default=0.0)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
     music = db.relationship("Music")
 
 
 class RoomMessage(TimestampMixin, db.Model):
+    """旧版消息表，仅保留历史数据；新消息写入 RoomChatEvent。"""
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.Integer, db.ForeignKey("room.id"), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -93,11 +102,27 @@ class RoomMessage(TimestampMixin, db.Model):
     author = db.relationship("User")
 
 
+class RoomChatEvent(db.Model):
+    """只追加的聊天事件表，作者信息在写入时冗余保存。"""
+    __tablename__ = "room_chat_event"
+
+    room_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    author_name = db.Column(db.String(32), nullable=False)
+    author_avatar = db.Column(db.String(256), nullable=True)
+    kind = db.Column(db.SmallInteger, default=0)  # 0 聊天 / 1 系统提示
+    content = db.Column(db.String(500), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class RoomMember(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.Integer, db.ForeignKey("room.id"), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 最近一次开启访问会话的时间，用于参与记录去重
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     __table_args__ = (
         db.UniqueConstraint("room_id", "user_id", name="uniq_room_member"),
@@ -0,0 +1,245 @@
+# app/playback_state.py
+# ==============================================================================
+# 模块名称：播放状态防抖层
+# 描述：房主拖动进度条、连续点击播放/暂停时，toggle_playback 每秒可能收到很多次请求。
+#       这里把房间的最新播放状态保存在进程内，读取 (room_state) 直接叠加内存中的状态，
+#       写回 room 表则做防抖：
+#         - 普通的 播放/暂停/拖动：同一房间至多每 PLAYBACK_PERSIST_SECONDS 写一次，只写最后的状态
+#         - 重要变化 (切歌、停止)：尽快写回，但同一房间两次写入之间仍至少间隔 PLAYBACK_MIN_WRITE_SECONDS
+#       因此无论控制请求多频繁，每个房间的 UPDATE 次数都有上限，也不再与听众轮询的 SELECT 抢行锁。
+#       写回语句带 position_at 条件，较旧的状态 (如其他进程稍晚写回的) 不会覆盖较新的状态。
+#       多 worker 部署时，各进程经房间事件总线 (playback 事件) 同步内存中的状态。
+# ==============================================================================
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import text
+
+from . import db
+from .workers import BackgroundWorker, register_shutdown
+
+# 播放状态字段 (与 room 表列名一致)
+PLAYBACK_FIELDS = ("playback_status", "current_track_name", "current_track_file", "current_position", "position_at")
+
+PERSIST_SQL = """
+    UPDATE room
+    SET playback_status = :playback_status,
+        current_track_name = :current_track_name,
+        current_track_file = :current_track_file,
+        current_position = :current_position,
+        position_at = :position_at,
+        updated_at = :updated_at
+    WHERE id = :room_id AND (position_at IS NULL OR position_at <= :position_at)
+"""
+
+
+class PlaybackView:
+    """room 行 + 内存中较新的播放状态，属性访问方式与 Room 相同 (供 room_state_payload 使用)。"""
+
+    def __init__(self, room, state):
+        self._room = room
+        self._state = state
+
+    def __getattr__(self, name):
+        if name in self._state:
+            return self._state[name]
+        return getattr(self._room, name)
+
+
+class _Entry:
+    __slots__ = ("state", "dirty", "urgent", "last_write", "updates")
+
+    def __init__(self, state):
+        self.state = state
+        self.dirty = False
+        self.urgent = False
+        self.last_write = 0.0
+        self.updates = 0
+
+
+class PlaybackStateStore:
+    """进程内的房间播放状态，后台线程按房间限频写回数据库。"""
+
+    def __init__(self):
+        self._app = None
+        self._rooms = OrderedDict()  # room_id -> _Entry
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = BackgroundWorker("playback-state", self.flush, interval=self._next_wait)
+
+        self.enabled = True
+        self.persist_seconds = 1.0
+        self.min_write_seconds = 0.25
+        self.max_rooms = 5000
+
+        self._stats = {"updates": 0, "writes": 0, "coalesced": 0, "failed_writes": 0}
+
+    def init_app(self, app):
+        from .room_events import room_events
+
+        self._app = app
+        self.enabled = app.config.get("PLAYBACK_DEBOUNCE_ENABLED", True)
+        self.persist_seconds = app.config.get("PLAYBACK_PERSIST_SECONDS", 1.0)
+        self.min_write_seconds = app.config.get("PLAYBACK_MIN_WRITE_SECONDS", 0.25)
+        self.max_rooms = app.config.get("PLAYBACK_STATE_MAX_ROOMS", 5000)
+        app.extensions["playback_state"] = self
+        room_events.subscribe(self._on_room_event, kinds=("playback", "room"))
+        register_shutdown(self.shutdown)
+
+    # --------------------------------------------------------------------------
+    # 读写
+    # --------------------------------------------------------------------------
+    def view(self, room):
+        """返回叠加了内存状态的 room (内存中没有或不比数据库新时直接返回 room)。"""
+        with self._lock:
+            entry = self._rooms.get(room.id)
+            state = dict(entry.state) if entry else None
+        if not state or (room.position_at and (state["position_at"] or 0) < room.position_at):
+            return room
+        return PlaybackView(room, state)
+
+    def update(self, room_id, state, urgent=False):
+        """记录房间的新播放状态 (state 包含 PLAYBACK_FIELDS 全部字段)。urgent=True 表示切歌/停止等重要变化。"""
+        state = {field: state[field] for field in PLAYBACK_FIELDS}
+        state["updated_at"] = datetime.utcnow()
+        with self._lock:
+            entry = self._rooms.get(room_id)
+            if entry is None:
+                entry = self._rooms[room_id] = _Entry(state)
+            else:
+                if entry.dirty:
+                    self._stats["coalesced"] += 1
+                entry.state = state
+            entry.dirty = True
+            entry.urgent = entry.urgent or urgent
+            entry.updates += 1
+            self._stats["updates"] += 1
+            self._rooms.move_to_end(room_id)
+            self._evict()
+
+        if not self.enabled:
+            # 关闭防抖 (如测试环境) 时同步写回
+            self.flush(force=True)
+            return
+        self._worker.start()
+        if urgent:
+            self._worker.wake()
+
+    def _apply_remote(self, room_id, state):
+        """其他进程发布的播放状态：只更新内存，由发布方负责写回。"""
+        with self._lock:
+            entry = self._rooms.get(room_id)
+            if entry is not None and (entry.state.get("position_at") or 0) >= (state.get("position_at") or 0):
+                return
+            if entry is None:
+                entry = self._rooms[room_id] = _Entry(state)
+            else:
+                entry.state = state
+            self._rooms.move_to_end(room_id)
+            self._evict()
+
+    def _evict(self):
+        # 调用方持有锁；只淘汰已写回的房间
+        while len(self._rooms) > self.max_rooms:
+            for room_id, entry in self._rooms.items():
+                if not entry.dirty:
+                    del self._rooms[room_id]
+                    break
+            else:
+                return
+
+    def drop(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+    def _on_room_event(self, event):
+        from .room_events import ALL_ROOMS
+
+        data = event["data"] or {}
+        if event["kind"] == "playback":
+            if event["origin"] != _local_origin():
+                self._apply_remote(event["room_id"], {
+                    **{field: data.get(field) for field in PLAYBACK_FIELDS},
+                    "updated_at": datetime.utcnow(),
+                })
+        elif event["room_id"] == ALL_ROOMS:
+            with self._lock:
+                self._rooms.clear()
+        else:
+            # 房间开关/删除直接改写了 room 表，丢弃内存状态
+            self.drop(event["room_id"])
+
+    # --------------------------------------------------------------------------
+    # 写回
+    # --------------------------------------------------------------------------
+    def flush(self, force=False):
+        """写回到期的房间 (force=True 时写回全部未写回的房间)，返回写入的房间数。"""
+        with self._flush_lock:
+            now = time.monotonic()
+            batch = []
+            with self._lock:
+                for room_id, entry in self._rooms.items():
+                    if not entry.dirty:
+                        continue
+                    since = now - entry.last_write
+                    if force or since >= self.persist_seconds or (entry.urgent and since >= self.min_write_seconds):
+                        batch.append((room_id, entry, dict(entry.state)))
+                        entry.dirty = entry.urgent = False
+                        entry.last_write = now
+            if not batch:
+                return 0
+
+            try:
+                with self._app.app_context():
+                    with db.engine.begin() as conn:
+                        for room_id, _, state in batch:
+                            conn.execute(text(PERSIST_SQL), {**state, "room_id": room_id})
+            except Exception as e:
+                # 写回失败：重新标记，下一轮重试 (期间到达的新状态不受影响)
+                with self._lock:
+                    for _, entry, _ in batch:
+                        entry.dirty = True
+                    self._stats["failed_writes"] += 1
+                print(f"[Playback] Persist failed: {e}")
+                return 0
+
+            with self._lock:
+                self._stats["writes"] += len(batch)
+            return len(batch)
+
+    def next_due(self):
+        """距离下一个房间到期还有多少秒 (没有待写回的房间时返回 None)。"""
+        now = time.monotonic()
+        with self._lock:
+            waits = [
+                (self.min_write_seconds if entry.urgent else self.persist_seconds) - (now - entry.last_write)
+                for entry in self._rooms.values() if entry.dirty
+            ]
+        return max(min(waits), 0.0) if waits else None
+
+    def _next_wait(self):
+        due = self.next_due()
+        return self.persist_seconds if due is None else due
+
+    def shutdown(self):
+        self._worker.stop(timeout=self.persist_seconds + 5)
+        if self._app is not None:
+            self.flush(force=True)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["rooms"] = len(self._rooms)
+            data["pending"] = sum(1 for entry in self._rooms.values() if entry.dirty)
+        return data
+
+
+def _local_origin():
+    from .room_events import room_events
+
+    return room_events.bus.origin
+
+
+playback_store = PlaybackStateStore()
@@ -0,0 +1,194 @@
+# app/playlist_store.py
+# ==============================================================================
+# 模块名称：房间歌单
+# 描述：room_playlist 按 position 排序 (浮点数，相邻两首默认间隔 POSITION_GAP)：
+#         - 追加：position 从当前最大值起依次 + POSITION_GAP，多首歌只执行一条多行 INSERT
+#         - 移动：取目标前后两首的中点，只更新被移动的一行；
+#           间隔小于 MIN_POSITION_GAP 时整张歌单重新编号 (极少发生)
+#       room.playlist_version 为房间歌单的版本号，每次变更 +1，变更涉及的行记下 version = 新版本号。
+#       先更新 room 行再改歌单，同一房间的歌单写操作因此按 room 行锁串行，版本号不会交错。
+#       客户端带上已有的版本 (playlist_since) 即可只取之后新增/移动过的行 (playlist_items)。
+#       删除不保留墓碑：删除时把 room.playlist_floor 设为新版本号，版本早于 floor 的客户端改为获取完整歌单。
+#       这里的函数只执行语句，由调用方提交事务。
+# ==============================================================================
+from datetime import datetime
+
+from sqlalchemy import bindparam, text
+
+from . import db
+
+POSITION_GAP = 1024.0
+MIN_POSITION_GAP = 1e-6
+INSERT_BATCH_SIZE = 500  # 一条多行 INSERT 最多包含的行数
+
+BUMP_VERSION_SQL = "UPDATE room SET playlist_version = playlist_version + 1 WHERE id = :room_id"
+
+# 删除：版本号 +1 并把 floor 抬到新版本 (两处赋值都只引用旧的 playlist_version，MySQL / SQLite 结果一致)
+BUMP_FLOOR_SQL = """
+    UPDATE room
+    SET playlist_floor = playlist_version + 1,
+        playlist_version = playlist_version + 1
+    WHERE id IN :room_ids
+"""
+
+PLAYLIST_ITEMS_SQL = """
+    SELECT rp.id, m.id AS music_id, m.title, rp.position
+    FROM room_playlist rp
+    JOIN musics m ON m.id = rp.music_id
+    WHERE rp.room_id = :room_id {since_filter}
+    ORDER BY rp.position ASC, rp.id ASC
+"""
+
+
+def _bump(room_id):
+    db.session.execute(text(BUMP_VERSION_SQL), {"room_id": room_id})
+    return db.session.execute(
+        text("SELECT playlist_version FROM room WHERE id = :room_id"), {"room_id": room_id}
+    ).scalar()
+
+
+def _bump_floor(room_ids):
+    db.session.execute(text(BUMP_FLOOR_SQL).bindparams(bindparam("room_ids", expanding=True)),
+                       {"room_ids": list(room_ids)})
+
+
+def _position_of(room_id, item_id):
+    return db.session.execute(
+        text("SELECT position FROM room_playlist WHERE id = :item_id AND room_id = :room_id"),
+        {"item_id": item_id, "room_id": room_id},
+    ).scalar()
+
+
+# ==============================================================================
+# 写入
+# ==============================================================================
+def add_tracks(room_id, music_ids):
+    """按顺序追加到歌单末尾，返回新版本号 (music_ids 为空时返回 None)。"""
+    music_ids = [int(music_id) for music_id in music_ids]
+    if not music_ids:
+        return None
+    version = _bump(room_id)
+    last = db.session.execute(
+        text("SELECT MAX(position) FROM room_playlist WHERE room_id = :room_id"), {"room_id": room_id}
+    ).scalar() or 0.0
+
+    now = datetime.utcnow()
+    for start in range(0, len(music_ids), INSERT_BATCH_SIZE):
+        chunk = music_ids[start:start + INSERT_BATCH_SIZE]
+        params = {"room_id": room_id, "version": version, "now": now}
+        values = []
+        for i, music_id in enumerate(chunk):
+            params[f"mid{i}"] = music_id
+            params[f"pos{i}"] = last + POSITION_GAP * (start + i + 1)
+            values.append(f"(:room_id, :mid{i}, :pos{i}, :version, :now)")
+        db.session.execute(text(
+            "INSERT INTO room_playlist (room_id, music_id, position, version, created_at) VALUES "
+            + ", ".join(values)
+        ), params)
+    return version
+
+
+def _renumber(room_id, version):
+    """间隔耗尽时按当前顺序重新编号。"""
+    ids = db.session.execute(
+        text("SELECT id FROM room_playlist WHERE room_id = :room_id ORDER BY position ASC, id ASC"),
+        {"room_id": room_id},
+    ).scalars().all()
+    db.session.execute(
+        text("UPDATE room_playlist SET position = :position, version = :version WHERE id = :id"),
+        [{"id": item_id, "position": POSITION_GAP * (i + 1), "version": version} for i, item_id in enumerate(ids)],
+    )
+    print(f"[Playlist] Renumbered {len(ids)} items in room {room_id}")
+
+
+def _target_position(room_id, item_id, before_id):
+    """移动后的 position；返回 None 表示两侧间隔已耗尽，需要先重新编号。"""
+    params = {"room_id": room_id, "item_id": item_id}
+    if before_id is None:
+        last = db.session.execute(
+            text("SELECT MAX(position) FROM room_playlist WHERE room_id = :room_id AND id <> :item_id"), params
+        ).scalar()
+        return (last or 0.0) + POSITION_GAP
+
+    upper = _position_of(room_id, before_id)
+    lower = db.session.execute(
+        text("""
+            SELECT MAX(position) FROM room_playlist
+            WHERE room_id = :room_id AND id <> :item_id AND id <> :before_id AND position <= :upper
+        """),
+        {**params, "before_id": before_id, "upper": upper},
+    ).scalar()
+    if lower is None:
+        return upper - POSITION_GAP
+    if upper - lower < MIN_POSITION_GAP:
+        return None
+    return (lower + upper) / 2
+
+
+def move_track(room_id, item_id, before_id=None):
+    """把 item_id 移到 before_id 之前 (before_id 为 None 时移到末尾)，只更新这一行。
+
+    返回新版本号；条目不属于该房间时返回 None。
+    """
+    if item_id == before_id or _position_of(room_id, item_id) is None:
+        return None
+    if before_id is not None and _position_of(room_id, before_id) is None:
+        return None
+
+    version = _bump(room_id)
+    position = _target_position(room_id, item_id, before_id)
+    if position is None:
+        _renumber(room_id, version)
+        position = _target_position(room_id, item_id, before_id)
+    db.session.execute(
+        text("UPDATE room_playlist SET position = :position, version = :version WHERE id = :item_id"),
+        {"position": position, "version": version, "item_id": item_id},
+    )
+    return version
+
+
+def remove_tracks(room_id, item_ids):
+    """删除歌单条目 (一条 DELETE，只删除属于该房间的行)，返回删除的行数。"""
+    item_ids = [int(item_id) for item_id in item_ids]
+    if not item_ids:
+        return 0
+    result = db.session.execute(
+        text("DELETE FROM room_playlist WHERE room_id = :room_id AND id IN :item_ids")
+        .bindparams(bindparam("item_ids", expanding=True)),
+        {"room_id": room_id, "item_ids": item_ids},
+    )
+    if result.rowcount:
+        _bump_floor([room_id])
+    return result.rowcount
+
+
+def remove_music(music_id):
+    """从所有房间的歌单中移除某首歌 (删除音乐时调用)，返回受影响的房间 id 列表。"""
+    room_ids = db.session.execute(
+        text("SELECT DISTINCT room_id FROM room_playlist WHERE music_id = :music_id"), {"music_id": music_id}
+    ).scalars().all()
+    if room_ids:
+        _bump_floor(room_ids)
+        db.session.execute(text("DELETE FROM room_playlist WHERE music_id = :music_id"), {"music_id": music_id})
+    return room_ids
+
+
+# ==============================================================================
+# 读取
+# ==============================================================================
+def can_send_delta(room, since):
+    """客户端版本 since 之后没有发生删除 (floor <= since) 时可以只发送变化的行。"""
+    version = room.playlist_version or 0
+    return since is not None and (room.playlist_floor or 0) <= since <= version
+
+
+def playlist_items(room, since=None):
+    """返回 (歌单条目, 是否为增量)。增量只包含 version > since 的条目 (新增或移动过)。"""
+    delta = can_send_delta(room, since)
+    params = {"room_id": room.id}
+    since_filter = ""
+    if delta:
+        since_filter = "AND rp.version > :since"
+        params["since"] = since
+    rows = db.session.execute(text(PLAYLIST_ITEMS_SQL.format(since_filter=since_filter)), params).mappings().all()
+    return [dict(row) for row in rows], delta
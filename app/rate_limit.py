@@ -0,0 +1,233 @@
+# app/rate_limit.py
+# ==============================================================================
+# 模块名称：限流与背压
+# 描述：聊天、播放控制、歌单等写接口按「限流类别 + 用户 + 房间」做令牌桶限流：
+#       每个桶以 rate 个/秒补充令牌，最多攒 burst 个，每次请求消耗一个；
+#       令牌不足时直接返回 429 + Retry-After，不再让请求排队等待数据库：
+#       fetch/JSON 请求返回 JSON；普通表单提交 flash 提示后跳回来源页 (状态码仍为 429)。
+#       类别可另设 concurrency：本进程内同时处理中的请求超过该值时同样返回 429 (背压)。
+#       限流状态存储 (RATE_LIMIT_STORAGE_URL)：
+#         - memory://：进程内，按 LRU 最多保留 RATE_LIMIT_MAX_KEYS 个桶 (被淘汰的桶视为已补满)
+#         - redis://...：多 worker / 多机共享 (需安装 redis)，令牌计算在 Lua 脚本中原子完成，
+#           使用 Redis 服务器时钟；Redis 不可用时放行并打印日志
+#       配置见 config.RATE_LIMITS。
+# ==============================================================================
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlparse
+
+from flask import current_app, flash, jsonify, request, url_for
+from flask_login import current_user
+from markupsafe import escape
+
+try:
+    import redis
+except ImportError:  # 可选依赖
+    redis = None
+
+
+class MemoryBackend:
+    """进程内令牌桶，按 LRU 限制桶的数量。"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, 上次更新时间)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """消耗一个令牌，返回 (是否放行, 需要等待的秒数)。"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                allowed, retry_after = True, 0.0
+                tokens -= 1
+            else:
+                allowed, retry_after = False, (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# KEYS[1] = 桶；ARGV = rate, burst。返回 {是否放行, 等待秒数}
+_REDIS_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry)}
+"""
+
+
+class RedisBackend:
+    """多进程共享的令牌桶 (桶在补满后自动过期，内存有界)。"""
+
+    def __init__(self, url, prefix="voice_share:rl:"):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_STORAGE_URL 使用 redis 时需要安装 redis (pip install redis)")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2)
+        self._script = self._client.register_script(_REDIS_TAKE_SCRIPT)
+
+    def take(self, key, rate, burst):
+        try:
+            allowed, retry_after = self._script(keys=[self.prefix + key], args=[rate, burst])
+        except Exception as e:
+            # 限流存储故障时放行，不影响正常使用
+            print(f"[RateLimit] Redis unavailable, allowing request: {e}")
+            return True, 0.0
+        return bool(allowed), float(retry_after)
+
+    def __len__(self):
+        return 0
+
+
+class RateLimiter:
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self.limits = {}
+        self.enabled = True
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {}  # 类别 -> {"allowed", "limited", "overloaded"}
+
+    def init_app(self, app):
+        self.enabled = app.config.get("RATE_LIMIT_ENABLED", True)
+        self.limits = app.config.get("RATE_LIMITS") or {}
+        url = app.config.get("RATE_LIMIT_STORAGE_URL") or "memory://"
+        if url.startswith("memory://"):
+            self.backend = MemoryBackend(app.config.get("RATE_LIMIT_MAX_KEYS", 10000))
+        elif url.startswith(("redis://", "rediss://", "unix://")):
+            self.backend = RedisBackend(url)
+        else:
+            raise ValueError(f"无效的 RATE_LIMIT_STORAGE_URL: {url!r}，可选 memory:// 或 redis://")
+        app.extensions["rate_limiter"] = self
+
+    def _count(self, name, field):
+        with self._lock:
+            stats = self._stats.setdefault(name, {"allowed": 0, "limited": 0, "overloaded": 0})
+            stats[field] += 1
+
+    def check(self, name, key):
+        """返回需要等待的秒数，0 表示放行。"""
+        limit = self.limits.get(name)
+        if not self.enabled or not limit:
+            return 0.0
+        allowed, retry_after = self.backend.take(f"{name}:{key}", limit["rate"], limit["burst"])
+        if not allowed:
+            self._count(name, "limited")
+            return retry_after
+        self._count(name, "allowed")
+        return 0.0
+
+    def enter(self, name):
+        """并发背压：返回 False 表示该类别在本进程内处理中的请求已满。"""
+        limit = self.limits.get(name) or {}
+        max_inflight = limit.get("concurrency")
+        with self._lock:
+            current = self._inflight.get(name, 0)
+            if self.enabled and max_inflight and current >= max_inflight:
+                stats = self._stats.setdefault(name, {"allowed": 0, "limited": 0, "overloaded": 0})
+                stats["overloaded"] += 1
+                return False
+            self._inflight[name] = current + 1
+        return True
+
+    def leave(self, name):
+        with self._lock:
+            self._inflight[name] = max(self._inflight.get(name, 1) - 1, 0)
+
+    def stats(self):
+        with self._lock:
+            data = {name: dict(stats) for name, stats in self._stats.items()}
+            for name, stats in data.items():
+                stats["inflight"] = self._inflight.get(name, 0)
+        return data
+
+
+rate_limiter = RateLimiter()
+
+
+def _wants_json():
+    """fetch / XHR / JSON 请求返回 JSON；浏览器表单提交 (Accept 优先 text/html) 走 flash + 跳转。"""
+    if request.is_json or request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        return True
+    return request.accept_mimetypes.best_match(["application/json", "text/html"]) == "application/json"
+
+
+def _back_url():
+    """来源页 (仅限本站)，否则回到控制台。"""
+    referrer = request.referrer
+    if referrer and urlparse(referrer).netloc == request.host:
+        return referrer
+    return url_for("main.dashboard")
+
+
+def _too_many_requests(retry_after):
+    seconds = max(1, math.ceil(retry_after))
+    message = f"操作太频繁，请 {seconds} 秒后再试"
+    if _wants_json():
+        response = jsonify({"status": "error", "message": message})
+    else:
+        # 浏览器不会跟随 429 的 Location，用 meta refresh 跳回来源页并显示提示
+        flash(message, "warning")
+        target = escape(_back_url())
+        response = current_app.response_class(
+            f'<!doctype html><meta http-equiv="refresh" content="0;url={target}">'
+            f'<p>{message}，<a href="{target}">返回</a></p>',
+            mimetype="text/html",
+        )
+        response.headers["Location"] = _back_url()
+    response.status_code = 429
+    response.headers["Retry-After"] = str(seconds)
+    return response
+
+
+def rate_limit(name):
+    """视图装饰器 (放在 @login_required 之后)：只限制非 GET 请求，桶按 用户 + 房间号 (如有) 划分。"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in ("GET", "HEAD", "OPTIONS"):
+                return view(*args, **kwargs)
+
+            user_key = current_user.get_id() if current_user.is_authenticated else request.remote_addr
+            key = f"{user_key}:{kwargs.get('code', '-')}"
+            retry_after = rate_limiter.check(name, key)
+            if retry_after:
+                return _too_many_requests(retry_after)
+
+            if not rate_limiter.enter(name):
+                return _too_many_requests(current_app.config.get("RATE_LIMIT_OVERLOAD_RETRY_SECONDS", 1))
+            try:
+                return view(*args, **kwargs)
+            finally:
+                rate_limiter.leave(name)
+
+        return wrapper
+
+    return decorator
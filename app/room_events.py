@@ -0,0 +1,380 @@
+# app/room_events.py
+# ==============================================================================
+# 模块名称：房间事件总线
+# 描述：房间内的变化 (聊天消息、播放控制、歌单、成员进出、房间开关/删除) 由路由在事务提交后
+#       publish 一次，每个 worker 进程内的订阅者 (聊天环形缓冲、推送服务等) 各自收到一份。
+#       通过 ROOM_EVENT_BUS 选择实现：
+#         - local：进程内直接分发，单进程部署使用
+#         - database：多进程部署使用，只依赖现有数据库。发布时本进程立即分发，
+#           同时放入发件箱由后台线程用多行 INSERT 批量写入 room_event 表
+#           (同一房间积压的多条 playback 事件只写最后一条)；
+#           同一线程按 ROOM_EVENT_POLL_SECONDS 增量读取 (id > 上次位置) 其他进程发布的事件并分发。
+#           自增 id 的提交顺序可能与分配顺序不同，读取时跳过的 id 会在 ROOM_EVENT_GAP_SECONDS 内
+#           用 id IN (...) 单独重新检查，避免并发提交时漏掉事件 (增量读取始终从已读到的最大 id 之后开始)。room_event 只保留 ROOM_EVENT_RETENTION_MINUTES。
+#       ASGI 推送服务 (asgi_sidecar.py) 用 EventCursor 以同样的方式读取 room_event。
+# ==============================================================================
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, text
+
+from .dialect import batched_delete_sql
+from .workers import BackgroundWorker, register_shutdown
+
+KINDS = ("message", "playback", "playlist", "membership", "room")
+
+# room_id 为 ALL_ROOMS 的事件作用于全部房间 (如数据恢复后清空缓存)
+ALL_ROOMS = 0
+
+# 单次读取发现的空洞过大 (如自增步长变化) 时不再逐个等待
+MAX_TRACKED_GAP = 1000
+
+
+def make_event(room_id, kind, data=None, origin=None, event_id=None):
+    if kind not in KINDS:
+        raise ValueError(f"未知的房间事件类型: {kind}，可选 {', '.join(KINDS)}")
+    return {"id": event_id, "room_id": room_id, "kind": kind, "data": data, "origin": origin}
+
+
+class EventCursor:
+    """room_event 的增量读取位置，记录尚未出现的 id (可能是还没提交的事务)。"""
+
+    def __init__(self, last_id=0, gap_seconds=5.0):
+        self.last_id = last_id
+        self.gap_seconds = gap_seconds
+        self._gaps = {}  # id -> 发现时间
+
+    def floor(self):
+        """增量查询的起点：id > floor。"""
+        return self.last_id
+
+    def pending(self, batch):
+        """尚未出现的 id，每 batch 个一组 (用于 GAP_EVENTS_QUERY)。"""
+        now = time.monotonic()
+        # 超时仍未出现的 id 视为已回滚
+        self._gaps = {i: t for i, t in self._gaps.items() if now - t < self.gap_seconds}
+        ids = sorted(self._gaps)
+        return [ids[i:i + batch] for i in range(0, len(ids), batch)]
+
+    def accept(self, rows):
+        """rows 为按 id 升序的 (id, ...) 行，返回其中尚未处理过的行。"""
+        now = time.monotonic()
+        fresh = []
+        for row in rows:
+            event_id = row[0]
+            if event_id <= self.last_id:
+                if self._gaps.pop(event_id, None) is None:
+                    continue  # 已处理过
+            else:
+                if event_id - self.last_id <= MAX_TRACKED_GAP:
+                    for missing in range(self.last_id + 1, event_id):
+                        self._gaps.setdefault(missing, now)
+                self.last_id = event_id
+            fresh.append(row)
+        return fresh
+
+
+def row_to_event(row):
+    """room_event 行 (id, room_id, kind, origin, payload) -> 事件 dict。"""
+    return make_event(row[1], row[2], json.loads(row[4]) if row[4] else None, origin=row[3], event_id=row[0])
+
+
+POLL_EVENTS_SQL = """
+    SELECT id, room_id, kind, origin, payload
+    FROM room_event
+    WHERE id > :floor
+    ORDER BY id
+    LIMIT :batch
+"""
+
+# 只重新检查空洞中的 id，不重读空洞之后已经处理过的行
+GAP_EVENTS_QUERY = text("""
+    SELECT id, room_id, kind, origin, payload
+    FROM room_event
+    WHERE id IN :ids
+    ORDER BY id
+""").bindparams(bindparam("ids", expanding=True))
+
+
+class LocalEventBus:
+    """进程内事件总线：publish 时同步调用订阅者。"""
+
+    name = "local"
+
+    def __init__(self):
+        self._origin = None
+        self._origin_pid = None
+        self._handlers = []
+        self._lock = threading.Lock()
+        self._stats = {"published": 0, "delivered": 0, "received": 0, "handler_errors": 0}
+
+    @property
+    def origin(self):
+        """发布方标识，用于在 room_event 中跳过本进程发布的事件 (fork 出的子进程各自生成)。"""
+        if self._origin_pid != os.getpid():
+            self._origin_pid = os.getpid()
+            self._origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        return self._origin
+
+    def init_app(self, app):
+        pass
+
+    def subscribe(self, handler, kinds=None):
+        """handler(event)；kinds 为 None 时接收全部类型。重复登记同一个 handler 只保留一份。"""
+        self._handlers = [(k, h) for k, h in self._handlers if h != handler]
+        self._handlers.append((frozenset(kinds) if kinds else None, handler))
+
+    def publish(self, room_id, kind, data=None):
+        """在事务提交之后调用。"""
+        event = make_event(room_id, kind, data, origin=self.origin)
+        with self._lock:
+            self._stats["published"] += 1
+        self._dispatch(event)
+        self._forward(event)
+        return event
+
+    def _forward(self, event):
+        pass
+
+    def _dispatch(self, event):
+        for kinds, handler in self._handlers:
+            if kinds is not None and event["kind"] not in kinds:
+                continue
+            try:
+                handler(event)
+            except Exception as e:
+                # 单个订阅者出错不影响其他订阅者与发布方
+                with self._lock:
+                    self._stats["handler_errors"] += 1
+                print(f"[RoomEvents] Handler {getattr(handler, '__name__', handler)} failed: {e}")
+        with self._lock:
+            self._stats["delivered"] += 1
+
+    def shutdown(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+        data["bus"] = self.name
+        return data
+
+
+class DatabaseEventBus(LocalEventBus):
+    """经 room_event 表在多个进程间转发事件 (批量写入 + 增量轮询)。"""
+
+    name = "database"
+
+    def __init__(self):
+        super().__init__()
+        self._app = None
+        self._outbox = deque()
+        self._engine = None
+        self._worker = BackgroundWorker(
+            "room-events",
+            lambda: self.pump(self._engine),
+            interval=lambda: self.poll_seconds,
+            setup=self._start,
+            context=lambda: self._app.app_context(),
+        )
+        self._cursor = None
+        self._last_trim = 0.0
+
+        self.poll_seconds = 0.5
+        self.batch_size = 500
+        self.max_backlog = 10000
+        self.retention_minutes = 60
+        self._stats.update({"written": 0, "dropped": 0, "failed_polls": 0, "backlog": 0})
+
+    def init_app(self, app):
+        self._app = app
+        self.poll_seconds = app.config.get("ROOM_EVENT_POLL_SECONDS", 0.5)
+        self.batch_size = app.config.get("ROOM_EVENT_BATCH_SIZE", 500)
+        self.max_backlog = app.config.get("ROOM_EVENT_MAX_BACKLOG", 10000)
+        self.retention_minutes = app.config.get("ROOM_EVENT_RETENTION_MINUTES", 60)
+        self._cursor = EventCursor(gap_seconds=app.config.get("ROOM_EVENT_GAP_SECONDS", 5.0))
+        register_shutdown(self.shutdown)
+
+    def _forward(self, event):
+        with self._lock:
+            self._outbox.append(event)
+            # 发件箱有界：数据库长时间不可用时丢弃最旧的事件
+            while len(self._outbox) > self.max_backlog:
+                self._outbox.popleft()
+                self._stats["dropped"] += 1
+            backlog = len(self._outbox)
+        self._worker.start()
+        if backlog >= self.batch_size:
+            self._worker.wake()
+
+    # --------------------------------------------------------------------------
+    # 后台线程：写发件箱 -> 读其他进程的事件 -> 定期清理
+    # --------------------------------------------------------------------------
+    def _start(self):
+        from . import db
+
+        self._engine = db.engine
+        try:
+            self._seek_to_end(self._engine)
+        except Exception as e:
+            print(f"[RoomEvents] Seek failed: {e}")
+
+    def _seek_to_end(self, engine):
+        # 新启动的进程只接收之后的事件，不重放历史
+        with engine.connect() as conn:
+            self._cursor.last_id = conn.execute(text("SELECT MAX(id) FROM room_event")).scalar() or 0
+
+    def pump(self, engine):
+        """执行一轮：写入发件箱、读取并分发其他进程的事件、按需清理过期事件。"""
+        self.flush(engine)
+        try:
+            with engine.connect() as conn:
+                for ids in self._cursor.pending(self.batch_size):
+                    self._receive(self._cursor.accept(conn.execute(GAP_EVENTS_QUERY, {"ids": ids}).all()))
+                while True:
+                    rows = conn.execute(
+                        text(POLL_EVENTS_SQL), {"floor": self._cursor.floor(), "batch": self.batch_size}
+                    ).all()
+                    fresh = self._cursor.accept(rows)
+                    self._receive(fresh)
+                    # 不足一批说明已读到末尾；整批都没有新行时也停止，不反复读取同一批
+                    if len(rows) < self.batch_size or not fresh:
+                        break
+                conn.rollback()
+        except Exception as e:
+            with self._lock:
+                self._stats["failed_polls"] += 1
+            print(f"[RoomEvents] Poll failed: {e}")
+
+        if time.monotonic() - self._last_trim > 60:
+            self._last_trim = time.monotonic()
+            self.trim(engine)
+
+    def _receive(self, rows):
+        for row in rows:
+            if row[3] != self.origin:
+                with self._lock:
+                    self._stats["received"] += 1
+                self._dispatch(row_to_event(row))
+
+    def flush(self, engine):
+        with self._lock:
+            batch = _coalesce(list(self._outbox))
+            self._outbox.clear()
+        if not batch:
+            return 0
+        now = datetime.utcnow()
+        try:
+            with engine.begin() as conn:
+                for i in range(0, len(batch), self.batch_size):
+                    sql, params = _build_event_insert(batch[i:i + self.batch_size], now)
+                    conn.execute(sql, params)
+        except Exception as e:
+            # 写入失败时放回队首，下一轮重试
+            with self._lock:
+                self._outbox.extendleft(reversed(batch))
+            print(f"[RoomEvents] Flush failed: {e}")
+            return 0
+        with self._lock:
+            self._stats["written"] += len(batch)
+        return len(batch)
+
+    def trim(self, engine):
+        cutoff = datetime.utcnow() - timedelta(minutes=self.retention_minutes)
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    batched_delete_sql(engine.dialect.name, "room_event", "created_at < :cutoff"),
+                    {"cutoff": cutoff, "batch": 5000},
+                )
+        except Exception as e:
+            print(f"[RoomEvents] Trim failed: {e}")
+
+    def shutdown(self):
+        self._worker.stop(timeout=self.poll_seconds + 5)
+        if self._app is not None:
+            from . import db
+
+            with self._app.app_context():
+                self.flush(db.engine)
+
+    def stats(self):
+        data = super().stats()
+        with self._lock:
+            data["backlog"] = len(self._outbox)
+        return data
+
+
+def _coalesce(events):
+    """同一房间的多条 playback 事件只需转发最后一条 (后者包含完整的播放状态)。"""
+    last_playback = {}
+    for index, event in enumerate(events):
+        if event["kind"] == "playback":
+            last_playback[event["room_id"]] = index
+    return [
+        event for index, event in enumerate(events)
+        if event["kind"] != "playback" or last_playback[event["room_id"]] == index
+    ]
+
+
+def _build_event_insert(events, now):
+    """多行 INSERT INTO room_event ... VALUES (...), (...)。"""
+    params = {"created_at": now}
+    values_sql = []
+    for i, event in enumerate(events):
+        params.update({
+            f"room_id_{i}": event["room_id"],
+            f"kind_{i}": event["kind"],
+            f"origin_{i}": event["origin"],
+            f"payload_{i}": json.dumps(event["data"], ensure_ascii=False) if event["data"] is not None else None,
+        })
+        values_sql.append(f"(:room_id_{i}, :kind_{i}, :origin_{i}, :payload_{i}, :created_at)")
+    sql = text(
+        f"INSERT INTO room_event (room_id, kind, origin, payload, created_at) VALUES {', '.join(values_sql)}"
+    )
+    return sql, params
+
+
+BUSES = {"local": LocalEventBus, "database": DatabaseEventBus}
+
+
+class RoomEvents:
+    """全局入口：按配置创建总线实现，路由与订阅方只使用 publish / subscribe。"""
+
+    def __init__(self):
+        self.bus = LocalEventBus()
+
+    def init_app(self, app):
+        name = app.config.get("ROOM_EVENT_BUS", "local")
+        if name not in BUSES:
+            raise ValueError(f"无效的 ROOM_EVENT_BUS: {name!r}，可选 {', '.join(BUSES)}")
+        if self.bus.name != name:
+            handlers = self.bus._handlers
+            self.bus = BUSES[name]()
+            self.bus._handlers = handlers
+        self.bus.init_app(app)
+        app.extensions["room_events"] = self
+
+        if isinstance(self.bus, DatabaseEventBus):
+            # 每个 worker 收到第一个请求时启动后台线程 (预加载后 fork 的子进程不会继承线程)
+            @app.before_request
+            def _ensure_room_event_worker():
+                self.bus._worker.start()
+
+    def subscribe(self, handler, kinds=None):
+        self.bus.subscribe(handler, kinds)
+
+    def publish(self, room_id, kind, data=None):
+        return self.bus.publish(room_id, kind, data)
+
+    def stats(self):
+        return self.bus.stats()
+
+
+room_events = RoomEvents()
@@ -0,0 +1,69 @@
+# app/room_state.py
+# ==============================================================================
+# 模块名称：房间状态格式
+# 描述：/rooms/<code>/state 的返回结构。Flask 路由 (routes.room_state) 与
+#       ASGI 轮询服务 (asgi_sidecar.py) 共用，保证两边返回的字段完全一致。
+#       room 可以是 ORM 对象，也可以是带同名字段的查询结果行。
+#
+#       播放同步协议 (时间均为服务器时钟的 Unix 秒，带小数)：
+#         - anchor_position / position_at：锚点，position_at 时刻进度为 anchor_position，
+#           由 toggle_playback 在服务器上确定 (不受请求排队与网络延迟影响)
+#         - playback_rate：播放中为 1.0，暂停为 0.0
+#         - server_time：生成响应的时刻，客户端据此按 NTP 方式估计本地时钟偏差，
+#           再用 anchor_position + playback_rate * (服务器当前时间 - position_at) 推算进度
+#         - current_position：server_time 时刻的进度 (兼容旧客户端)
+#
+#       歌单：playlist_version 为房间歌单版本；playlist_delta 为 true 时 playlist 只包含
+#       客户端版本之后新增/移动过的条目 (按 position 合并)，否则为完整歌单 (见 playlist_store.py)。
+#       预取：next_track 为歌单中的下一首，prefetch_lead_seconds / prefetch_jitter_seconds 为预取窗口
+#       (见 track_prefetch.py)。
+# ==============================================================================
+import time
+from datetime import timezone
+
+
+def _epoch(dt):
+    """数据库中的 UTC naive datetime -> Unix 秒。"""
+    return dt.replace(tzinfo=timezone.utc).timestamp() if dt else None
+
+
+def position_anchor(room):
+    """返回 (anchor_position, position_at)。旧数据没有 position_at 时退回 updated_at (秒级精度)。"""
+    position_at = getattr(room, "position_at", None) or _epoch(room.updated_at)
+    return room.current_position or 0.0, position_at
+
+
+def playback_timing(room, now=None):
+    """随发送时刻变化的字段：server_time 与该时刻推算出的 current_position。"""
+    now = time.time() if now is None else now
+    anchor, position_at = position_anchor(room)
+    rate = 1.0 if room.playback_status == 'playing' else 0.0
+    position = anchor
+    if rate and position_at:
+        position += rate * max(now - position_at, 0.0)
+    return {
+        "current_position": position,
+        "anchor_position": anchor,
+        "position_at": position_at,
+        "playback_rate": rate,
+        "server_time": now,
+    }
+
+
+def room_state_payload(room, member_count, messages, playlist, playlist_delta=False, prefetch=None):
+    """messages 为聊天消息 (chat_store 格式)，playlist 为 [{"id", "music_id", "title", "position"}]，
+    prefetch 为 track_prefetcher.hint() 的返回值。"""
+    return {
+        "playback_status": room.playback_status,
+        "current_track_name": room.current_track_name,
+        "current_track_file": room.current_track_file,
+        **playback_timing(room),
+        "is_active": room.is_active,
+        "updated_at": room.updated_at.isoformat() if room.updated_at else None,
+        "messages": messages,
+        "playlist": playlist,
+        "playlist_version": room.playlist_version or 0,
+        "playlist_delta": playlist_delta,
+        **(prefetch or {"next_track": None}),
+        "member_count": member_count,
+    }
@@ -1,10 +1,11 @@
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from sqlalchemy import text
-from .database_views import get_hot_rooms_data
+from sqlalchemy import bindparam, text
 from flask import (
     Blueprint,
     abort,
+    current_app,
     flash,
     jsonify,
     redirect,
@@ -15,6 +16,17 @@ from flask import (
 from flask_login import current_user, login_required
 
 from . import db
+from .db_routing import replica_reads
+from .dialect import is_mysql
+from .room_state import playback_timing, room_state_payload
+from .state_encoding import state_response
+from .chat_store import (
+    KIND_SYSTEM,
+    MAX_CONTENT_LENGTH,
+    append_message,
+    delete_room_messages,
+    recent_messages,
+)
 from .forms import MusicUploadForm, ProfileForm, RoomCreateForm, RoomJoinForm
 from .models import (
     ListenRecord,
@@ -26,10 +38,32 @@ from .models import (
     RoomPlaylist,
     User,
 )
+from .playback_state import PLAYBACK_FIELDS, playback_store
+from .playlist_store import add_tracks, move_track, playlist_items, remove_music, remove_tracks
+from .rate_limit import rate_limit
+from .track_prefetch import track_prefetcher
+from .room_events import room_events
 from .utils import generate_room_code, generate_room_name, save_avatar, save_music
+from .write_behind import write_buffer
 
 main_bp = Blueprint("main", __name__)
 
+# 播放控制请求在途时间的补偿上限 (秒)，客户端时钟估计异常时不至于跳得太远
+MAX_CONTROL_LATENCY = 5.0
+
+
+# 首页热门房间 (读 v_room_stats 视图)。
+# 原先放在 database_views.py，移到这里后 web 进程不再需要加载数据中心模块
+def get_hot_rooms_data(limit=5):
+    sql = text("""
+        SELECT * FROM v_room_stats 
+        WHERE is_active = 1 
+        ORDER BY member_count DESC 
+        LIMIT :limit
+    """)
+    with replica_reads():
+        return db.session.execute(sql, {"limit": limit}).mappings().all()
+
 
 @main_bp.route("/")
 def index():
@@ -66,6 +100,7 @@ def dashboard():
 
 @main_bp.route("/profile", methods=["GET", "POST"])
 @login_required
+@rate_limit("account")
 def profile():
     if current_user.is_admin:
         abort(403)
@@ -101,6 +136,7 @@ def profile():
 
 @main_bp.route("/music", methods=["GET", "POST"])
 @login_required
+@rate_limit("account")
 def music():
     if current_user.is_admin:
         abort(403)
@@ -144,14 +180,14 @@ def music():
 
 @main_bp.route("/music/<int:music_id>/delete", methods=["POST"])
 @login_required
+@rate_limit("account")
 def delete_music(music_id):
     if current_user.is_admin:
         abort(403)
 
     # --- [开始修改] 改为原生 SQL DELETE ---
-    # 为了数据一致性，先删除关联的播放列表记录（如果数据库未设置级联删除）
-    sql_del_playlist = text("DELETE FROM room_playlist WHERE music_id = :mid")
-    db.session.execute(sql_del_playlist, {"mid": music_id})
+    # 为了数据一致性，先删除关联的播放列表记录（如果数据库未设置级联删除），并使相关房间的歌单增量失效
+    affected_rooms = remove_music(music_id)
 
     # 再删除音乐本身，且必须确保是当前用户的音乐
     sql_del_music = text("DELETE FROM musics WHERE id = :mid AND user_id = :uid")
@@ -162,6 +198,8 @@ def delete_music(music_id):
     # --- [结束修改] ---
 
     db.session.commit()
+    for room_id in affected_rooms:
+        room_events.publish(room_id, "playlist", {"action": "delete", "music_id": music_id})
     flash("音乐已删除", "info")
     return redirect(url_for("main.music"))
 
@@ -195,6 +233,7 @@ def _generate_unique_room_code():
 
 @main_bp.route("/rooms/create", methods=["POST"])
 @login_required
+@rate_limit("room")
 def create_room():
     if current_user.is_admin:
         abort(403)
@@ -250,6 +289,7 @@ def create_room():
 
 @main_bp.route("/rooms/join", methods=["POST"])
 @login_required
+@rate_limit("room")
 def join_room():
     if current_user.is_admin:
         abort(403)
@@ -269,26 +309,75 @@ def join_room():
     return redirect(url_for("main.room_detail", code=room.code))
 
 
-def _attach_member(room: Room, user: User, *, record_participation: bool = True):
+def _attach_member(room: Room, user: User):
+    """加入房间：一条 UPSERT 完成成员登记与会话续期。
+
+    uniq_room_member 上的 INSERT ... ON DUPLICATE KEY UPDATE (SQLite 下为 ON CONFLICT DO UPDATE)
+    只在会话窗口过期时才改写 last_seen_at，由这一条语句的结果区分三种情况：
+      - 新插入：写入进房消息 + 参与记录
+      - 会话续期：只写参与记录
+      - 窗口内重复进入/刷新 (如加入后跳转到房间页、双击、快速刷新)：不再产生任何写入
+    """
     if not room.is_active:
         return
     if room.owner_id == user.id:
         return
-    existing = RoomMember.query.filter_by(room_id=room.id, user_id=user.id).first()
-    created_now = False
-    if not existing:
-        membership = RoomMember(room_id=room.id, user_id=user.id)
-        db.session.add(membership)
-        created_now = True
-
-        # [新增] 插入进入房间的消息
-        join_msg = RoomMessage(room_id=room.id, user_id=user.id, content="进入了房间")
-        db.session.add(join_msg)
-
-    if record_participation or created_now:
-        record = RoomParticipationRecord(user_id=user.id, room_code=room.code)
-        db.session.add(record)
+
+    now = datetime.utcnow()
+    window_start = now - timedelta(minutes=current_app.config["ROOM_SESSION_WINDOW_MINUTES"])
+    params = {
+        "rid": room.id,
+        "uid": user.id,
+        "now": now,
+        "window_start": window_start,
+    }
+
+    if is_mysql():
+        # 重复键时执行 LAST_INSERT_ID(0)：按 MySQL 文档，语句中调用了 LAST_INSERT_ID(expr) 时
+        # 客户端得到的 insert id 即为 expr，因此 lastrowid 非 0 当且仅当新插入了一行；
+        # id + 0 不改变该行，是否改写只取决于 last_seen_at
+        upsert_sql = text("""
+            INSERT INTO room_member (room_id, user_id, joined_at, last_seen_at)
+            VALUES (:rid, :uid, :now, :now)
+            ON DUPLICATE KEY UPDATE
+                id = id + LAST_INSERT_ID(0),
+                last_seen_at = IF(last_seen_at IS NULL OR last_seen_at < :window_start,
+                                  VALUES(last_seen_at), last_seen_at)
+        """)
+        result = db.session.execute(upsert_sql, params)
+        created_now = bool(result.lastrowid)
+        # 改写了已有的行时影响行数为 2 (与是否开启 CLIENT_FOUND_ROWS 无关)
+        session_renewed = not created_now and result.rowcount == 2
+    else:
+        # SQLite：ON CONFLICT ... DO UPDATE WHERE 不满足条件时不返回行；
+        # 新插入的行 joined_at 与 last_seen_at 相同，续期的行 joined_at 更早
+        upsert_sql = text("""
+            INSERT INTO room_member (room_id, user_id, joined_at, last_seen_at)
+            VALUES (:rid, :uid, :now, :now)
+            ON CONFLICT (room_id, user_id) DO UPDATE
+                SET last_seen_at = excluded.last_seen_at
+                WHERE room_member.last_seen_at IS NULL OR room_member.last_seen_at < :window_start
+            RETURNING joined_at = last_seen_at
+        """)
+        row = db.session.execute(upsert_sql, params).fetchone()
+        created_now = row is not None and bool(row[0])
+        session_renewed = row is not None and not row[0]
+
+    join_msg = None
+    if created_now:
+        join_msg = append_message(room.id, user, "进入了房间", kind=KIND_SYSTEM)
+
     db.session.commit()
+    if join_msg:
+        room_events.publish(room.id, "membership", {"action": "join", "user_id": user.id, "message": join_msg})
+
+    # 参与记录只追加、无人同步读取，交给写后缓冲批量落库
+    if created_now or session_renewed:
+        write_buffer.enqueue("room_participation_record", {
+            "user_id": user.id,
+            "room_code": room.code,
+            "participated_at": now,
+        })
 
 
 @main_bp.route("/rooms/<code>")
@@ -301,10 +390,14 @@ def room_detail(code):
         flash("房间已关闭，无法进入", "error")
         return redirect(url_for("main.dashboard"))
     if room.owner_id != current_user.id:
-        _attach_member(room, current_user, record_participation=False)
+        _attach_member(room, current_user)
     member_count = RoomMember.query.filter_by(room_id=room.id).count() + 1
     # 获取房间播放列表
-    room_playlist = RoomPlaylist.query.filter_by(room_id=room.id).order_by(RoomPlaylist.created_at.asc()).all()
+    room_playlist = (
+        RoomPlaylist.query.filter_by(room_id=room.id)
+        .order_by(RoomPlaylist.position.asc(), RoomPlaylist.id.asc())
+        .all()
+    )
 
     # 获取用户自己的已审核音乐（用于添加到房间）
     my_approved_music = (
@@ -313,7 +406,8 @@ def room_detail(code):
         .all()
     )
 
-    messages = RoomMessage.query.filter_by(room_id=room.id).order_by(RoomMessage.created_at.asc()).all()
+    # 最近消息直接取自聊天环形缓冲
+    messages = recent_messages(room.id)
 
     return render_template(
         "room.html",
@@ -330,76 +424,68 @@ def room_detail(code):
 
 @main_bp.route("/rooms/<code>/playlist/add", methods=["POST"])
 @login_required
+@rate_limit("playlist")
 def add_to_playlist(code):
     room = Room.query.filter_by(code=code).first_or_404()
-    music_id = request.form.get("music_id")
+    # 支持一次点多首歌 (同名字段重复提交)，按提交顺序追加
+    music_ids = list(dict.fromkeys(request.form.getlist("music_id", type=int)))
 
-    if not music_id:
+    if not music_ids:
         flash("请选择音乐", "error")
         return redirect(url_for("main.room_detail", code=code))
 
-    music = Music.query.filter_by(id=music_id, user_id=current_user.id, status="approved").first()
-    if not music:
-        flash("音乐不存在或未审核通过", "error")
-        return redirect(url_for("main.room_detail", code=code))
-
     # 检查是否已在列表中（可选，这里允许重复添加）
     # existing = RoomPlaylist.query.filter_by(room_id=room.id, music_id=music.id).first()
 
-    # --- [开始修改] 改为原生 SQL INSERT ---
-    # 先验证音乐是否存在且属于当前用户且已过审（用 Select 验证）
-    check_sql = text("SELECT id, title FROM musics WHERE id=:mid AND user_id=:uid AND status='approved'")
-    res = db.session.execute(check_sql, {"mid": music_id, "uid": current_user.id}).fetchone()
+    # 一次验证全部音乐是否存在且属于当前用户且已过审
+    check_sql = text(
+        "SELECT id, title FROM musics WHERE id IN :mids AND user_id=:uid AND status='approved'"
+    ).bindparams(bindparam("mids", expanding=True))
+    titles = dict(db.session.execute(check_sql, {"mids": music_ids, "uid": current_user.id}).all())
 
-    if not res:
+    if len(titles) != len(music_ids):
         flash("音乐不存在或未审核通过", "error")
         return redirect(url_for("main.room_detail", code=code))
 
-    music_title = res[1]  # 获取歌名用于提示
-
-    # 插入播放列表
-    insert_sql = text("""
-        INSERT INTO room_playlist (room_id, music_id, created_at)
-        VALUES (:rid, :mid, :now)
-    """)
-    db.session.execute(insert_sql, {
-        "rid": room.id,  # 这里 room.id 还是可以从上面查询出来的 room 对象获取，或者也改成 SQL 查询
-        "mid": music_id,
-        "now": datetime.utcnow()
-    })
-    # --- [结束修改] ---
-
+    # 插入播放列表 (多首歌为一条多行 INSERT)
+    version = add_tracks(room.id, music_ids)
     db.session.commit()
-    flash(f"已将《{music_title}》添加到房间播放列表", "success")
+    room_events.publish(room.id, "playlist", {"action": "add", "music_ids": music_ids, "version": version})
+    if len(music_ids) == 1:
+        flash(f"已将《{titles[music_ids[0]]}》添加到房间播放列表", "success")
+    else:
+        flash(f"已将 {len(music_ids)} 首歌添加到房间播放列表", "success")
     return redirect(url_for("main.room_detail", code=code))
 
 
 @main_bp.route("/rooms/<code>/leave", methods=["POST"])
 @login_required
+@rate_limit("room")
 def leave_room(code):
     room = Room.query.filter_by(code=code).first_or_404()
     if room.owner_id == current_user.id:
         flash("房主无法直接退出，如需解散请关闭房间", "warning")
         return redirect(url_for("main.room_detail", code=code))
-    membership = RoomMember.query.filter_by(room_id=room.id, user_id=current_user.id).first()
-    if membership:
-        # ========================== [开始插入修改代码] ==========================
-        # 1. 在删除成员关系之前，先发送一条离开的消息
-        # 注意：content 内容可以自定义，前端会自动显示发送者名字
-        leave_msg = RoomMessage(room_id=room.id, user_id=current_user.id, content="离开了房间")
-        db.session.add(leave_msg)
-        # ========================== [结束插入修改代码] ==========================
-
-        db.session.delete(membership)
+    # 直接按唯一键删除成员关系，影响行数即可判断是否在房间中，省去一次 SELECT
+    result = db.session.execute(
+        text("DELETE FROM room_member WHERE room_id = :rid AND user_id = :uid"),
+        {"rid": room.id, "uid": current_user.id},
+    )
+    if result.rowcount:
+        # 成员关系删除成功后，发送一条离开的消息，前端会自动显示发送者名字
+        leave_msg = append_message(room.id, current_user, "离开了房间", kind=KIND_SYSTEM)
         db.session.commit()
+        room_events.publish(room.id, "membership", {"action": "leave", "user_id": current_user.id, "message": leave_msg})
         flash("你已退出房间，可随时再次通过房间号加入", "info")
     else:
+        db.session.rollback()
         flash("当前未在该房间中", "warning")
     return redirect(url_for("main.dashboard"))
 
 
 @main_bp.route("/rooms/<code>/availability", methods=["POST"])
 @login_required
+@rate_limit("room")
 def room_availability(code):
     # --- [开始修改] 改为原生 SQL UPDATE ---
     # 1. 确认房间存在且属于当前用户
@@ -418,7 +504,7 @@ def room_availability(code):
         # 关闭房间：设置 is_active=0, playback_status='paused'
         update_sql = text("""
             UPDATE room 
-            SET is_active = 0, playback_status = 'paused', updated_at = :now 
+            SET is_active = 0, playback_status = 'paused', position_at = :position_at, updated_at = :now 
             WHERE id = :rid
         """)
         message = "房间已关闭，成员将无法继续进入"
@@ -434,24 +520,31 @@ def room_availability(code):
         flash("未知操作", "error")
         return redirect(url_for("main.room_detail", code=code))
 
-    db.session.execute(update_sql, {"now": datetime.utcnow(), "rid": room_id})
+    # position_at 一并更新：防抖层中更早的播放状态不会再覆盖关闭操作
+    db.session.execute(update_sql, {"now": datetime.utcnow(), "position_at": time.time(), "rid": room_id})
     # --- [结束修改] ---
 
     db.session.commit()
+    room_events.publish(room_id, "room", {"action": action})
     flash(message, "success")
     return redirect(url_for("main.room_detail", code=code))
 
 @main_bp.route("/rooms/<code>/delete", methods=["POST"])
 @login_required
+@rate_limit("room")
 def delete_room(code):
     room = Room.query.filter_by(code=code).first_or_404()
     if room.owner_id != current_user.id:
         abort(403)
+    # 历史表分区后没有外键级联，聊天记录必须在这里显式删除
+    delete_room_messages(room.id)
     RoomMessage.query.filter_by(room_id=room.id).delete(synchronize_session=False)
     RoomMember.query.filter_by(room_id=room.id).delete(synchronize_session=False)
     RoomPlaylist.query.filter_by(room_id=room.id).delete(synchronize_session=False)
+    room_id = room.id
     db.session.delete(room)
     db.session.commit()
+    room_events.publish(room_id, "room", {"action": "delete"})
     flash("房间已删除，房间号不再可用", "info")
     return redirect(url_for("main.my_rooms"))
 
@@ -463,7 +556,7 @@ def delete_room(code):
 def records():
     if current_user.is_admin:
         abort(403)
-    cutoff = datetime.utcnow() - timedelta(days=30)
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config["LISTEN_RECORD_WINDOW_DAYS"])
     listen_records = (
         ListenRecord.query.filter(ListenRecord.user_id == current_user.id, ListenRecord.played_at >= cutoff)
         .order_by(ListenRecord.played_at.desc())
@@ -483,55 +576,34 @@ def records():
 
 @main_bp.route("/rooms/<code>/state")
 @login_required
+@replica_reads
 def room_state(code):
     room = Room.query.filter_by(code=code).first_or_404()
     if not room.is_active and room.owner_id != current_user.id:
         abort(403)
 
-    # 1. 智能进度计算
-    current_pos = room.current_position
-    if room.playback_status == 'playing' and room.updated_at:
-        elapsed = (datetime.utcnow() - room.updated_at).total_seconds()
-        current_pos += elapsed
+    # 1. 在线人数 (房主 + 成员)
     current_member_count = RoomMember.query.filter_by(room_id=room.id).count() + 1
-    # 2. 聊天记录 (修复：必须返回 messages 字段)
-    recent_msgs = RoomMessage.query.filter_by(room_id=room.id) \
-        .order_by(RoomMessage.created_at.desc()) \
-        .limit(50).all()
-    recent_msgs.reverse()
-    messages_data = [{
-        "id": m.id,
-        "author_id": m.author.id,
-        "author_name": m.author.nickname or m.author.username,
-        "author_avatar": m.author.avatar_url,
-        "created_at": (m.created_at + timedelta(hours=8)).strftime('%H:%M'),
-        "content": m.content
-    } for m in recent_msgs]
+    # 2. 聊天记录 (修复：必须返回 messages 字段)，来自进程内环形缓冲
+    messages_data = recent_messages(room.id)
 
     # 3. 播放列表 (修复：必须返回 playlist 字段)
-    playlist_items = RoomPlaylist.query.filter_by(room_id=room.id) \
-        .order_by(RoomPlaylist.created_at.asc()).all()
-    playlist_data = [{
-        "id": item.id,
-        "music_id": item.music.id,
-        "title": item.music.title
-    } for item in playlist_items]
-
-    return jsonify({
-        "playback_status": room.playback_status,
-        "current_track_name": room.current_track_name,
-        "current_track_file": room.current_track_file,
-        "current_position": current_pos,
-        "is_active": room.is_active,
-        "updated_at": room.updated_at.isoformat() if room.updated_at else None,
-        "messages": messages_data,  # 确保前端能收到消息
-        "playlist": playlist_data,  # 确保前端能收到歌单
-        "member_count": current_member_count
-    })
+    # 客户端带上已有的歌单版本 (playlist_since) 时只返回之后新增/移动过的条目
+    playlist_data, playlist_delta = playlist_items(room, request.args.get("playlist_since", type=int))
+
+    # 4. 播放状态取防抖层中的最新值；进度与时钟同步字段见 room_state.py (与 ASGI 轮询服务共用)
+    # 按 Accept / Accept-Encoding 协商编码与压缩 (见 state_encoding.py)
+    # 5. 下一首与预取窗口 (按歌单版本缓存，首次算出时在后台预热文件)
+    room_view = playback_store.view(room)
+    prefetch = track_prefetcher.hint(track_prefetcher.next_track(room_view))
+    return state_response(room_state_payload(
+        room_view, current_member_count, messages_data, playlist_data, playlist_delta, prefetch
+    ))
 
 
 @main_bp.route("/rooms/<code>/toggle", methods=["POST"])
 @login_required
+@rate_limit("playback")
 def toggle_playback(code):
     room = Room.query.filter_by(code=code).first_or_404()
     if room.owner_id != current_user.id:
@@ -544,70 +616,124 @@ def toggle_playback(code):
         position = request.form.get("position", type=float)
     except (ValueError, TypeError):
         position = None
+    # 房主客户端读取 position 时的服务器时间 (按时钟偏差换算)，用于扣除请求在途时间
+    sampled_at = request.form.get("position_at", type=float)
+
+    listen_row = None
+    now = time.time()
+    # 当前播放状态以防抖层内存中的最新状态为准 (可能尚未写回 room 表)
+    current = playback_store.view(room)
+    playback = {field: getattr(current, field) for field in PLAYBACK_FIELDS}
+    # 切歌/停止是重要变化，尽快写回；播放/暂停/拖动合并写回
+    urgent = False
 
     # 1. 切歌逻辑
     if music_id:
         music = Music.query.get(music_id)
         if music and music.status == "approved":
-            room.current_track_name = music.title
-            room.current_track_file = music.stored_filename
-            room.playback_status = "playing"
-            room.current_position = 0.0
-            room.updated_at = datetime.utcnow()
-            db.session.add(ListenRecord(user_id=current_user.id, song_name=music.title))
+            playback.update({
+                "current_track_name": music.title,
+                "current_track_file": music.stored_filename,
+                "playback_status": "playing",
+                "current_position": 0.0,
+            })
+            urgent = True
+            # 全房间将同时请求这首歌：先预热到页缓存 (已作为下一首预热过时直接跳过)
+            track_prefetcher.warm(music.stored_filename)
+            listen_row = {
+                "user_id": current_user.id,
+                "song_name": music.title,
+                "played_at": datetime.utcnow(),
+            }
         else:
             flash("无法播放该歌曲", "error")
+            return jsonify({"status": "success"})
 
     # 2. 播放/暂停/停止逻辑
     elif action in {"play", "pause", "stop"}:
         if action == "stop":
             # 【新增】播放结束或清空状态
-            room.playback_status = "paused"
-            room.current_track_name = None  # 清空歌名
-            room.current_track_file = None  # 清空文件
-            room.current_position = 0.0
+            playback.update({
+                "playback_status": "paused",
+                "current_track_name": None,  # 清空歌名
+                "current_track_file": None,  # 清空文件
+                "current_position": 0.0,
+            })
+            urgent = True
         else:
-            room.playback_status = "playing" if action == "play" else "paused"
-            if position is not None and position >= 0:
-                room.current_position = position
-
-        room.updated_at = datetime.utcnow()
-
-    db.session.commit()
+            if position is None or position < 0:
+                # 未带进度：以服务器推算的当前进度为准
+                position = playback_timing(current, now)["current_position"]
+            elif current.playback_status == "playing" and sampled_at:
+                # 房主读取进度之后、请求到达之前，音频仍在播放
+                position += min(max(now - sampled_at, 0.0), MAX_CONTROL_LATENCY)
+            playback["playback_status"] = "playing" if action == "play" else "paused"
+            playback["current_position"] = position
+    else:
+        return jsonify({"status": "success"})
+
+    # 锚点时间以服务器收到请求的时刻为准
+    playback["position_at"] = now
+    playback_store.update(room.id, playback, urgent=urgent)
+    room_events.publish(room.id, "playback", playback)
+    # 听歌记录走写后缓冲，不占用播放控制请求的提交耗时
+    if listen_row:
+        write_buffer.enqueue("listen_record", listen_row)
     return jsonify({"status": "success"})
 
 
 @main_bp.route("/rooms/<code>/messages", methods=["POST"])
 @login_required
+@rate_limit("chat")
 def send_message(code):
     room = Room.query.filter_by(code=code).first_or_404()
     content = request.form.get("content", "").strip()
     if not content:
         return jsonify({"error": "内容不能为空"}), 400
-    message = RoomMessage(room_id=room.id, user_id=current_user.id, content=content)
-    db.session.add(message)
+    if len(content) > MAX_CONTENT_LENGTH:
+        return jsonify({"error": f"消息不能超过 {MAX_CONTENT_LENGTH} 字"}), 400
+    message = append_message(room.id, current_user, content)
     db.session.commit()
+    room_events.publish(room.id, "message", message)
     return jsonify({"status": "success"})
 
 
 @main_bp.route("/rooms/<code>/playlist/delete", methods=["POST"])
 @login_required
+@rate_limit("playlist")
 def delete_from_playlist(code):
     room = Room.query.filter_by(code=code).first_or_404()
     if room.owner_id != current_user.id:
         abort(403)
-    item_id = request.form.get("item_id")
-    if item_id:
-        entry = RoomPlaylist.query.get(item_id)
-        if entry and entry.room_id == room.id:
-            db.session.delete(entry)
-            db.session.commit()
+    item_id = request.form.get("item_id", type=int)
+    if item_id and remove_tracks(room.id, [item_id]):
+        db.session.commit()
+        room_events.publish(room.id, "playlist", {"action": "delete", "item_id": item_id})
     return jsonify({"status": "success"})
 
 
+@main_bp.route("/rooms/<code>/playlist/move", methods=["POST"])
+@login_required
+@rate_limit("playlist")
+def move_in_playlist(code):
+    """调整歌单顺序：把 item_id 移到 before_id 之前，before_id 为空时移到末尾。"""
+    room = Room.query.filter_by(code=code).first_or_404()
+    if room.owner_id != current_user.id:
+        abort(403)
+    item_id = request.form.get("item_id", type=int)
+    before_id = request.form.get("before_id", type=int)
+    version = move_track(room.id, item_id, before_id) if item_id else None
+    if version is None:
+        return jsonify({"status": "error", "message": "歌单条目不存在"}), 404
+    db.session.commit()
+    room_events.publish(room.id, "playlist", {"action": "move", "item_id": item_id, "version": version})
+    return jsonify({"status": "success", "version": version})
+
+
 # [新增] 删除听歌记录路由
 @main_bp.route("/records/listen/<int:record_id>/delete", methods=["POST"])
 @login_required
+@rate_limit("account")
 def delete_listen_record(record_id):
     if current_user.is_admin:
         abort(403)
@@ -621,6 +747,7 @@ def delete_listen_record(record_id):
 # [新增] 删除房间参与记录路由
 @main_bp.route("/records/room/<int:record_id>/delete", methods=["POST"])
 @login_required
+@rate_limit("account")
 def delete_room_record(record_id):
     if current_user.is_admin:
         abort(403)
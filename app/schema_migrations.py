@@ -0,0 +1,215 @@
+# app/schema_migrations.py
+# ==============================================================================
+# 模块名称：Schema 版本管理
+# 描述：启动时只做一次版本检查 (SELECT schema_migrations)，只有存在未应用的迁移时
+#       才在 admin_db 上执行 DDL。已是最新版本的库不会再重放 CREATE OR REPLACE VIEW、
+#       DROP/CREATE PROCEDURE 等语句，滚动重启期间也就不会在线上库抢元数据锁。
+#         - 版本迁移 (如 0001_baseline)：只执行一次，按列表顺序应用
+#         - 可重复迁移 (R_ 前缀)：语句内容 (校验和) 变化时重新执行，例如存储过程
+#           内嵌了保留天数，修改配置后需要重建
+#       多个进程同时启动时，MySQL 上用 GET_LOCK 串行化，拿到锁后重新读取已应用列表。
+#       离线迁移 (offline=True，如历史表分区改造) 需要重建大表，启动时的自动迁移总是跳过，
+#       只由 `flask migrate-schema` 在维护窗口执行。
+#       新增表结构变更时在 MIGRATIONS 末尾追加一条迁移，不要修改已发布的迁移。
+# ==============================================================================
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from .create_with_sql import (
+    build_mysql_health_snapshot_statements,
+    build_mysql_listen_song_name_statements,
+    build_mysql_maintenance_job_statements,
+    build_mysql_playlist_order_statements,
+    build_mysql_procedure_statements,
+    build_mysql_room_event_statements,
+    build_mysql_room_position_statements,
+    build_mysql_schema_statements,
+    ensure_history_partitions,
+)
+from .create_with_sqlite import (
+    build_sqlite_health_snapshot_statements,
+    build_sqlite_maintenance_job_statements,
+    build_sqlite_playlist_order_statements,
+    build_sqlite_room_event_statements,
+    build_sqlite_room_position_statements,
+    build_sqlite_schema_statements,
+)
+
+MIGRATION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        id VARCHAR(64) NOT NULL PRIMARY KEY,
+        checksum VARCHAR(40) NOT NULL,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# MySQL 上并发启动时的迁移锁 (会话级命名锁)
+MIGRATION_LOCK_NAME = "voice_share_schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 60
+
+# 旧库重复执行基线脚本时可跳过的错误码：
+# 1050 表已存在 / 1060 列已存在 / 1061 索引已存在 / 1304 存储过程已存在 / 1359 触发器已存在
+IGNORABLE_MYSQL_ERRORS = (1050, 1060, 1061, 1304, 1359)
+
+
+@dataclass(frozen=True)
+class Migration:
+    id: str
+    statements: Optional[Callable] = None   # config -> [sql, ...]
+    run: Optional[Callable] = None          # (connection, config) -> None，用于需要先查询再决定的迁移
+    repeatable: bool = False
+    when: Callable = lambda config: True    # 按配置启用 (如分区改造)
+    offline: bool = False                   # 只由 `flask migrate-schema` 执行，启动时跳过
+
+    def build(self, config):
+        return self.statements(config) if self.statements else []
+
+    def checksum(self, config):
+        payload = "\n".join(self.build(config)) or self.id
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+MIGRATIONS = {
+    "mysql": [
+        Migration("0001_baseline", statements=lambda config: build_mysql_schema_statements()),
+        Migration(
+            "0002_history_partitions",
+            run=lambda conn, config: ensure_history_partitions(conn, config["HISTORY_PARTITION_DAYS_AHEAD"]),
+            when=lambda config: config.get("HISTORY_PARTITIONING_ENABLED"),
+            # 重建历史表并删除其外键 (ON DELETE CASCADE 随之失效)，见 ensure_history_partitions
+            offline=True,
+        ),
+        Migration("R_maintenance_procedures", statements=build_mysql_procedure_statements, repeatable=True),
+        Migration("0003_room_event", statements=lambda config: build_mysql_room_event_statements()),
+        Migration("0004_room_position_at", statements=lambda config: build_mysql_room_position_statements()),
+        Migration("0005_playlist_order", statements=lambda config: build_mysql_playlist_order_statements()),
+        Migration("0006_listen_song_name", statements=lambda config: build_mysql_listen_song_name_statements()),
+        Migration("0007_maintenance_job", statements=lambda config: build_mysql_maintenance_job_statements()),
+        Migration("0008_db_health_snapshot", statements=lambda config: build_mysql_health_snapshot_statements()),
+    ],
+    "sqlite": [
+        Migration("0001_baseline", statements=lambda config: build_sqlite_schema_statements()),
+        Migration("0002_room_event", statements=lambda config: build_sqlite_room_event_statements()),
+        Migration("0003_room_position_at", statements=lambda config: build_sqlite_room_position_statements()),
+        Migration("0004_playlist_order", statements=lambda config: build_sqlite_playlist_order_statements()),
+        Migration("0005_maintenance_job", statements=lambda config: build_sqlite_maintenance_job_statements()),
+        Migration("0006_db_health_snapshot", statements=lambda config: build_sqlite_health_snapshot_statements()),
+    ],
+}
+
+
+def _load_applied(connection):
+    """返回 {迁移 id: 校验和}；迁移表尚不存在时返回空字典。"""
+    try:
+        rows = connection.execute(text("SELECT id, checksum FROM schema_migrations")).all()
+    except (OperationalError, ProgrammingError):
+        connection.rollback()
+        return {}
+    return {row[0]: row[1] for row in rows}
+
+
+def pending_migrations(migrations, applied, config, include_offline=True):
+    """按顺序返回需要执行的迁移：未应用的版本迁移 + 校验和变化的可重复迁移。"""
+    pending = []
+    for migration in migrations:
+        if not migration.when(config) or (migration.offline and not include_offline):
+            continue
+        if migration.id not in applied:
+            pending.append(migration)
+        elif migration.repeatable and applied[migration.id] != migration.checksum(config):
+            pending.append(migration)
+    return pending
+
+
+def _execute(connection, sql):
+    try:
+        connection.execute(text(sql))
+    except OperationalError as e:
+        if connection.dialect.name == "mysql" and e.orig.args[0] in IGNORABLE_MYSQL_ERRORS:
+            print(f"提示: 对象已存在，跳过 -> {str(e.orig.args)}")
+        else:
+            print(f"执行 SQL 出错: {sql.strip()[:50]}...")
+            raise
+
+
+def _apply(connection, migration, config):
+    start = time.perf_counter()
+    if migration.run:
+        migration.run(connection, config)
+    for sql in migration.build(config):
+        _execute(connection, sql)
+
+    connection.execute(text("DELETE FROM schema_migrations WHERE id = :id"), {"id": migration.id})
+    connection.execute(
+        text("INSERT INTO schema_migrations (id, checksum) VALUES (:id, :checksum)"),
+        {"id": migration.id, "checksum": migration.checksum(config)},
+    )
+    connection.commit()
+    print(f"[Schema] Applied {migration.id} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def migrate_schema(engine, config, force=False):
+    """检查 schema 版本并应用未执行的迁移，返回本次应用 (或待应用) 的迁移 id 列表。
+
+    SCHEMA_AUTO_MIGRATE 关闭时只检查并提示，由 `flask migrate-schema` 在发布前执行。
+    force=False (启动时) 不执行离线迁移，只打印提示。
+    """
+    dialect = engine.dialect.name
+    migrations = MIGRATIONS.get(dialect, MIGRATIONS["mysql"])
+
+    with engine.connect() as connection:
+        applied = _load_applied(connection)
+        pending = pending_migrations(migrations, applied, config, include_offline=force)
+        if not force:
+            offline = [m.id for m in pending_migrations(migrations, applied, config) if m.offline]
+            if offline:
+                print(f"[Schema] 离线迁移 {', '.join(offline)} 未执行，请在维护窗口执行 `flask migrate-schema`")
+        connection.rollback()
+        if not pending:
+            return []
+
+        ids = [m.id for m in pending]
+        if not force and not config.get("SCHEMA_AUTO_MIGRATE", True):
+            print(f"[Schema] 有未应用的迁移: {', '.join(ids)}，请执行 `flask migrate-schema`")
+            return ids
+
+        locked = dialect == "mysql"
+        if locked:
+            got = connection.execute(
+                text("SELECT GET_LOCK(:name, :timeout)"),
+                {"name": MIGRATION_LOCK_NAME, "timeout": MIGRATION_LOCK_TIMEOUT},
+            ).scalar()
+            if not got:
+                raise RuntimeError("等待 schema 迁移锁超时，可能有其他进程正在迁移")
+        try:
+            connection.execute(text(MIGRATION_TABLE_SQL))
+            connection.commit()
+            # 拿到锁后重新读取：其他进程可能已经完成了部分迁移
+            pending = pending_migrations(migrations, _load_applied(connection), config, include_offline=force)
+            for migration in pending:
+                _apply(connection, migration, config)
+        finally:
+            if locked:
+                connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+                connection.commit()
+
+    print(f"数据库 schema 已更新至最新版本 (Success)，本次执行: {', '.join(m.id for m in pending) or '无'}")
+    return [m.id for m in pending]
+
+
+@click.command("migrate-schema")
+@with_appcontext
+def migrate_schema_command():
+    """应用所有未执行的 schema 迁移，包括启动时跳过的离线迁移 (如历史表分区改造)。"""
+    from . import db
+
+    applied = migrate_schema(db.get_engine(bind='admin_db'), current_app.config, force=True)
+    click.echo(f"applied: {', '.join(applied) or 'none'}")
@@ -0,0 +1,72 @@
+# app/search.py
+# ==============================================================================
+# 模块名称：全文检索条件构建
+# 描述：数据中心的模糊搜索原先使用 LIKE '%词%'，前导通配符无法利用 B-tree 索引，每次都全表扫描。
+#       这里改为 MySQL FULLTEXT (ngram 分词器，支持中文) 的短语匹配：
+#         - 歌名 musics.title          -> ft_music_title
+#         - 用户昵称/账号 user.nickname/username -> ft_user_nickname / ft_user_username
+#         - 听歌流水 listen_record.song_name：分区表不支持 FULLTEXT，先在歌名检索表 listen_song_name
+#           (流水中出现过的全部歌名，由触发器维护，见 build_mysql_listen_song_name_statements)
+#           的 ft_listen_song_name 中找出匹配的歌名，再通过 idx_listen_song 做等值查找。
+#           歌曲被删除或改名后，旧流水仍能按原歌名搜到
+#       搜索词短于 ngram 长度 (默认 2)、关闭全文检索或非 MySQL (SQLite 测试库) 时，退回 LIKE。
+# ==============================================================================
+from flask import current_app
+
+from .dialect import is_mysql
+
+# ngram 分词的最小词长 (与 MySQL ngram_token_size 一致)
+NGRAM_TOKEN_SIZE = 2
+
+# 布尔模式下有特殊含义的字符，统一去掉后按短语匹配
+_BOOLEAN_OPERATORS = '+-<>()~*"@'
+
+
+def _use_fulltext(term):
+    return (
+        current_app.config.get("SEARCH_USE_FULLTEXT", True)
+        and len(term) >= NGRAM_TOKEN_SIZE
+        and is_mysql()
+    )
+
+
+def _phrase(term):
+    cleaned = "".join(" " if ch in _BOOLEAN_OPERATORS else ch for ch in term).strip()
+    return f'"{cleaned}"'
+
+
+def text_search_condition(column_sql, term, param, params, *, id_sql=None, table=None, table_column=None):
+    """生成单个字段的模糊搜索条件。
+
+    column_sql 为查询中的字段表达式；若该字段来自视图或 JOIN，需要同时给出
+    id_sql (查询中对应的主键表达式) 以及 table/table_column (带全文索引的基表字段)，
+    以 "id IN (SELECT id FROM 基表 WHERE MATCH ...)" 的形式走全文索引。
+    """
+    if not _use_fulltext(term) or table is None:
+        params[param] = f"%{term}%"
+        return f"{column_sql} LIKE :{param}"
+
+    phrase = _phrase(term)
+    if phrase == '""':
+        params[param] = f"%{term}%"
+        return f"{column_sql} LIKE :{param}"
+
+    params[param] = phrase
+    return (
+        f"{id_sql} IN (SELECT id FROM {table} "
+        f"WHERE MATCH({table_column}) AGAINST (:{param} IN BOOLEAN MODE))"
+    )
+
+
+def song_name_condition(column_sql, term, param, params):
+    """听歌流水按歌名搜索：先在 listen_song_name 全文索引中找出歌名，再按 idx_listen_song 等值匹配。"""
+    phrase = _phrase(term)
+    if not _use_fulltext(term) or phrase == '""':
+        params[param] = f"%{term}%"
+        return f"{column_sql} LIKE :{param}"
+
+    params[param] = phrase
+    return (
+        f"{column_sql} IN (SELECT song_name FROM listen_song_name "
+        f"WHERE MATCH(song_name) AGAINST (:{param} IN BOOLEAN MODE))"
+    )
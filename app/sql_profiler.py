@@ -0,0 +1,214 @@
+# app/sql_profiler.py
+# ==============================================================================
+# 模块名称：SQL 性能剖析 (Statement Profiler)
+# 描述：在默认引擎与 admin_db 引擎上挂 before/after_cursor_execute 事件，
+#       把每条语句归一化为指纹 (字面量/参数替换为 ?、IN 列表与多行 VALUES 折叠)，
+#       按指纹累计执行次数、总耗时、p50/p99、返回行数以及来源的 Flask endpoint。
+#       聚合结果只保存在进程内并限制条目数，供 DBA 模块的「SQL 剖析」页面展示，
+#       页面可对耗时最高的 SELECT 语句按需执行 EXPLAIN。
+# ==============================================================================
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_PARAM_RE = re.compile(r"%\([^)]+\)s|%s|:\w+|\?")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_RE = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement):
+    """把 SQL 归一化为指纹，返回 (指纹 id, 指纹文本)。"""
+    sql = _STRING_RE.sub("?", statement)
+    sql = _PARAM_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _LIST_RE.sub("(?+)", sql)
+    sql = _VALUES_RE.sub("(?+)+", sql)
+    sql = _SPACE_RE.sub(" ", sql).strip().rstrip(";")
+    return hashlib.md5(sql.encode("utf-8")).hexdigest()[:12], sql
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class SQLProfiler:
+    """按语句指纹聚合的 SQL 耗时统计 (进程内、有界)。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._engines = {}
+
+        self.enabled = True
+        self.max_statements = 500
+        self.sample_size = 256
+        self.slow_ms = 200
+        self.started_at = datetime.now()
+
+    def init_app(self, app, engines):
+        """在给定的引擎 ({bind 名: engine}) 上安装事件钩子。"""
+        self.enabled = app.config.get("SQL_PROFILER_ENABLED", True)
+        self.max_statements = app.config.get("SQL_PROFILER_MAX_STATEMENTS", 500)
+        self.sample_size = app.config.get("SQL_PROFILER_SAMPLE_SIZE", 256)
+        self.slow_ms = app.config.get("SQL_PROFILER_SLOW_MS", 200)
+        app.extensions["sql_profiler"] = self
+        for bind, engine in engines.items():
+            self.install(engine, bind or "default")
+
+    def install(self, engine, bind):
+        self._engines[bind] = engine
+        if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            return
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._make_after_hook(bind))
+
+    def engine_for(self, bind):
+        return self._engines.get(bind)
+
+    # --------------------------------------------------------------------------
+    # 记录
+    # --------------------------------------------------------------------------
+    def _make_after_hook(self, bind):
+        def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start = getattr(context, "_sqlprof_start", None)
+            if start is None:
+                return
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if not self.enabled or statement.lstrip().upper().startswith("EXPLAIN"):
+                return
+            rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+            self.record(bind, statement, None if executemany else parameters, elapsed_ms, rows)
+        return _after_cursor_execute
+
+    def record(self, bind, statement, parameters, elapsed_ms, rows):
+        fp_id, fp_sql = fingerprint(statement)
+        endpoint = (request.endpoint or request.path) if has_request_context() else "background"
+        key = (bind, fp_id)
+
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                if len(self._stats) >= self.max_statements:
+                    # 淘汰累计耗时最少的条目，保证内存有界
+                    victim = min(self._stats, key=lambda k: self._stats[k]["total_ms"])
+                    del self._stats[victim]
+                stat = {
+                    "id": fp_id,
+                    "bind": bind,
+                    "fingerprint": fp_sql,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "rows": 0,
+                    "samples": deque(maxlen=self.sample_size),
+                    "endpoints": {},
+                    "example_statement": None,
+                    "example_params": None,
+                    "last_seen": None,
+                }
+                self._stats[key] = stat
+
+            stat["count"] += 1
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+            stat["rows"] += rows
+            stat["samples"].append(elapsed_ms)
+            stat["endpoints"][endpoint] = stat["endpoints"].get(endpoint, 0) + 1
+            stat["last_seen"] = time.time()
+            # 只为 SELECT 保留一份样例语句与参数，用于 EXPLAIN
+            if parameters is not None and fp_sql.upper().startswith(("SELECT", "WITH")):
+                stat["example_statement"] = statement
+                stat["example_params"] = parameters
+
+        if elapsed_ms >= self.slow_ms:
+            print(f"[SQLProfiler] Slow query {elapsed_ms:.1f}ms on {bind} ({endpoint}): {fp_sql[:200]}")
+
+    # --------------------------------------------------------------------------
+    # 查询
+    # --------------------------------------------------------------------------
+    def top(self, limit=50, order_by="total_ms"):
+        """按累计耗时 (或其他字段) 倒序返回前 limit 条统计。"""
+        with self._lock:
+            items = [
+                (dict(stat, endpoints=dict(stat["endpoints"])), sorted(stat["samples"]))
+                for stat in self._stats.values()
+            ]
+
+        result = []
+        for stat, samples in items:
+            count = stat["count"]
+            endpoints = sorted(stat["endpoints"].items(), key=lambda kv: kv[1], reverse=True)
+            result.append({
+                "id": stat["id"],
+                "bind": stat["bind"],
+                "fingerprint": stat["fingerprint"],
+                "count": count,
+                "total_ms": stat["total_ms"],
+                "avg_ms": stat["total_ms"] / count if count else 0.0,
+                "p50_ms": _percentile(samples, 50),
+                "p99_ms": _percentile(samples, 99),
+                "max_ms": stat["max_ms"],
+                "rows": stat["rows"],
+                "avg_rows": stat["rows"] / count if count else 0.0,
+                "endpoints": endpoints[:5],
+                "explainable": stat["example_statement"] is not None,
+            })
+        result.sort(key=lambda s: s[order_by], reverse=True)
+        return result[:limit]
+
+    def example(self, bind, fp_id):
+        """返回某个指纹的样例语句与参数 (没有则为 None)。"""
+        with self._lock:
+            stat = self._stats.get((bind, fp_id))
+            if stat is None or stat["example_statement"] is None:
+                return None
+            return stat["example_statement"], stat["example_params"]
+
+    def explain(self, bind, fp_id):
+        """对指纹的样例语句执行 EXPLAIN，返回 (列名列表, 行列表)。"""
+        example = self.example(bind, fp_id)
+        engine = self.engine_for(bind)
+        if example is None or engine is None:
+            return None
+        statement, params = example
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        with engine.connect() as conn:
+            result = conn.exec_driver_sql(prefix + statement, params)
+            columns = list(result.keys())
+            rows = [[_plain(v) for v in row] for row in result.fetchall()]
+        return columns, rows
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+        self.started_at = datetime.now()
+
+
+def _plain(value):
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 开始时间记在本次执行的 context 上：语句出错时没有 after 事件，随 context 一起释放，
+    # 不会残留在连接上错配给之后的语句
+    if context is not None:
+        context._sqlprof_start = time.perf_counter()
+
+
+sql_profiler = SQLProfiler()
@@ -0,0 +1,137 @@
+# app/state_encoding.py
+# ==============================================================================
+# 模块名称：房间状态编码
+# 描述：/rooms/<code>/state 每 2 秒被每个听众请求一次，返回体中 50 条消息的头像 URL、
+#       昵称逐条重复。这里按请求头协商更紧凑的编码 (Flask 路由与 ASGI 服务共用)：
+#         - Accept: application/json (默认)      原有结构，UTF-8 直出中文 (不再转义为 \uXXXX)
+#         - Accept: COLUMNAR_MEDIA_TYPE          列式 JSON：消息/歌单按列存放，作者信息去重后按下标引用
+#         - Accept: application/msgpack          列式结构的 msgpack 编码 (需安装 msgpack)
+#       JSON 返回体超过 ROOM_STATE_COMPRESS_MIN_BYTES 时按 Accept-Encoding 使用 br (需安装 brotli) 或 gzip。
+#       列式结构的还原见 static/js/main.js 的 decodeColumnarState。
+# ==============================================================================
+import gzip
+import json
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_MEDIA_TYPE = "application/vnd.voiceshare.columnar+json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+MESSAGE_COLUMNS = ("id", "author", "created_at", "content")
+PLAYLIST_COLUMNS = ("id", "music_id", "title", "position")
+
+
+def to_columnar(state):
+    """状态 -> 列式结构 (layout = "columnar")。作者 (id, 昵称, 头像) 只出现一次。"""
+    authors, author_index = [], {}
+    columns = {name: [] for name in MESSAGE_COLUMNS}
+    for message in state.get("messages") or []:
+        key = (message["author_id"], message["author_name"], message["author_avatar"])
+        if key not in author_index:
+            author_index[key] = len(authors)
+            authors.append(list(key))
+        columns["id"].append(message["id"])
+        columns["author"].append(author_index[key])
+        columns["created_at"].append(message["created_at"])
+        columns["content"].append(message["content"])
+
+    playlist = {name: [item[name] for item in state.get("playlist") or []] for name in PLAYLIST_COLUMNS}
+    return {
+        **{k: v for k, v in state.items() if k not in ("messages", "playlist")},
+        "layout": "columnar",
+        "authors": authors,
+        "messages": columns,
+        "playlist": playlist,
+    }
+
+
+def from_columnar(data):
+    """列式结构 -> 原有结构 (与前端解码逻辑一致，供测试与基准校验)。"""
+    authors = data["authors"]
+    messages_cols = data["messages"]
+    messages = []
+    for i, message_id in enumerate(messages_cols["id"]):
+        author_id, author_name, author_avatar = authors[messages_cols["author"][i]]
+        messages.append({
+            "id": message_id,
+            "author_id": author_id,
+            "author_name": author_name,
+            "author_avatar": author_avatar,
+            "created_at": messages_cols["created_at"][i],
+            "content": messages_cols["content"][i],
+        })
+    playlist_cols = data["playlist"]
+    playlist = [
+        {name: playlist_cols[name][i] for name in PLAYLIST_COLUMNS}
+        for i in range(len(playlist_cols["id"]))
+    ]
+    state = {k: v for k, v in data.items() if k not in ("layout", "authors")}
+    state.update(messages=messages, playlist=playlist)
+    return state
+
+
+def _accepts(header, media_type):
+    return any(part.split(";")[0].strip() == media_type for part in (header or "").split(","))
+
+
+def negotiate(accept):
+    """Accept 请求头 -> ("json" | "columnar" | "msgpack", media type)。"""
+    if msgpack is not None and any(_accepts(accept, t) for t in MSGPACK_MEDIA_TYPES):
+        return "msgpack", MSGPACK_MEDIA_TYPES[0]
+    if _accepts(accept, COLUMNAR_MEDIA_TYPE):
+        return "columnar", COLUMNAR_MEDIA_TYPE
+    return "json", JSON_MEDIA_TYPE
+
+
+def serialize(state, fmt):
+    if fmt == "msgpack":
+        return msgpack.packb(to_columnar(state), use_bin_type=True)
+    payload = to_columnar(state) if fmt == "columnar" else state
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def compress(body, accept_encoding, config):
+    """按 Accept-Encoding 压缩，返回 (body, content-encoding 或 None)。"""
+    if len(body) < config.get("ROOM_STATE_COMPRESS_MIN_BYTES", 512):
+        return body, None
+    encodings = {part.split(";")[0].strip() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in encodings:
+        return brotli.compress(body, quality=config.get("ROOM_STATE_BROTLI_QUALITY", 5)), "br"
+    if "gzip" in encodings:
+        return gzip.compress(body, compresslevel=config.get("ROOM_STATE_GZIP_LEVEL", 6)), "gzip"
+    return body, None
+
+
+def encode_state(state, accept, accept_encoding, config):
+    """返回 (body, headers)，headers 为 [(name, value)]。msgpack 本身已很紧凑，不再压缩。"""
+    fmt, media_type = negotiate(accept)
+    body = serialize(state, fmt)
+    headers = [
+        ("Content-Type", media_type if fmt == "msgpack" else f"{media_type}; charset=utf-8"),
+        ("Vary", "Accept, Accept-Encoding"),
+        ("Cache-Control", "no-store"),
+    ]
+    if fmt != "msgpack":
+        body, encoding = compress(body, accept_encoding, config)
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+    return body, headers
+
+
+def state_response(state):
+    """Flask 视图中使用：按当前请求头编码房间状态。"""
+    from flask import current_app, request
+
+    body, headers = encode_state(
+        state, request.headers.get("Accept"), request.headers.get("Accept-Encoding"), current_app.config
+    )
+    return current_app.response_class(body, headers=headers)
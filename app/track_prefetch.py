@@ -0,0 +1,209 @@
+# app/track_prefetch.py
+# ==============================================================================
+# 模块名称：下一首预取与热文件预热
+# 描述：一首歌播完时，房间内所有听众会在同一时刻请求下一首 MP3，磁盘与带宽瞬间被打满，切歌出现空白。
+#         - 房间状态中下发 next_track (歌单中当前曲目的下一首) 与预取窗口：
+#           prefetch_lead_seconds (距离结束多少秒开始预取) + 每个客户端在 0~prefetch_jitter_seconds
+#           之间随机错开，各听众在歌曲结束前分批缓冲好下一首 (见 static/js/main.js)
+#         - 服务端在算出下一首 (或房主切歌) 时，由后台线程对该文件调用 posix_fadvise(WILLNEED)，
+#           让内核提前读入页缓存 (不支持的平台退回顺序读一遍)，随后的集中请求直接由内存提供
+#         - 上传的音乐文件名唯一且不会改写，/static/uploads/music/ 的响应加长缓存头，
+#           预取过的文件切歌时直接命中浏览器缓存
+#       下一首按 (房间, 歌单版本, 当前曲目) 缓存在进程内，歌单或曲目变化前不再查询数据库。
+#       Flask 应用与 ASGI 轮询服务共用 (后者调用 configure)。
+# ==============================================================================
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from flask import request
+from sqlalchemy import text
+
+from . import db
+from .workers import BackgroundWorker, register_shutdown
+
+MUSIC_URL_PREFIX = "/static/uploads/music/"
+
+# 歌单中位于当前曲目 (按文件名匹配第一条) 之后的第一首
+NEXT_TRACK_SQL = """
+    SELECT rp.id, m.id AS music_id, m.title, m.stored_filename
+    FROM room_playlist rp
+    JOIN musics m ON m.id = rp.music_id
+    WHERE rp.room_id = :room_id
+      AND rp.position > (
+          SELECT MIN(cur.position)
+          FROM room_playlist cur
+          JOIN musics cm ON cm.id = cur.music_id
+          WHERE cur.room_id = :room_id AND cm.stored_filename = :current_file
+      )
+    ORDER BY rp.position ASC, rp.id ASC
+    LIMIT 1
+"""
+
+
+class TrackPrefetcher:
+    def __init__(self):
+        self.enabled = True
+        self.music_folder = None
+        self.lead_seconds = 30
+        self.jitter_seconds = 15
+        self.warm_ttl = 300
+        self.max_rooms = 5000
+
+        self._next = OrderedDict()  # (room_id, 歌单版本, 当前曲目文件) -> 下一首 dict 或 None
+        self._warmed = {}           # 文件名 -> 上次预热时间
+        self._queue = deque(maxlen=64)
+        self._lock = threading.Lock()
+        self._worker = BackgroundWorker("track-prefetch", self._drain)
+
+        self._stats = {"next_hits": 0, "next_misses": 0, "warmed": 0, "warmed_bytes": 0, "missing": 0, "failed": 0}
+
+    def configure(self, config):
+        self.enabled = config.get("TRACK_PREFETCH_ENABLED", True)
+        self.music_folder = Path(config["MUSIC_FOLDER"])
+        self.lead_seconds = config.get("TRACK_PREFETCH_LEAD_SECONDS", 30)
+        self.jitter_seconds = config.get("TRACK_PREFETCH_JITTER_SECONDS", 15)
+        self.warm_ttl = config.get("TRACK_WARM_TTL_SECONDS", 300)
+        self.max_rooms = config.get("TRACK_PREFETCH_MAX_ROOMS", 5000)
+
+    def init_app(self, app):
+        self.configure(app.config)
+        max_age = app.config.get("MUSIC_CACHE_MAX_AGE", 0)
+        if max_age:
+            @app.after_request
+            def _cache_music_files(response):
+                if request.path.startswith(MUSIC_URL_PREFIX) and response.status_code in (200, 206, 304):
+                    response.headers["Cache-Control"] = f"public, max-age={max_age}, immutable"
+                return response
+
+        app.extensions["track_prefetch"] = self
+        register_shutdown(self.shutdown)
+
+    # --------------------------------------------------------------------------
+    # 下一首
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def cache_key(room):
+        return room.id, room.playlist_version or 0, room.current_track_file
+
+    def cached(self, room):
+        """返回 (是否命中, 下一首)。"""
+        key = self.cache_key(room)
+        with self._lock:
+            if key in self._next:
+                self._next.move_to_end(key)
+                self._stats["next_hits"] += 1
+                return True, self._next[key]
+            self._stats["next_misses"] += 1
+        return False, None
+
+    def store(self, room, row):
+        """记录查询结果 (row 为 NEXT_TRACK_SQL 的结果行或 None)，并预热下一首的文件。"""
+        track = None
+        if row is not None:
+            track = {
+                "id": row.id,
+                "music_id": row.music_id,
+                "title": row.title,
+                "file": row.stored_filename,
+                "url": MUSIC_URL_PREFIX + row.stored_filename,
+            }
+        with self._lock:
+            self._next[self.cache_key(room)] = track
+            while len(self._next) > self.max_rooms:
+                self._next.popitem(last=False)
+        if track:
+            self.warm(track["file"])
+        return track
+
+    def next_track(self, room):
+        """Flask 视图中使用：room 的当前曲目之后的下一首 (没有当前曲目或已是最后一首时为 None)。"""
+        if not self.enabled or not room.current_track_file:
+            return None
+        hit, track = self.cached(room)
+        if hit:
+            return track
+        row = db.session.execute(
+            text(NEXT_TRACK_SQL), {"room_id": room.id, "current_file": room.current_track_file}
+        ).first()
+        return self.store(room, row)
+
+    def hint(self, track):
+        """房间状态中的预取字段。"""
+        return {
+            "next_track": track,
+            "prefetch_lead_seconds": self.lead_seconds,
+            "prefetch_jitter_seconds": self.jitter_seconds,
+        }
+
+    # --------------------------------------------------------------------------
+    # 预热
+    # --------------------------------------------------------------------------
+    def warm(self, filename):
+        """把音乐文件预读进页缓存 (异步；warm_ttl 秒内同一文件只处理一次)。"""
+        if not self.enabled or not filename or self.music_folder is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._warmed.get(filename, -self.warm_ttl) < self.warm_ttl:
+                return
+            self._warmed[filename] = now
+            if len(self._warmed) > self.max_rooms:
+                cutoff = now - self.warm_ttl
+                self._warmed = {name: at for name, at in self._warmed.items() if at >= cutoff}
+            self._queue.append(filename)
+        self._worker.start()
+        self._worker.wake()
+
+    def _warm_file(self, filename):
+        path = self.music_folder / Path(filename).name
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            with self._lock:
+                self._stats["missing"] += 1
+            return
+        try:
+            size = os.fstat(fd).st_size
+            if hasattr(os, "posix_fadvise"):
+                # 内核异步预读，调用立即返回
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            else:
+                while os.read(fd, 1 << 20):
+                    pass
+            with self._lock:
+                self._stats["warmed"] += 1
+                self._stats["warmed_bytes"] += size
+        except OSError as e:
+            with self._lock:
+                self._stats["failed"] += 1
+            print(f"[Prefetch] Warm {filename} failed: {e}")
+        finally:
+            os.close(fd)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["cached_rooms"] = len(self._next)
+            data["queued"] = len(self._queue)
+        return data
+
+    def shutdown(self):
+        self._worker.stop()
+
+    # --------------------------------------------------------------------------
+    # 后台线程
+    # --------------------------------------------------------------------------
+    def _drain(self):
+        # 后台线程每次被唤醒时处理完队列中的全部文件
+        while True:
+            with self._lock:
+                if not self._queue:
+                    return
+                filename = self._queue.popleft()
+            self._warm_file(filename)
+
+
+track_prefetcher = TrackPrefetcher()
@@ -0,0 +1,88 @@
+# app/workers.py
+# ==============================================================================
+# 模块名称：后台线程
+# 描述：写后缓冲、播放状态写回、房间事件总线、下一首预热共用的后台线程生命周期：
+#         - 第一次需要时才启动守护线程 (start)，按进程号判断：预加载后 fork 出的 worker
+#           不会继承父进程的线程，在子进程中再次调用 start 时重新启动
+#         - 每轮执行一次 target，两轮之间最多等待 interval 秒，wake() 提前唤醒
+#         - stop() 停止线程，可等待当前一轮结束
+#       register_shutdown 在进程退出时调用各组件的 shutdown (写完剩余数据)，
+#       同一组件多次 init_app (如测试中多次 create_app) 只注册一次。
+# ==============================================================================
+import atexit
+import os
+import threading
+
+
+class BackgroundWorker:
+    """按需启动的后台守护线程。
+
+    interval 为数值、None (一直等到 wake) 或返回二者之一的函数 (每轮重新计算)；
+    setup 在线程启动后先执行一次；context 返回上下文管理器 (如 app.app_context())，整个线程在其中运行。
+    """
+
+    def __init__(self, name, target, interval=None, setup=None, context=None):
+        self.name = name
+        self._target = target
+        self._interval = interval
+        self._setup = setup
+        self._context = context
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._owner_pid = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive() and self._owner_pid == os.getpid()
+
+    def start(self):
+        if self.is_running():
+            return
+        with self._lock:
+            if self.is_running():
+                return
+            self._stopped.clear()
+            self._owner_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """停止线程；timeout 不为 None 时最多等待这么多秒让当前一轮执行完。"""
+        self._stopped.set()
+        self._wakeup.set()
+        thread = self._thread
+        if timeout is not None and thread and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=timeout)
+
+    def _run(self):
+        if self._context is None:
+            self._loop()
+        else:
+            with self._context():
+                self._loop()
+
+    def _loop(self):
+        if self._setup:
+            self._setup()
+        while not self._stopped.is_set():
+            interval = self._interval() if callable(self._interval) else self._interval
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            self._target()
+
+
+_shutdown_hooks = set()
+_shutdown_lock = threading.Lock()
+
+
+def register_shutdown(hook):
+    """进程退出时调用 hook (通常是组件的 shutdown 方法)，重复注册同一个 hook 时忽略。"""
+    with _shutdown_lock:
+        if hook in _shutdown_hooks:
+            return
+        _shutdown_hooks.add(hook)
+    atexit.register(hook)
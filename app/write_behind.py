@@ -0,0 +1,243 @@
+# app/write_behind.py
+# ==============================================================================
+# 模块名称：写后缓冲 (Write-Behind Buffer)
+# 描述：听歌记录、房间参与记录属于只追加的分析型数据，同一请求内无人读取。
+#       这里把它们先放进进程内队列，由后台线程按数量/时间阈值用多行 INSERT 批量落库，
+#       让播放控制等请求不再等待这部分提交。
+#       写入失败时：
+#         - 连接类错误 (断线、连接池超时)：整批放回队首，等待下一轮重试
+#         - 其他错误 (如某一行数据不合法)：先按表/分块各自提交，失败的块再逐行写入，
+#           仍失败的行记一次失败，累计 WRITE_BEHIND_MAX_ATTEMPTS 次后丢弃并计入 failed_rows，
+#           避免一行坏数据堵住整个队列
+# ==============================================================================
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import exc, text
+
+from . import db
+from .workers import BackgroundWorker, register_shutdown
+
+# 允许缓冲写入的表及列 (白名单，防止拼接任意表名)
+BUFFERED_TABLES = {
+    "listen_record": ("user_id", "song_name", "played_at"),
+    "room_participation_record": ("user_id", "room_code", "participated_at"),
+}
+
+
+class WriteBehindBuffer:
+    """进程内写后缓冲队列，按表分组批量写入。"""
+
+    def __init__(self):
+        self._app = None
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = BackgroundWorker("write-behind", self.flush, interval=lambda: self.flush_seconds)
+
+        self.enabled = True
+        self.batch_size = 200
+        self.flush_seconds = 2.0
+        self.max_backlog = 10000
+        self.max_attempts = 3
+
+        self._stats = {
+            "enqueued": 0,
+            "flushed": 0,
+            "dropped": 0,
+            "failed_rows": 0,
+            "failed_flushes": 0,
+            "flush_count": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "last_flush_at": None,
+        }
+
+    def init_app(self, app):
+        self._app = app
+        self.enabled = app.config.get("WRITE_BEHIND_ENABLED", True)
+        self.batch_size = app.config.get("WRITE_BEHIND_BATCH_SIZE", 200)
+        self.flush_seconds = app.config.get("WRITE_BEHIND_FLUSH_SECONDS", 2.0)
+        self.max_backlog = app.config.get("WRITE_BEHIND_MAX_BACKLOG", 10000)
+        self.max_attempts = app.config.get("WRITE_BEHIND_MAX_ATTEMPTS", 3)
+        app.extensions["write_behind"] = self
+        register_shutdown(self.shutdown)
+
+    # --------------------------------------------------------------------------
+    # 入队
+    # --------------------------------------------------------------------------
+    def enqueue(self, table, row):
+        if table not in BUFFERED_TABLES:
+            raise ValueError(f"表 {table} 不支持写后缓冲")
+
+        with self._lock:
+            # 队列元素为 (表名, 行, 已失败次数)
+            self._queue.append((table, row, 0))
+            self._stats["enqueued"] += 1
+            self._trim()
+            backlog = len(self._queue)
+
+        if not self.enabled:
+            # 关闭缓冲 (如测试环境) 时同步落库
+            self.flush()
+            return
+
+        self._worker.start()
+        if backlog >= self.batch_size:
+            self._worker.wake()
+
+    # --------------------------------------------------------------------------
+    # 落库
+    # --------------------------------------------------------------------------
+    def flush(self):
+        """把当前队列全部写入数据库，返回写入行数。"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._queue)
+                self._queue.clear()
+            if not batch:
+                return 0
+
+            start = time.perf_counter()
+            failed, pending = [], []
+            with self._app.app_context():
+                try:
+                    self._write(batch)
+                    written = len(batch)
+                except Exception as e:
+                    if _is_connection_error(e):
+                        pending = batch
+                        written = 0
+                    else:
+                        print(f"[WriteBehind] Batch insert failed, retrying per chunk/row: {e}")
+                        written, failed, pending = self._write_isolated(batch)
+
+            if pending or failed:
+                self._requeue(pending, failed)
+            if pending:
+                print(f"[WriteBehind] Flush failed (connection error), {len(pending)} rows requeued")
+                if not written:
+                    return 0
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._stats["flushed"] += written
+                self._stats["flush_count"] += 1
+                self._stats["last_flush_ms"] = elapsed_ms
+                self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+                self._stats["total_flush_ms"] += elapsed_ms
+                self._stats["last_flush_at"] = time.time()
+            return written
+
+    def _chunks(self, items):
+        """按表分组，每组再按 batch_size 切块。"""
+        grouped = {}
+        for item in items:
+            grouped.setdefault(item[0], []).append(item)
+        chunks = []
+        for table_items in grouped.values():
+            for i in range(0, len(table_items), self.batch_size):
+                chunks.append(table_items[i:i + self.batch_size])
+        return chunks
+
+    def _write(self, items):
+        """在一个事务内写入 items (需在应用上下文中调用)。"""
+        with db.engine.begin() as conn:
+            for chunk in self._chunks(items):
+                sql, params = _build_multi_insert(chunk[0][0], [row for _, row, _ in chunk])
+                conn.execute(sql, params)
+
+    def _write_isolated(self, batch):
+        """整批失败后按块、再按行分别提交。
+
+        返回 (写入行数, 写入失败的条目, 因连接错误尚未写入的条目)。
+        """
+        written, failed = 0, []
+        chunks = self._chunks(batch)
+        for n, chunk in enumerate(chunks):
+            try:
+                self._write(chunk)
+                written += len(chunk)
+                continue
+            except Exception as e:
+                if _is_connection_error(e):
+                    return written, failed, [item for rest in chunks[n:] for item in rest]
+
+            for i, item in enumerate(chunk):
+                try:
+                    self._write([item])
+                    written += 1
+                except Exception as e:
+                    if _is_connection_error(e):
+                        rest = chunk[i:] + [item for later in chunks[n + 1:] for item in later]
+                        return written, failed, rest
+                    failed.append(item)
+                    print(f"[WriteBehind] Row rejected by {item[0]} (attempt {item[2] + 1}/{self.max_attempts}): {e}")
+        return written, failed, []
+
+    def _requeue(self, pending, failed):
+        """未写入的条目放回队首；写入失败的条目失败次数 +1，达到上限的丢弃。"""
+        retry = list(pending)
+        gave_up = 0
+        for table, row, attempts in failed:
+            if attempts + 1 >= self.max_attempts:
+                gave_up += 1
+            else:
+                retry.append((table, row, attempts + 1))
+
+        with self._lock:
+            self._queue.extendleft(reversed(retry))
+            self._trim()
+            self._stats["failed_rows"] += gave_up
+            if pending:
+                self._stats["failed_flushes"] += 1
+        if gave_up:
+            print(f"[WriteBehind] Dropped {gave_up} rows after {self.max_attempts} failed attempts")
+
+    def _trim(self):
+        # 超出上限时丢弃最旧的数据，保证内存有界 (调用方持有 self._lock)
+        while len(self._queue) > self.max_backlog:
+            self._queue.popleft()
+            self._stats["dropped"] += 1
+
+    def shutdown(self):
+        """停止后台线程并写完剩余数据 (进程退出时调用)。"""
+        self._worker.stop(timeout=self.flush_seconds + 5)
+        if self._app is not None:
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["backlog"] = len(self._queue)
+        count = data["flush_count"]
+        data["avg_flush_ms"] = data["total_flush_ms"] / count if count else 0.0
+        return data
+
+
+def _is_connection_error(error):
+    """断线、连接池超时等与数据无关的错误：整批重试即可。"""
+    if isinstance(error, (exc.DisconnectionError, exc.TimeoutError)):
+        return True
+    return isinstance(error, exc.DBAPIError) and error.connection_invalidated
+
+
+def _build_multi_insert(table, rows):
+    """生成多行 INSERT ... VALUES (...), (...) 语句及参数。"""
+    columns = BUFFERED_TABLES[table]
+    params = {}
+    values_sql = []
+    for i, row in enumerate(rows):
+        placeholders = []
+        for col in columns:
+            key = f"{col}_{i}"
+            params[key] = row.get(col)
+            placeholders.append(f":{key}")
+        values_sql.append(f"({', '.join(placeholders)})")
+    sql = text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(values_sql)}")
+    return sql, params
+
+
+write_buffer = WriteBehindBuffer()
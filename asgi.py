@@ -0,0 +1,24 @@
+# asgi.py
+# ==============================================================================
+# ASGI 入口：房间轮询 / 推送服务 (app/asgi_sidecar.py)，与 run.py 的 Flask 应用并行部署。
+# 每个 worker 进程一个 asyncio 事件循环，worker 数取 CPU 核数：
+#   uvicorn asgi:app --host 0.0.0.0 --port 8001 --workers $(nproc)
+# 或直接 python asgi.py (ASGI_WORKERS / ASGI_PORT 可覆盖)
+# ==============================================================================
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.asgi_sidecar import create_asgi_app
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "asgi:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("ASGI_PORT", 8001)),
+        workers=int(os.environ.get("ASGI_WORKERS", os.cpu_count() or 1)),
+    )
@@ -0,0 +1,103 @@
+# benchmarks/boot_time.py
+# ==============================================================================
+# 模块名称：worker 冷启动基准
+# 描述：在全新的子进程中分别以不同的 APP_ROLES 启动应用，测量：
+#         - import app 耗时与 create_app() 耗时
+#         - 启动后加载的模块数量、app 包内模块数量
+#         - 进程常驻内存峰值 (ru_maxrss)
+#       每种角色组合重复多次取中位数，对比 web 进程与全功能进程的冷启动差异。
+#
+# 用法 (默认 config.TestConfig，内存 SQLite，离线即可运行)：
+#   python -m benchmarks.boot_time
+#   python -m benchmarks.boot_time --roles web --roles web,admin,scheduler --repeat 10
+#   python -m benchmarks.boot_time --config config.Config   # 使用 .env 中的 MySQL
+# ==============================================================================
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+DEFAULT_ROLES = ["web", "admin", "web,admin", "web,admin,scheduler"]
+
+# 子进程中执行的测量脚本：输出一行 JSON 后立即退出，不等待调度器等后台线程
+PROBE = r"""
+import json, os, resource, sys, time
+from dotenv import load_dotenv
+load_dotenv()
+roles, config_object = sys.argv[1], sys.argv[2]
+baseline = len(sys.modules)
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+flask_app = app.create_app(config_object, roles=roles)
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_ms": (t2 - t1) * 1000,
+    "modules": len(sys.modules) - baseline,
+    "app_modules": sorted(m for m in sys.modules if m == "app" or m.startswith("app.")),
+    "rules": len(list(flask_app.url_map.iter_rules())),
+    "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def probe(roles, config_object):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, roles, config_object],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    # 启动过程中的打印 (建表提示等) 在前，测量结果是最后一行
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure(roles, config_object, repeat):
+    samples = [probe(roles, config_object) for _ in range(repeat)]
+    return {
+        "roles": roles,
+        "import_ms": statistics.median(s["import_ms"] for s in samples),
+        "create_ms": statistics.median(s["create_ms"] for s in samples),
+        "total_ms": statistics.median(s["import_ms"] + s["create_ms"] for s in samples),
+        "modules": samples[-1]["modules"],
+        "app_modules": samples[-1]["app_modules"],
+        "rules": samples[-1]["rules"],
+        "maxrss_mb": statistics.median(s["maxrss_kb"] for s in samples) / 1024,
+    }
+
+
+def print_report(results):
+    print("=" * 84)
+    print(f"{'APP_ROLES':<22}{'import ms':>10}{'create ms':>11}{'total ms':>10}"
+          f"{'模块数':>8}{'app 模块':>9}{'路由':>6}{'RSS MB':>9}")
+    print("-" * 84)
+    for r in results:
+        print(f"{r['roles']:<22}{r['import_ms']:>10.1f}{r['create_ms']:>11.1f}{r['total_ms']:>10.1f}"
+              f"{r['modules']:>8}{len(r['app_modules']):>9}{r['rules']:>6}{r['maxrss_mb']:>9.1f}")
+    print("=" * 84)
+    full = set(results[-1]["app_modules"])
+    for r in results[:-1]:
+        skipped = sorted(full - set(r["app_modules"]))
+        if skipped:
+            print(f"{r['roles']:<22}未加载: {', '.join(skipped)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按 APP_ROLES 对比 worker 冷启动耗时与内存")
+    parser.add_argument("--roles", action="append", help="角色组合，可重复指定 (默认对比常见组合)")
+    parser.add_argument("--config", default="config.TestConfig", help="配置对象 (默认内存 SQLite)")
+    parser.add_argument("--repeat", type=int, default=5, help="每种组合启动次数，取中位数")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    results = [measure(roles, args.config, args.repeat) for roles in (args.roles or DEFAULT_ROLES)]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
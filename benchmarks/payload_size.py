@@ -0,0 +1,139 @@
+# benchmarks/payload_size.py
+# ==============================================================================
+# 模块名称：房间状态返回体基准
+# 描述：构造一个典型的房间状态 (50 条聊天消息、若干作者、20 首歌单)，对比各编码方式：
+#         - legacy：原来的 jsonify 输出 (ASCII 转义中文)
+#         - json / columnar / msgpack：app/state_encoding.py 协商的三种编码
+#         - 每种 JSON 编码再分别测 不压缩 / gzip / br
+#       输出每次轮询的返回体字节数、序列化 (+压缩) CPU 耗时，以及按轮询间隔折算的
+#       每 1000 名听众每小时出口流量。msgpack / brotli 未安装时跳过对应行。
+#
+# 用法 (不依赖数据库)：
+#   python -m benchmarks.payload_size
+#   python -m benchmarks.payload_size --messages 50 --authors 8 --playlist 20 --iterations 2000
+# ==============================================================================
+import argparse
+import json
+import random
+import time
+
+from app.room_state import playback_timing
+from app.state_encoding import brotli, compress, from_columnar, msgpack, serialize
+
+DEFAULT_CONFIG = {"ROOM_STATE_COMPRESS_MIN_BYTES": 0, "ROOM_STATE_GZIP_LEVEL": 6, "ROOM_STATE_BROTLI_QUALITY": 5}
+
+SAMPLE_LINES = ["这首歌太好听了", "前奏一响就哭了", "单曲循环中", "有人知道歌名吗？", "晚安", "哈哈哈哈", "进入了房间", "离开了房间"]
+
+
+class _Room:
+    playback_status = "playing"
+    current_track_name = "晴天"
+    current_track_file = "3f9a1c2e4b5d.mp3"
+    current_position = 42.5
+    position_at = time.time() - 3
+    is_active = True
+
+
+def build_state(messages, authors, playlist):
+    rnd = random.Random(7)
+    people = [
+        (i + 1, f"听众{i + 1:02d}", "https://placehold.co/80x80?text=VS" if i % 2 else f"/static/uploads/avatars/{i + 1}_a8f3c9.png")
+        for i in range(authors)
+    ]
+    chat = []
+    for i in range(messages):
+        author_id, name, avatar = rnd.choice(people)
+        chat.append({
+            "id": 100000 + i,
+            "author_id": author_id,
+            "author_name": name,
+            "author_avatar": avatar,
+            "created_at": f"{20 + i // 60:02d}:{i % 60:02d}",
+            "content": rnd.choice(SAMPLE_LINES),
+        })
+    return {
+        "playback_status": _Room.playback_status,
+        "current_track_name": _Room.current_track_name,
+        "current_track_file": _Room.current_track_file,
+        **playback_timing(_Room),
+        "is_active": True,
+        "updated_at": "2026-10-19T12:00:00",
+        "messages": chat,
+        "playlist": [
+            {"id": 500 + i, "music_id": 900 + i, "title": f"歌曲 {i + 1}", "position": 1024.0 * (i + 1)}
+            for i in range(playlist)
+        ],
+        "playlist_version": playlist,
+        "playlist_delta": False,
+        "member_count": authors + 1,
+    }
+
+
+def legacy(state):
+    """改造前 jsonify 的输出 (ensure_ascii=True，紧凑分隔符)。"""
+    return json.dumps(state, separators=(",", ":")).encode("utf-8")
+
+
+def measure(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = fn()
+    return body, (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(args):
+    state = build_state(args.messages, args.authors, args.playlist)
+    # 列式结构必须能无损还原
+    assert from_columnar(json.loads(serialize(state, "columnar"))) == state
+
+    cases = [("legacy", "identity", lambda: legacy(state))]
+    for fmt in ("json", "columnar"):
+        cases.append((fmt, "identity", lambda fmt=fmt: serialize(state, fmt)))
+        cases.append((fmt, "gzip", lambda fmt=fmt: compress(serialize(state, fmt), "gzip", DEFAULT_CONFIG)[0]))
+        if brotli is not None:
+            cases.append((fmt, "br", lambda fmt=fmt: compress(serialize(state, fmt), "br", DEFAULT_CONFIG)[0]))
+    if msgpack is not None:
+        cases.append(("msgpack", "identity", lambda: serialize(state, "msgpack")))
+
+    results = []
+    for fmt, encoding, fn in cases:
+        body, micros = measure(fn, args.iterations)
+        results.append({"format": fmt, "encoding": encoding, "bytes": len(body), "encode_us": micros})
+    return results
+
+
+def print_report(results, args):
+    base = results[0]["bytes"]
+    polls_per_hour = 3600 / args.poll_interval
+    print("=" * 78)
+    print(f"{'format':<10}{'encoding':<10}{'bytes':>9}{'vs legacy':>11}{'encode µs':>12}{'MB/h per 1k listeners':>24}")
+    print("-" * 78)
+    for r in results:
+        egress = r["bytes"] * polls_per_hour * 1000 / 1024 / 1024
+        print(f"{r['format']:<10}{r['encoding']:<10}{r['bytes']:>9}{r['bytes'] / base:>10.0%}"
+              f"{r['encode_us']:>12.1f}{egress:>24.1f}")
+    print("=" * 78)
+    skipped = [name for name, mod in (("msgpack", msgpack), ("brotli", brotli)) if mod is None]
+    if skipped:
+        print(f"未安装: {', '.join(skipped)} (pip install {' '.join(skipped)})，对应编码已跳过")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对比房间状态各编码方式的返回体大小与序列化耗时")
+    parser.add_argument("--messages", type=int, default=50, help="聊天消息条数 (默认 CHAT_RING_SIZE)")
+    parser.add_argument("--authors", type=int, default=8, help="消息作者人数")
+    parser.add_argument("--playlist", type=int, default=20, help="歌单长度")
+    parser.add_argument("--iterations", type=int, default=1000, help="每种编码重复次数")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="轮询间隔 (秒)，用于折算流量")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_report(results, args)
+
+
+if __name__ == "__main__":
+    main()
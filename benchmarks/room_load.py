@@ -0,0 +1,392 @@
+# benchmarks/room_load.py
+# ==============================================================================
+# 模块名称：房间轮询压测
+# 描述：模拟「房间里坐满了轮询的听众」的负载：
+#         - 每个听众每 poll_interval 秒请求一次 /rooms/<code>/state，偶尔发送聊天
+#         - 每个房主同样轮询，并每 toggle_interval 秒切歌/暂停/继续一次
+#       直接驱动真实的 Flask 应用 (create_app)，可选 Flask test client (进程内)
+#       或本地 WSGI 服务器 (走真实 HTTP)。结束后输出吞吐、各动作延迟分位数，
+#       以及服务端每个 endpoint 的平均 SQL 条数 (来自 app.metrics)。
+#
+# 用法 (默认使用临时 SQLite 文件，离线即可运行)：
+#   python -m benchmarks.room_load --rooms 20 --listeners 500 --duration 30
+#   python -m benchmarks.room_load --transport http --database-url mysql+pymysql://...
+# 压测会写入大量 bench_ 前缀的数据，请使用专用的测试库。
+# ==============================================================================
+import argparse
+import heapq
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import Config  # noqa: E402
+from app import create_app  # noqa: E402
+from benchmarks.seed import SeedSpec, seed  # noqa: E402
+
+
+def build_config(database_url, admin_url):
+    """在 Config 基础上生成压测配置 (web 角色、关闭 CSRF，SQLite 使用文件库并放宽锁等待)。"""
+    overrides = {
+        "SQLALCHEMY_DATABASE_URI": database_url,
+        "SQLALCHEMY_BINDS": {"admin_db": admin_url or database_url},
+        "WTF_CSRF_ENABLED": False,
+        "APP_ROLES": "web",  # 只压测用户端接口，与听众 worker 的部署方式一致
+        "SQL_PROFILER_SLOW_MS": 10 ** 6,
+    }
+    if database_url.startswith("sqlite"):
+        overrides["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "connect_args": {"timeout": 30, "check_same_thread": False},
+        }
+    return type("BenchConfig", (Config,), overrides)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+# ==============================================================================
+# 传输层：test client / 本地 HTTP
+# ==============================================================================
+class TestClientTransport:
+    def __init__(self, app):
+        self.app = app
+
+    def session(self, cookie):
+        client = self.app.test_client()
+        client.set_cookie(self.app.config.get("SESSION_COOKIE_NAME", "session"), cookie)
+        return client
+
+    def request(self, client, method, path, form=None):
+        if method == "GET":
+            resp = client.get(path)
+        else:
+            resp = client.post(path, data=form or {})
+        resp.get_data()
+        return resp.status_code
+
+
+class HttpTransport:
+    """本地 WSGI 服务器 (werkzeug，多线程，HTTP/1.1 长连接)。"""
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class KeepAliveHandler(WSGIRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.cookie_name = app.config.get("SESSION_COOKIE_NAME", "session")
+        self.server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=KeepAliveHandler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, name="bench-wsgi", daemon=True)
+        self.thread.start()
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        return conn
+
+    def session(self, cookie):
+        return f"{self.cookie_name}={cookie}"
+
+    def request(self, cookie, method, path, form=None):
+        headers = {"Cookie": cookie}
+        body = None
+        if method == "POST":
+            body = urlencode(form or {})
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        conn = self._conn()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            return resp.status
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def close(self):
+        self.server.shutdown()
+
+
+# ==============================================================================
+# 模拟客户端
+# ==============================================================================
+class Actor:
+    """一个模拟用户：听众只轮询和聊天，房主额外控制播放。"""
+
+    def __init__(self, session, code, is_owner, args, music_ids, rnd):
+        self.session = session
+        self.code = code
+        self.is_owner = is_owner
+        self.args = args
+        self.music_ids = music_ids
+        self.rnd = rnd
+        self.next_toggle = args.toggle_interval * rnd.random()
+        self.toggle_step = 0
+
+    def next_action(self, elapsed):
+        """返回 (动作名, 方法, 路径, 表单)。"""
+        if self.is_owner and elapsed >= self.next_toggle:
+            self.next_toggle = elapsed + self.args.toggle_interval
+            self.toggle_step += 1
+            step = self.toggle_step % 3
+            if step == 1:
+                form = {"music_id": self.rnd.choice(self.music_ids)}
+            else:
+                form = {"action": "pause" if step == 2 else "play",
+                        "position": f"{self.rnd.uniform(0, 200):.1f}"}
+            return "toggle_playback", "POST", f"/rooms/{self.code}/toggle", form
+        if self.rnd.random() < self.args.message_ratio:
+            return "send_message", "POST", f"/rooms/{self.code}/messages", {"content": "bench hello"}
+        return "room_state", "GET", f"/rooms/{self.code}/state", None
+
+
+class WorkerResult:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.actions = 0
+
+
+def run_worker(transport, actors, args, start, result):
+    heap = [(args.poll_interval * i / max(1, len(actors)), i) for i in range(len(actors))]
+    heapq.heapify(heap)
+    deadline = start + args.duration
+
+    while heap:
+        due, idx = heapq.heappop(heap)
+        due_at = start + due
+        now = time.perf_counter()
+        if due_at >= deadline:
+            break
+        if due_at > now:
+            time.sleep(due_at - now)
+
+        actor = actors[idx]
+        name, method, path, form = actor.next_action(due)
+        t0 = time.perf_counter()
+        lag = t0 - due_at
+        try:
+            status = transport.request(actor.session, method, path, form)
+        except Exception:
+            status = "exception"
+            result.errors += 1
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+
+        result.latencies.setdefault(name, []).append(elapsed_ms)
+        key = (name, status)
+        result.statuses[key] = result.statuses.get(key, 0) + 1
+        if status != "exception" and status >= 400:
+            result.errors += 1
+        result.lag_total += max(0.0, lag)
+        result.lag_max = max(result.lag_max, lag)
+        result.actions += 1
+
+        # 轮询间隔加 ±10% 抖动，避免所有客户端同一时刻到达
+        interval = args.poll_interval * actor.rnd.uniform(0.9, 1.1)
+        heapq.heappush(heap, (due + interval, idx))
+
+
+# ==============================================================================
+# 入口
+# ==============================================================================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="房间轮询负载压测")
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL"),
+                        help="默认使用临时 SQLite 文件")
+    parser.add_argument("--admin-url", default=os.environ.get("BENCH_DATABASE_URL_ADMIN"),
+                        help="admin_db 连接 (默认与 --database-url 相同)")
+    parser.add_argument("--transport", choices=("testclient", "http"), default="testclient")
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--listeners", type=int, default=500)
+    parser.add_argument("--tracks", type=int, default=200)
+    parser.add_argument("--playlist-per-room", type=int, default=20)
+    parser.add_argument("--messages-per-room", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0, help="压测时长 (秒)")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="每个客户端的轮询间隔 (秒)")
+    parser.add_argument("--toggle-interval", type=float, default=10.0, help="房主播放控制间隔 (秒)")
+    parser.add_argument("--message-ratio", type=float, default=0.02, help="一次动作为发送聊天的概率")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发工作线程数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="把结果另存为 JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.rooms > 1000:
+        raise SystemExit("--rooms 不能超过 1000 (房间号为 6 位)")
+
+    tmp_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(prefix="voice_share_bench_", suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{tmp_path}"
+
+    try:
+        report = run(args, database_url)
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def run(args, database_url):
+    app = create_app(build_config(database_url, args.admin_url))
+
+    with app.app_context():
+        t0 = time.perf_counter()
+        data = seed(SeedSpec(
+            rooms=args.rooms,
+            listeners=args.listeners,
+            tracks=args.tracks,
+            playlist_per_room=args.playlist_per_room,
+            messages_per_room=args.messages_per_room,
+            seed=args.seed,
+        ))
+        seed_seconds = time.perf_counter() - t0
+
+    metrics = app.extensions.get("metrics")
+    if metrics is not None:
+        metrics.reset()
+
+    transport = HttpTransport(app) if args.transport == "http" else TestClientTransport(app)
+    serializer = app.session_interface.get_signing_serializer(app)
+
+    rnd = random.Random(args.seed)
+    actors = []
+    for user_id, _room_id, code in data.owners:
+        cookie = serializer.dumps({"_user_id": str(user_id), "_fresh": True})
+        actors.append(Actor(transport.session(cookie), code, True, args, data.music_ids, random.Random(rnd.random())))
+    for user_id, _room_id, code in data.listeners:
+        cookie = serializer.dumps({"_user_id": str(user_id), "_fresh": True})
+        actors.append(Actor(transport.session(cookie), code, False, args, data.music_ids, random.Random(rnd.random())))
+
+    workers = max(1, min(args.concurrency, len(actors)))
+    slices = [actors[i::workers] for i in range(workers)]
+    results = [WorkerResult() for _ in range(workers)]
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_worker, args=(transport, slices[i], args, start, results[i]), daemon=True)
+        for i in range(workers)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    if isinstance(transport, HttpTransport):
+        transport.close()
+    app.extensions["write_behind"].flush()
+
+    return build_report(args, database_url, data, seed_seconds, wall, results, metrics)
+
+
+def build_report(args, database_url, data, seed_seconds, wall, results, metrics):
+    latencies, statuses = {}, {}
+    errors = actions = 0
+    lag_total, lag_max = 0.0, 0.0
+    for r in results:
+        for name, values in r.latencies.items():
+            latencies.setdefault(name, []).extend(values)
+        for key, n in r.statuses.items():
+            statuses[key] = statuses.get(key, 0) + n
+        errors += r.errors
+        actions += r.actions
+        lag_total += r.lag_total
+        lag_max = max(lag_max, r.lag_max)
+
+    actions_report = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        actions_report[name] = {
+            "count": len(values),
+            "throughput": len(values) / wall if wall else 0.0,
+            "p50_ms": percentile(values, 50),
+            "p90_ms": percentile(values, 90),
+            "p99_ms": percentile(values, 99),
+            "max_ms": values[-1],
+            "statuses": {str(s): n for (a, s), n in statuses.items() if a == name},
+        }
+
+    server = {}
+    if metrics is not None:
+        for endpoint, item in sorted(metrics.endpoint_summary().items()):
+            if not item["requests"]:
+                continue
+            server[endpoint] = {
+                "requests": item["requests"],
+                "queries_per_request": item["queries"] / item["requests"],
+                "avg_ms": item["seconds"] / item["requests"] * 1000,
+            }
+
+    return {
+        "database": database_url.split("@")[-1],
+        "transport": args.transport,
+        "clients": len(data.owners) + len(data.listeners),
+        "rooms": len(data.owners),
+        "seed_seconds": seed_seconds,
+        "duration_seconds": wall,
+        "requests": actions,
+        "errors": errors,
+        "throughput": actions / wall if wall else 0.0,
+        "target_throughput": (len(data.owners) + len(data.listeners)) / args.poll_interval,
+        "avg_schedule_lag_ms": lag_total / actions * 1000 if actions else 0.0,
+        "max_schedule_lag_ms": lag_max * 1000,
+        "actions": actions_report,
+        "server": server,
+    }
+
+
+def print_report(report):
+    print("=" * 72)
+    print(f"数据库: {report['database']}  传输: {report['transport']}  "
+          f"客户端: {report['clients']}  房间: {report['rooms']}")
+    print(f"数据准备 {report['seed_seconds']:.2f}s，压测 {report['duration_seconds']:.1f}s，"
+          f"请求 {report['requests']} 次，错误 {report['errors']} 次")
+    print(f"吞吐 {report['throughput']:.1f} req/s (目标 {report['target_throughput']:.1f} req/s)，"
+          f"调度延迟 平均 {report['avg_schedule_lag_ms']:.1f}ms / 最大 {report['max_schedule_lag_ms']:.1f}ms")
+    print("-" * 72)
+    print(f"{'动作':<18}{'次数':>8}{'req/s':>9}{'p50ms':>9}{'p90ms':>9}{'p99ms':>9}{'maxms':>9}  状态码")
+    for name, item in report["actions"].items():
+        statuses = ", ".join(f"{s}×{n}" for s, n in sorted(item["statuses"].items()))
+        print(f"{name:<18}{item['count']:>8}{item['throughput']:>9.1f}{item['p50_ms']:>9.2f}"
+              f"{item['p90_ms']:>9.2f}{item['p99_ms']:>9.2f}{item['max_ms']:>9.2f}  {statuses}")
+    if report["server"]:
+        print("-" * 72)
+        print(f"{'服务端 endpoint':<28}{'请求':>8}{'SQL/请求':>10}{'平均ms':>10}")
+        for endpoint, item in report["server"].items():
+            print(f"{endpoint:<28}{item['requests']:>8}{item['queries_per_request']:>10.2f}{item['avg_ms']:>10.2f}")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
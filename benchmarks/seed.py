@@ -0,0 +1,150 @@
+# benchmarks/seed.py
+# ==============================================================================
+# 模块名称：压测数据生成
+# 描述：按给定规模批量写入用户、已审核音乐、房间、房间成员、播放列表和聊天消息。
+#       全部使用 Core 多行 INSERT，不依赖 MySQL 专有语法，可同时用于 SQLite 与 MySQL。
+#       用户名带上本次运行的前缀，避免在同一个库中重复压测时唯一键冲突。
+# ==============================================================================
+import random
+import string
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import Music, Room, RoomChatEvent, RoomMember, RoomPlaylist, User
+from app.playlist_store import POSITION_GAP
+
+BENCH_PASSWORD = "bench-password"
+
+
+@dataclass
+class SeedSpec:
+    rooms: int = 20
+    listeners: int = 500          # 房间成员总数 (平均分配到各房间)
+    tracks: int = 200             # 已审核音乐数量
+    playlist_per_room: int = 20
+    messages_per_room: int = 50
+    seed: int = 42
+
+
+@dataclass
+class SeededData:
+    run_id: str
+    owners: list = field(default_factory=list)      # [(user_id, room_id, room_code)]
+    listeners: list = field(default_factory=list)   # [(user_id, room_id, room_code)]
+    music_ids: list = field(default_factory=list)
+
+
+def _chunks(rows, size=1000):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _bulk_insert(model, rows):
+    for chunk in _chunks(rows):
+        db.session.execute(insert(model), chunk)
+
+
+def _ids_by_username(prefix):
+    rows = db.session.execute(
+        select(User.id, User.username).where(User.username.like(f"{prefix}%"))
+    ).all()
+    return {username: uid for uid, username in rows}
+
+
+def seed(spec: SeedSpec) -> SeededData:
+    """写入压测数据并返回各角色的 id 映射 (需要应用上下文)。"""
+    rnd = random.Random(spec.seed)
+    run_id = "".join(rnd.choices(string.ascii_lowercase + string.digits, k=6))
+    prefix = f"bench_{run_id}_"
+    now = datetime.utcnow()
+    data = SeededData(run_id=run_id)
+
+    # 1. 用户：所有账号共用同一个密码哈希，避免为每个用户计算 PBKDF2
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    usernames = [f"{prefix}owner_{i}" for i in range(spec.rooms)]
+    usernames += [f"{prefix}user_{i}" for i in range(spec.listeners)]
+    _bulk_insert(User, [
+        {"username": name, "password_hash": password_hash, "nickname": name[-10:],
+         "created_at": now, "updated_at": now}
+        for name in usernames
+    ])
+    user_ids = _ids_by_username(prefix)
+
+    # 2. 已审核音乐 (挂在第一个房主名下)
+    uploader = user_ids[f"{prefix}owner_0"]
+    _bulk_insert(Music, [
+        {"user_id": uploader, "title": f"Bench Track {run_id} {i}",
+         "original_filename": f"track_{i}.mp3", "stored_filename": f"bench_{run_id}_{i}.mp3",
+         "status": "approved", "uploaded_at": now, "created_at": now, "updated_at": now}
+        for i in range(spec.tracks)
+    ])
+    data.music_ids = list(db.session.execute(
+        select(Music.id).where(Music.stored_filename.like(f"bench_{run_id}_%"))
+    ).scalars())
+
+    # 3. 房间：房间号 6 位，由运行前缀的前 3 位 + 序号组成
+    rooms = []
+    for i in range(spec.rooms):
+        rooms.append({
+            "owner_id": user_ids[f"{prefix}owner_{i}"],
+            "name": f"Bench Room {i}",
+            "code": f"{run_id[:3]}{i:03d}".upper(),
+            "is_active": True,
+            "playback_status": "paused",
+            "current_position": 0.0,
+            "created_at": now,
+            "updated_at": now,
+        })
+    _bulk_insert(Room, rooms)
+    room_ids = dict(db.session.execute(
+        select(Room.code, Room.id).where(Room.code.in_([r["code"] for r in rooms]))
+    ).all())
+    for i, room in enumerate(rooms):
+        data.owners.append((room["owner_id"], room_ids[room["code"]], room["code"]))
+
+    # 4. 成员：听众轮流分配到各房间
+    members = []
+    for i in range(spec.listeners):
+        _owner, room_id, code = data.owners[i % spec.rooms]
+        uid = user_ids[f"{prefix}user_{i}"]
+        members.append({"room_id": room_id, "user_id": uid, "joined_at": now, "last_seen_at": now})
+        data.listeners.append((uid, room_id, code))
+    _bulk_insert(RoomMember, members)
+
+    # 5. 播放列表
+    playlist = []
+    for _owner, room_id, _code in data.owners:
+        for j in range(spec.playlist_per_room):
+            playlist.append({
+                "room_id": room_id,
+                "music_id": rnd.choice(data.music_ids),
+                "position": POSITION_GAP * (j + 1),
+                "created_at": now + timedelta(milliseconds=j),
+                "updated_at": now,
+            })
+    _bulk_insert(RoomPlaylist, playlist)
+
+    # 6. 聊天消息：显式给出 id，保证 (room_id, id) 在各数据库上都可直接插入
+    next_id = (db.session.execute(select(func.max(RoomChatEvent.id))).scalar() or 0) + 1
+    messages = []
+    for owner_id, room_id, _code in data.owners:
+        for j in range(spec.messages_per_room):
+            messages.append({
+                "id": next_id,
+                "room_id": room_id,
+                "user_id": owner_id,
+                "author_name": "bench",
+                "author_avatar": None,
+                "kind": 0,
+                "content": f"seed message {j}",
+                "created_at": now - timedelta(seconds=spec.messages_per_room - j),
+            })
+            next_id += 1
+    _bulk_insert(RoomChatEvent, messages)
+
+    db.session.commit()
+    return data
@@ -7,6 +7,9 @@ class Config:
 
     BASE_DIR = Path(__file__).resolve().parent
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key")
+    # 进程角色 (逗号分隔，见 app.create_app)：web 用户端 / admin 管理后台 / scheduler 定时任务
+    # 多 worker 部署时建议：听众 worker 只开 web，单独一个进程开 admin,scheduler
+    APP_ROLES = os.environ.get("APP_ROLES", "web,admin,scheduler")
     # SQLALCHEMY_DATABASE_URI = os.environ.get(
     #     "DATABASE_URL", f"sqlite:///{BASE_DIR / 'app.db'}"
     # )
@@ -19,13 +22,38 @@ class Config:
         "admin_db": os.environ.get("DATABASE_URL_ADMIN")
     }
 
+    # [可选] 只读副本：房间轮询、热门房间、数据中心等只读接口的查询走副本 (见 app/db_routing.py)
+    if os.environ.get("DATABASE_URL_REPLICA"):
+        SQLALCHEMY_BINDS["replica_db"] = os.environ.get("DATABASE_URL_REPLICA")
+    # 读己之写：用户写入后该时长内的读取仍走主库，应大于副本的常见复制延迟
+    REPLICA_STICKY_SECONDS = 5
+
     # 设置每次新连接自动使用 READ COMMITTED 隔离级别
     SQLALCHEMY_ENGINE_OPTIONS = {
         "connect_args": {
             "init_command": "SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED"
         },
-        "pool_pre_ping": True,
-        "pool_recycle": 300
+    }
+
+    # 各 bind 的连接池配置 (见 app/db_pool.py)，未列出的 bind 沿用 default
+    # liveness: pessimistic = 每次取连接先 ping；optimistic = 不 ping，靠 pool_recycle 回收、断线时整池重建
+    DB_POOL_PROFILES = {
+        # 业务连接：房间轮询等短请求，每次多一个 ping 往返不划算
+        "default": {
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+            "max_overflow": int(os.environ.get("DB_POOL_MAX_OVERFLOW", 20)),
+            "pool_timeout": 5,
+            "pool_recycle": 280,  # 小于 MySQL wait_timeout
+            "liveness": os.environ.get("DB_POOL_LIVENESS", "optimistic"),
+        },
+        # 特权连接：备份/恢复/维护，用得少但一次占用很久，连接可能已空闲超时
+        "admin_db": {
+            "pool_size": 2,
+            "max_overflow": 2,
+            "pool_timeout": 60,
+            "pool_recycle": 3600,
+            "liveness": "pessimistic",
+        },
     }
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -37,10 +65,127 @@ class Config:
     ALLOWED_MUSIC_EXTENSIONS = {"mp3"}
     MAX_MUSIC_FILE_MB = 50
     LISTEN_RECORD_WINDOW_DAYS = 30
+    # 历史表按天分区，sp_daily_maintenance 整块删除过期分区
+    HISTORY_PARTITIONING_ENABLED = True
+    HISTORY_PARTITION_DAYS_AHEAD = 7
+    HISTORY_RETENTION_DAYS = {
+        "listen_record": LISTEN_RECORD_WINDOW_DAYS,
+        "room_participation_record": LISTEN_RECORD_WINDOW_DAYS,
+        "room_message": 90,
+        "room_chat_event": 90,
+        "system_audit_log": 180,
+    }
+    # 维护任务每批 DELETE/UPDATE 的最大行数
+    MAINTENANCE_BATCH_SIZE = 5000
+    # 维护任务超过该秒数没有进度 (执行进程已退出) 时视为中断，允许重新启动
+    MAINTENANCE_JOB_STALE_SECONDS = 600
+    # 启动时自动应用未执行的 schema 迁移；关闭后启动只做版本检查，
+    # 由 `flask migrate-schema` 在发布前执行 (滚动重启时不在线上库执行 DDL)
+    SCHEMA_AUTO_MIGRATE = os.environ.get("SCHEMA_AUTO_MIGRATE", "1") == "1"
     ROOM_PLAYBACK_SYNC_INTERVAL = 3  # seconds
+    DATA_CENTER_PAGE_SIZE = 50  # 数据中心每页行数 (游标分页)
+    SEARCH_USE_FULLTEXT = True  # 数据中心模糊搜索使用 FULLTEXT (ngram)，关闭则退回 LIKE
+    # 同一用户在同一房间的访问会话窗口：窗口内重复进入/刷新不再写参与记录
+    ROOM_SESSION_WINDOW_MINUTES = 30
+
+    # 聊天环形缓冲：每个房间在内存中保留最近 N 条消息，最多缓存的房间数
+    CHAT_RING_SIZE = 50
+    CHAT_RING_MAX_ROOMS = 1000
+
+    # 房间状态返回体 (见 app/state_encoding.py)：超过该字节数才压缩，gzip 级别与 brotli 质量
+    ROOM_STATE_COMPRESS_MIN_BYTES = 512
+    ROOM_STATE_GZIP_LEVEL = 6
+    ROOM_STATE_BROTLI_QUALITY = 5
+
+    # 播放状态防抖 (见 app/playback_state.py)：播放/暂停/拖动每个房间至多每 N 秒写一次 room 表，
+    # 切歌/停止尽快写回但两次写入至少间隔 PLAYBACK_MIN_WRITE_SECONDS
+    PLAYBACK_DEBOUNCE_ENABLED = True
+    PLAYBACK_PERSIST_SECONDS = 1.0
+    PLAYBACK_MIN_WRITE_SECONDS = 0.25
+    PLAYBACK_STATE_MAX_ROOMS = 5000
+
+    # 下一首预取 (见 app/track_prefetch.py)：客户端在距离结束 LEAD 秒 (+ 0~JITTER 秒随机错开) 时缓冲下一首，
+    # 服务端提前把下一首读入页缓存，WARM_TTL 秒内同一文件不重复预热
+    TRACK_PREFETCH_ENABLED = True
+    TRACK_PREFETCH_LEAD_SECONDS = 30
+    TRACK_PREFETCH_JITTER_SECONDS = 15
+    TRACK_WARM_TTL_SECONDS = 300
+    TRACK_PREFETCH_MAX_ROOMS = 5000
+    # 音乐文件名唯一且不会改写，浏览器可长期缓存 (秒)；0 表示不修改缓存头
+    MUSIC_CACHE_MAX_AGE = 365 * 24 * 3600
+
+    # 写接口限流 (见 app/rate_limit.py)：按 类别 + 用户 + 房间 的令牌桶，
+    # rate = 每秒补充的令牌数，burst = 最多连续请求数，concurrency = 本进程内同时处理中的请求上限 (可省略)；
+    # 超出时返回 429 + Retry-After。多 worker 部署可设 RATE_LIMIT_STORAGE_URL=redis://... 共享限流状态
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_STORAGE_URL = os.environ.get("RATE_LIMIT_STORAGE_URL", "memory://")
+    RATE_LIMIT_MAX_KEYS = 10000  # memory:// 最多保留的令牌桶数 (LRU)
+    RATE_LIMIT_OVERLOAD_RETRY_SECONDS = 1
+    RATE_LIMITS = {
+        "chat": {"rate": 1.0, "burst": 5, "concurrency": 32},
+        "playback": {"rate": 4.0, "burst": 10, "concurrency": 32},
+        "playlist": {"rate": 0.5, "burst": 10},
+        "room": {"rate": 0.2, "burst": 10},
+        "account": {"rate": 0.5, "burst": 10},
+    }
+
+    # 房间事件总线 (见 app/room_events.py)：local = 单进程；database = 多 worker 部署，经 room_event 表转发
+    ROOM_EVENT_BUS = os.environ.get("ROOM_EVENT_BUS", "local")
+    ROOM_EVENT_POLL_SECONDS = 0.5  # 读取其他进程事件的间隔，也是批量写入的最长等待
+    ROOM_EVENT_BATCH_SIZE = 500
+    ROOM_EVENT_MAX_BACKLOG = 10000
+    ROOM_EVENT_GAP_SECONDS = 5.0  # 未提交的自增 id 最多等待的时间
+    ROOM_EVENT_RETENTION_MINUTES = 60
+
+    # ASGI 轮询/推送服务 (asgi.py)：房间页 SSE 地址前缀，例如 "/push" (由反向代理转发到 ASGI 服务)；
+    # 留空则房间页只使用 Flask 的 2 秒轮询
+    ROOM_PUSH_URL = os.environ.get("ROOM_PUSH_URL", "")
+    # ASGI 服务的数据库连接，留空时依次使用只读副本、主库 (自动换成 aiomysql 驱动)
+    ASGI_DATABASE_URL = os.environ.get("ASGI_DATABASE_URL")
+    ASGI_DB_POOL_SIZE = 10
+    ASGI_DB_MAX_OVERFLOW = 10
+    # 每个房间检查一次状态变化的间隔，以及空闲连接的心跳间隔 (秒)；
+    # ROOM_EVENT_BUS=database 时由 room_event 唤醒，只按 ROOM_PUSH_FALLBACK_SECONDS 兜底检查
+    ROOM_PUSH_POLL_SECONDS = 1.0
+    ROOM_PUSH_FALLBACK_SECONDS = 10
+    ROOM_PUSH_HEARTBEAT_SECONDS = 15
+
+    # 数据库健康快照：概览后台刷新间隔，单表详情 (索引/外键) 缓存有效期
+    HEALTH_SNAPSHOT_INTERVAL_SECONDS = 300
+    HEALTH_DETAIL_TTL_SECONDS = 300
+
+    # SQL 剖析：最多保留的语句指纹数、每个指纹保留的耗时样本数 (用于 p50/p99)、慢查询打印阈值
+    SQL_PROFILER_ENABLED = True
+    SQL_PROFILER_MAX_STATEMENTS = 500
+    SQL_PROFILER_SAMPLE_SIZE = 256
+    SQL_PROFILER_SLOW_MS = 200
+
+    # 运行指标：GET /metrics (Prometheus 文本格式)；设置 METRICS_TOKEN 后需带 Bearer 令牌访问
+    METRICS_ENABLED = True
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+    # 写后缓冲：听歌/参与记录批量落库 (条数或秒数任一达到阈值即写入)
+    WRITE_BEHIND_ENABLED = True
+    WRITE_BEHIND_BATCH_SIZE = 200
+    WRITE_BEHIND_FLUSH_SECONDS = 2.0
+    WRITE_BEHIND_MAX_BACKLOG = 10000
+    # 单行数据写入失败 (非连接错误) 累计达到该次数后丢弃
+    WRITE_BEHIND_MAX_ATTEMPTS = 3
 
 
 class TestConfig(Config):
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    WTF_CSRF_ENABLED = False
+    APP_ROLES = "web,admin"  # 测试进程不启动调度器
+    # 默认连接与 admin_db 指向同一个共享缓存的内存库 (连接池持有连接期间数据一直存在)，
+    # 建表走 create_with_sqlite.py。后台线程 (维护任务等) 的连接要能在夹具结束时关闭，
+    # 引擎参数只作用于默认连接，bind 需单独带上
+    SQLALCHEMY_DATABASE_URI = "sqlite:///file:voice_share_test?mode=memory&cache=shared&uri=true"
+    SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"check_same_thread": False}}
+    SQLALCHEMY_BINDS = {"admin_db": {"url": SQLALCHEMY_DATABASE_URI, **SQLALCHEMY_ENGINE_OPTIONS}}
+    HISTORY_PARTITIONING_ENABLED = False
+    SEARCH_USE_FULLTEXT = False
+    WRITE_BEHIND_ENABLED = False
+    PLAYBACK_DEBOUNCE_ENABLED = False
+    RATE_LIMIT_ENABLED = False
 
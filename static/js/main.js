@@ -49,6 +49,8 @@ function initGlobalControls() {
         if (musicIn) formData.append('music_id', musicIn.value);
         const itemIn = form.querySelector('input[name="item_id"]');
         if (itemIn) formData.append('item_id', itemIn.value);
+        const beforeIn = form.querySelector('input[name="before_id"]');
+        if (beforeIn) formData.append('before_id', beforeIn.value);
     }
 
     // 补全进度
@@ -58,6 +60,8 @@ function initGlobalControls() {
       pos = audio.currentTime;
     }
     formData.append('position', pos);
+    // 读取进度时的服务器时间，服务器据此扣除请求在途时间
+    if (window.roomServerNow) formData.append('position_at', window.roomServerNow());
 
     // 5. 发送请求
     // 优先用 form.action，没有则用 roomConfig
@@ -69,12 +73,17 @@ function initGlobalControls() {
     try {
       const response = await fetch(targetUrl, {
         method: 'POST',
+        headers: { Accept: 'application/json' },
         body: formData
       });
 
       if (response.ok) {
         // 成功！立即触发同步
         if (window.manualRefreshState) await window.manualRefreshState();
+      } else if (response.status === 429) {
+        // 被限流：本次操作未生效，按服务器状态刷新界面
+        console.warn(`操作太频繁，${response.headers.get('Retry-After')} 秒后再试`);
+        if (window.manualRefreshState) await window.manualRefreshState();
       } else {
         console.error("操作失败:", response.status);
       }
@@ -109,6 +118,7 @@ function initChatControls() {
     try {
       const response = await fetch(chatForm.action, {
         method: 'POST',
+        headers: { Accept: 'application/json' },
         body: formData
       });
       if (response.ok) {
@@ -116,6 +126,9 @@ function initChatControls() {
         if (window.manualRefreshState) await window.manualRefreshState();
         const chatLog = document.querySelector("#chat-log");
         if(chatLog) chatLog.scrollTop = chatLog.scrollHeight;
+      } else if (response.status === 429) {
+        // 发送太频繁：保留输入内容，提示稍后再发
+        alert(`发送太频繁，请 ${response.headers.get('Retry-After')} 秒后再试`);
       }
     } catch (e) { console.error(e); }
     finally {
@@ -128,7 +141,7 @@ function initChatControls() {
 // --- 3. 房间同步核心 ---
 function initRoomSync() {
   if (!window.roomConfig) return;
-  const { stateUrl, audioSelector, isOwner, toggleUrl, playlistDeleteUrl } = window.roomConfig;
+  const { stateUrl, eventsUrl, audioSelector, isOwner, toggleUrl, playlistDeleteUrl, playlistMoveUrl } = window.roomConfig;
   const audio = document.querySelector(audioSelector);
 
   const label = document.querySelector("#state-label");
@@ -145,6 +158,91 @@ function initRoomSync() {
   // 用于自动切歌的状态
   let currentPlaylist = [];
   let currentTrackName = "";
+  // 已有的歌单版本：轮询时带上，服务器只返回之后新增/移动过的条目
+  let playlistVersion = null;
+
+  function mergePlaylist(state) {
+    if (!state.playlist) return;
+    if (state.playlist_delta) {
+      const byId = new Map(currentPlaylist.map(item => [item.id, item]));
+      state.playlist.forEach(item => byId.set(item.id, item));
+      currentPlaylist = [...byId.values()].sort((a, b) => a.position - b.position || a.id - b.id);
+    } else {
+      currentPlaylist = state.playlist;
+    }
+    playlistVersion = state.playlist_version;
+  }
+
+  // --- 下一首预取：距离结束 prefetch_lead_seconds (+ 本客户端随机错开的 0~jitter 秒) 时提前缓冲，
+  //     避免全房间在切歌瞬间同时下载；歌曲结束时听众直接切到已缓冲的下一首 ---
+  let nextTrack = null;
+  let prefetchLead = 30;
+  let prefetchSpread = 0;
+  let prefetchedFile = null;
+  let finishedTrack = null;  // 本地已切到下一首、等待服务器确认期间忽略旧曲目的状态
+  const prefetchAudio = new Audio();
+  prefetchAudio.preload = "auto";
+  prefetchAudio.muted = true;
+
+  function updateNextTrack(state) {
+    if (!("next_track" in state)) return;
+    const file = state.next_track ? state.next_track.file : null;
+    if (file !== (nextTrack ? nextTrack.file : null)) {
+      prefetchSpread = Math.random() * (state.prefetch_jitter_seconds || 0);
+    }
+    nextTrack = state.next_track;
+    if (state.prefetch_lead_seconds != null) prefetchLead = state.prefetch_lead_seconds;
+  }
+
+  function maybePrefetch() {
+    if (!audio || !nextTrack || prefetchedFile === nextTrack.file) return;
+    if (!audio.duration || !isFinite(audio.duration)) return;
+    if (audio.duration - audio.currentTime > prefetchLead + prefetchSpread) return;
+    prefetchedFile = nextTrack.file;
+    prefetchAudio.src = nextTrack.url;
+    prefetchAudio.load();
+  }
+
+  // --- 时钟同步：NTP 方式估计 (服务器时间 - 本地时间)，取最近若干次中往返最短的样本 ---
+  const clockSamples = [];
+  let clockOffset = 0;
+  function addClockSample(t0, t1, serverTime) {
+    if (!serverTime) return;
+    clockSamples.push({ rtt: t1 - t0, offset: serverTime - (t0 + t1) / 2 });
+    if (clockSamples.length > 8) clockSamples.shift();
+    clockOffset = clockSamples.reduce((best, s) => (s.rtt < best.rtt ? s : best)).offset;
+  }
+  const serverNow = () => Date.now() / 1000 + clockOffset;
+  window.roomServerNow = serverNow;
+
+  // 最新的播放锚点：position_at 时刻进度为 anchor_position，之后按 playback_rate 前进
+  let playback = null;
+  function targetPosition() {
+    if (!playback || playback.position_at == null) return playback ? playback.current_position : 0;
+    return playback.anchor_position + playback.playback_rate * Math.max(serverNow() - playback.position_at, 0);
+  }
+
+  // 播放中的漂移修正：偏差大时直接跳转，小偏差用 ±5% 播放速率慢慢追平，避免频繁跳音
+  function correctDrift() {
+    if (!audio) return;
+    // 本地已切到下一首而服务器尚未确认时，锚点仍属于上一首
+    const switching = finishedTrack && Date.now() < finishedTrack.until;
+    if (!playback || playback.playback_rate === 0 || audio.paused || !audio.src || switching) {
+      audio.playbackRate = 1;
+      return;
+    }
+    const target = targetPosition();
+    if (audio.duration && target > audio.duration) return;
+    const drift = audio.currentTime - target;
+    if (Math.abs(drift) > 1) {
+      audio.currentTime = target;
+      audio.playbackRate = 1;
+    } else if (Math.abs(drift) > 0.03) {
+      audio.playbackRate = 1 - Math.max(-0.05, Math.min(0.05, drift * 0.5));
+    } else {
+      audio.playbackRate = 1;
+    }
+  }
 
   if (audio) {
     audio.addEventListener("timeupdate", () => {
@@ -160,7 +258,16 @@ function initRoomSync() {
 
     // 自动切歌逻辑
     audio.addEventListener("ended", () => {
-        if (!isOwner) return;
+        if (!isOwner) {
+            // 听众：直接播放已预取的下一首，服务器切歌后由漂移修正对齐进度
+            if (nextTrack && currentTrackName) {
+                const current = decodeURIComponent(audio.src).split('/static/uploads/music/')[1];
+                finishedTrack = { file: current, until: Date.now() + 10000 };
+                audio.src = nextTrack.url;
+                audio.play().catch(()=>{});
+            }
+            return;
+        }
         console.log("播放结束，尝试切歌...");
 
         const currentIndex = currentPlaylist.findIndex(item => item.title === currentTrackName);
@@ -181,6 +288,7 @@ function initRoomSync() {
         // 发送请求
         fetch(toggleUrl, {
             method: 'POST',
+            headers: { Accept: 'application/json' },
             body: formData
         }).then(async (res) => {
             if (res.ok && window.manualRefreshState) await window.manualRefreshState();
@@ -188,35 +296,43 @@ function initRoomSync() {
     });
   }
 
+  // 房间已删除 (404) / 已关闭且不是房主 (403)：提示后返回首页
+  function leaveRoom(status) {
+    alert(status === 404 ? "房间已解散，正在返回首页..." : "房间已打烊，正在返回首页...");
+    window.location.href = "/dashboard";
+  }
+
   async function refreshState() {
     try {
-      const response = await fetch(stateUrl);
-      // [新增] 处理房间已删除 (404 Not Found)
-      // 当房主删除房间后，room_state 接口会返回 404
-      if (response.status === 404) {
-        alert("房间已解散，正在返回首页...");
-        window.location.href = "/dashboard";
-        return;
-      }
-
-      // [新增] 处理房间已关闭 (403 Forbidden)
-      // 当房主关闭房间后，非房主成员调用 room_state 会返回 403
-      if (response.status === 403) {
-        alert("房间已打烊，正在返回首页...");
-        window.location.href = "/dashboard";
+      const t0 = Date.now() / 1000;
+      // 请求列式 JSON：作者信息去重，返回体更小 (服务端同时按 Accept-Encoding 压缩)
+      const url = playlistVersion === null ? stateUrl : `${stateUrl}?playlist_since=${playlistVersion}`;
+      const response = await fetch(url, { headers: { Accept: COLUMNAR_STATE_TYPE } });
+      const t1 = Date.now() / 1000;
+      // [新增] 处理房间已删除 (404 Not Found) / 已关闭 (403 Forbidden)
+      if (response.status === 404 || response.status === 403) {
+        leaveRoom(response.status);
         return;
       }
 
       if (!response.ok) return;
-      const state = await response.json();
+      const state = decodeColumnarState(await response.json());
+      addClockSample(t0, t1, state.server_time);
+      await applyState(state);
+    } catch (e) { console.error(e); }
+  }
 
+  async function applyState(state) {
+    try {
+      playback = state;
       // [新增] 实时更新在线人数
       if (state.member_count !== undefined) {
           const countEl = document.getElementById("member-count-display");
           if (countEl) countEl.textContent = state.member_count;
       }
       // 更新本地状态
-      if (state.playlist) currentPlaylist = state.playlist;
+      mergePlaylist(state);
+      updateNextTrack(state);
       currentTrackName = state.current_track_name;
 
       // UI 更新
@@ -274,12 +390,16 @@ function initRoomSync() {
 
       // 歌单 & 聊天同步
       if (playlistContainer && state.playlist) {
-          updatePlaylistUI(playlistContainer, state.playlist, state.current_track_name, isOwner, toggleUrl, playlistDeleteUrl);
+          updatePlaylistUI(playlistContainer, currentPlaylist, state.current_track_name, isOwner,
+                           toggleUrl, playlistDeleteUrl, playlistMoveUrl);
       }
       if (chatLog && state.messages) updateChatLog(chatLog, state.messages);
 
-      // 音频同步
-      if (audio && state.is_active) {
+      // 音频同步 (本地刚切到下一首时，服务器确认切歌前的旧曲目状态不再拉回)
+      const awaitingSwitch = finishedTrack && state.current_track_file === finishedTrack.file
+          && Date.now() < finishedTrack.until;
+      if (!awaitingSwitch) finishedTrack = null;
+      if (audio && state.is_active && !awaitingSwitch) {
           if (state.current_track_file) {
             const targetSrc = `/static/uploads/music/${state.current_track_file}`;
             const currentSrcPath = decodeURIComponent(audio.src).split('/static/uploads/music/')[1];
@@ -287,30 +407,24 @@ function initRoomSync() {
             // 切歌
             if (currentSrcPath !== state.current_track_file) {
               audio.src = targetSrc;
-              if (state.current_position > 0) audio.currentTime = state.current_position;
+              const startAt = targetPosition();
+              if (startAt > 0) audio.currentTime = startAt;
               try {
                   await audio.load();
                   if (state.playback_status === "playing") audio.play().catch(()=>{});
               } catch (e) { console.error(e); }
             }
 
-            // 进度修正
-            if (state.current_position !== undefined) {
-                 const diff = Math.abs(audio.currentTime - state.current_position);
-                 if (state.playback_status === "paused") {
-                     if (diff > 0.5) audio.currentTime = state.current_position;
-                 } else if (state.playback_status === "playing") {
-                     if (isOwner && !audio.paused) {
-                         if (diff > 5) audio.currentTime = state.current_position;
-                     } else {
-                         if (diff > 2) audio.currentTime = state.current_position;
-                     }
-                 }
+            // 进度修正：暂停时对齐到锚点，播放中交给 correctDrift
+            if (state.playback_status === "paused") {
+                 const target = targetPosition();
+                 if (Math.abs(audio.currentTime - target) > 0.1) audio.currentTime = target;
             }
 
             // 状态控制
             if (state.playback_status === "playing") {
                 if (audio.paused) audio.play().catch(()=>{});
+                correctDrift();
                 if (vinylWrapper) vinylWrapper.classList.add('spinning');
             } else {
                 if (!audio.paused) audio.pause();
@@ -329,18 +443,62 @@ function initRoomSync() {
 
   window.manualRefreshState = refreshState;
   refreshState();
-  setInterval(refreshState, 2000);
+  setInterval(() => {
+    correctDrift();
+    maybePrefetch();
+  }, 500);
+
+  // 配置了推送服务时用 SSE 接收状态变化，连接失败则退回 2 秒轮询
+  let pollTimer = null;
+  const startPolling = () => {
+    if (!pollTimer) pollTimer = setInterval(refreshState, 2000);
+  };
+  if (eventsUrl && window.EventSource) {
+    // 推送模式下没有轮询样本：启动时补几次时钟采样，之后每分钟一次
+    [500, 1000, 1500].forEach((delay) => setTimeout(refreshState, delay));
+    setInterval(refreshState, 60000);
+    const source = new EventSource(eventsUrl);
+    source.addEventListener("state", (e) => applyState(JSON.parse(e.data)));
+    source.addEventListener("gone", (e) => {
+      source.close();
+      leaveRoom(JSON.parse(e.data).status);
+    });
+    source.onerror = () => {
+      // 连接被拒绝 (如未登录 401) 时浏览器不会重连，改为轮询
+      if (source.readyState === EventSource.CLOSED) startPolling();
+    };
+  } else {
+    startPolling();
+  }
+}
+
+// --- 房间状态的列式编码 (app/state_encoding.py) 还原为逐条结构 ---
+const COLUMNAR_STATE_TYPE = "application/vnd.voiceshare.columnar+json";
+function decodeColumnarState(data) {
+  if (!data || data.layout !== "columnar") return data;
+  const m = data.messages;
+  const messages = m.id.map((id, i) => {
+    const [authorId, authorName, authorAvatar] = data.authors[m.author[i]];
+    return { id, author_id: authorId, author_name: authorName, author_avatar: authorAvatar,
+             created_at: m.created_at[i], content: m.content[i] };
+  });
+  const p = data.playlist;
+  const playlist = p.id.map((id, i) => ({ id, music_id: p.music_id[i], title: p.title[i], position: p.position[i] }));
+  const state = { ...data, messages, playlist };
+  delete state.layout;
+  delete state.authors;
+  return state;
 }
 
 // --- 4. 歌单渲染 (确保按钮带 type="button" 和 data-action) ---
-function updatePlaylistUI(container, playlist, currentTrackName, isOwner, toggleUrl, deleteUrl) {
+function updatePlaylistUI(container, playlist, currentTrackName, isOwner, toggleUrl, deleteUrl, moveUrl) {
     let html = '';
     const csrfToken = document.querySelector('input[name="csrf_token"]')?.value || '';
 
     if (playlist.length === 0) {
         html = '<div class="empty-list-placeholder">队列空空如也</div>';
     } else {
-        playlist.forEach(item => {
+        playlist.forEach((item, index) => {
             const isPlaying = (item.title === currentTrackName);
             let actionsHtml = '';
 
@@ -355,6 +513,22 @@ function updatePlaylistUI(container, playlist, currentTrackName, isOwner, toggle
                         </button>
                     </form>
                 `;
+                // 上移 / 下移按钮：移到某一首之前 (before_id 为空表示移到末尾)
+                const moves = [];
+                if (index > 0) moves.push(['up', playlist[index - 1].id, '上移']);
+                if (index < playlist.length - 1) moves.push(['down', playlist[index + 2]?.id ?? '', '下移']);
+                moves.forEach(([dir, beforeId, title]) => {
+                    actionsHtml += `
+                    <form method="post" action="${moveUrl}" class="inline-btn-form">
+                        <input type="hidden" name="csrf_token" value="${csrfToken}" />
+                        <input type="hidden" name="item_id" value="${item.id}" />
+                        <input type="hidden" name="before_id" value="${beforeId}" />
+                        <button type="button" class="icon-btn-sm control-btn" title="${title}" data-action="move">
+                            <i class="ri-arrow-${dir}-s-line"></i>
+                        </button>
+                    </form>
+                `;
+                });
                 // 删除按钮
                 actionsHtml += `
                     <form method="post" action="${deleteUrl}" class="inline-btn-form">
@@ -0,0 +1,70 @@
+# tests/conftest.py
+# ==============================================================================
+# 测试夹具：每个测试用 config.TestConfig 创建一个新应用 (共享缓存的内存 SQLite，
+# 建表走 create_with_sqlite.py)，结束时释放连接，内存库随之销毁。
+# 进程内的缓存 (聊天环形缓冲、播放状态等) 是模块级单例，结束时经房间事件总线统一清空。
+# ==============================================================================
+import pytest
+
+from app import create_app, db
+from app.models import Music, Room, User
+from app.room_events import ALL_ROOMS, room_events
+
+PASSWORD = "secret1"
+
+
+@pytest.fixture
+def app():
+    app = create_app("config.TestConfig")
+    yield app
+    room_events.publish(ALL_ROOMS, "room", {"action": "reset"})
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def make_user(app):
+    def _make_user(username, is_admin=False):
+        with app.app_context():
+            user = User(username=username, is_admin=is_admin)
+            user.set_password(PASSWORD)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return _make_user
+
+
+@pytest.fixture
+def login(app):
+    """返回已登录的测试客户端。"""
+    def _login(username, is_admin=False):
+        client = app.test_client()
+        response = client.post("/admin/login" if is_admin else "/login",
+                               data={"username": username, "password": PASSWORD})
+        assert response.status_code == 302
+        return client
+    return _login
+
+
+@pytest.fixture
+def room(app, make_user):
+    """owner 的房间 (含 3 首已审核的音乐)，返回 {"id", "code", "owner_id", "music_ids"}。"""
+    owner_id = make_user("owner")
+    with app.app_context():
+        room = Room(owner_id=owner_id, name="测试房间", code="100001", is_active=True)
+        db.session.add(room)
+        musics = [
+            Music(user_id=owner_id, title=f"歌曲{i}", original_filename=f"{i}.mp3",
+                  stored_filename=f"song{i}.mp3", status="approved")
+            for i in range(3)
+        ]
+        db.session.add_all(musics)
+        db.session.commit()
+        return {"id": room.id, "code": room.code, "owner_id": owner_id, "music_ids": [m.id for m in musics]}
+
+
+def scalar(app, sql, **params):
+    with app.app_context():
+        return db.session.execute(db.text(sql), params).scalar()
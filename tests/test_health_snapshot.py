@@ -0,0 +1,47 @@
+# 数据库健康概览：快照写入 db_health_snapshot，各 worker 读取同一份 (health_snapshot.HealthSnapshotCache)
+import threading
+from datetime import datetime, timedelta
+
+from app import db
+from app.health_snapshot import HealthSnapshotCache
+
+from .conftest import scalar
+
+
+def test_overview_is_shared_through_table(app):
+    scheduler_cache, worker_cache = HealthSnapshotCache(), HealthSnapshotCache()
+    with app.app_context():
+        written = scheduler_cache.refresh_overview()
+        read = worker_cache.get_overview()
+
+    assert written["error"] is None
+    assert "room" in [t["TABLE_NAME"] for t in read["tables"]]
+    assert read["tables"] == written["tables"]
+    assert read["updated_at"] == written["updated_at"]
+    assert not worker_cache.is_refreshing()
+
+
+def test_first_read_computes_and_stores_overview(app):
+    with app.app_context():
+        snapshot = HealthSnapshotCache().get_overview()
+
+    assert snapshot["tables"]
+    assert scalar(app, "SELECT COUNT(*) FROM db_health_snapshot") == 1
+
+
+def test_stale_overview_is_served_and_refreshed_in_background(app):
+    cache = HealthSnapshotCache()
+    interval = app.config["HEALTH_SNAPSHOT_INTERVAL_SECONDS"]
+    stale = (datetime.now() - timedelta(seconds=interval * 3)).strftime("%Y-%m-%d %H:%M:%S")
+    with app.app_context():
+        cache.refresh_overview()
+        db.session.execute(db.text("UPDATE db_health_snapshot SET updated_at = :ts"), {"ts": stale})
+        db.session.commit()
+
+        snapshot = cache.get_overview()
+    for thread in threading.enumerate():
+        if thread.name == "health-snapshot":
+            thread.join(5)
+
+    assert snapshot["updated_at"] == stale
+    assert scalar(app, "SELECT updated_at FROM db_health_snapshot") > stale
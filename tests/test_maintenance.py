@@ -0,0 +1,68 @@
+# 分批维护任务：任务状态与运行占位保存在 maintenance_job 表中 (maintenance_service)
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app import db
+from app.maintenance_service import get_maintenance_job, start_maintenance
+
+from .conftest import scalar
+
+
+def _insert_running_job(app, job_id, updated_at):
+    with app.app_context():
+        db.session.execute(db.text("""
+            INSERT INTO maintenance_job (id, status, running_slot, steps, message, started_at, updated_at)
+            VALUES (:id, 'running', 1, '[]', '', :ts, :ts)
+        """), {"id": job_id, "ts": updated_at.strftime("%Y-%m-%d %H:%M:%S")})
+        db.session.commit()
+
+
+def _wait_finished(app, timeout=5):
+    deadline = time.time() + timeout
+    with app.app_context():
+        while time.time() < deadline:
+            job = get_maintenance_job()
+            if job and job["status"] != "running":
+                # 等线程归还连接后再结束测试，内存库才会随夹具销毁
+                for thread in threading.enumerate():
+                    if thread.name == "maintenance":
+                        thread.join(timeout)
+                return job
+            time.sleep(0.05)
+    raise AssertionError("维护任务未结束")
+
+
+def test_job_progress_is_read_from_table(app):
+    with app.app_context():
+        assert get_maintenance_job() is None
+        assert start_maintenance() is True
+
+    job = _wait_finished(app)
+
+    assert job["status"] == "success"
+    assert job["finished_at"] is not None
+    assert [step["status"] for step in job["steps"]] == ["done"] * len(job["steps"])
+    assert job["steps"][-1]["name"] == "关闭僵尸房间"
+    assert scalar(app, "SELECT COUNT(*) FROM maintenance_job WHERE running_slot IS NOT NULL") == 0
+
+
+def test_running_job_on_another_worker_blocks_start(app):
+    _insert_running_job(app, "other", datetime.now())
+
+    with app.app_context():
+        assert start_maintenance() is False
+        assert get_maintenance_job()["id"] == "other"
+    assert scalar(app, "SELECT COUNT(*) FROM maintenance_job") == 1
+
+
+def test_stale_running_job_is_marked_interrupted(app):
+    stale = datetime.now() - timedelta(seconds=app.config["MAINTENANCE_JOB_STALE_SECONDS"] + 60)
+    _insert_running_job(app, "crashed", stale)
+
+    with app.app_context():
+        assert start_maintenance() is True
+    job = _wait_finished(app)
+
+    assert job["id"] != "crashed" and job["status"] == "success"
+    assert scalar(app, "SELECT status FROM maintenance_job WHERE id = 'crashed'") == "error"
@@ -0,0 +1,57 @@
+# 加入房间：成员登记只在首次加入时写进房消息，窗口内重复进入不产生写入 (routes._attach_member)
+from datetime import datetime, timedelta
+
+from app import db
+
+from .conftest import scalar
+
+
+def _counts(app, room):
+    return {
+        "members": scalar(app, "SELECT COUNT(*) FROM room_member WHERE room_id = :rid", rid=room["id"]),
+        "join_messages": scalar(
+            app, "SELECT COUNT(*) FROM room_chat_event WHERE room_id = :rid AND content = '进入了房间'",
+            rid=room["id"],
+        ),
+        "participations": scalar(
+            app, "SELECT COUNT(*) FROM room_participation_record WHERE room_code = :code", code=room["code"]
+        ),
+    }
+
+
+def test_first_join_registers_member(app, room, make_user, login):
+    make_user("bob")
+    client = login("bob")
+
+    response = client.post("/rooms/join", data={"code": room["code"]})
+
+    assert response.status_code == 302
+    assert _counts(app, room) == {"members": 1, "join_messages": 1, "participations": 1}
+
+
+def test_repeat_join_within_window_writes_nothing(app, room, make_user, login):
+    make_user("bob")
+    client = login("bob")
+    client.post("/rooms/join", data={"code": room["code"]})
+    before = _counts(app, room)
+
+    # 加入后跳转到房间页 (再次登记)、双击、快速刷新：都在同一秒内
+    client.post("/rooms/join", data={"code": room["code"]})
+    client.get(f"/rooms/{room['code']}")
+    client.get(f"/rooms/{room['code']}")
+
+    assert _counts(app, room) == before
+
+
+def test_expired_session_is_renewed_without_join_message(app, room, make_user, login):
+    make_user("bob")
+    client = login("bob")
+    client.post("/rooms/join", data={"code": room["code"]})
+    stale = datetime.utcnow() - timedelta(minutes=app.config["ROOM_SESSION_WINDOW_MINUTES"] + 1)
+    with app.app_context():
+        db.session.execute(db.text("UPDATE room_member SET joined_at = :t, last_seen_at = :t"), {"t": stale})
+        db.session.commit()
+
+    client.get(f"/rooms/{room['code']}")
+
+    assert _counts(app, room) == {"members": 1, "join_messages": 1, "participations": 2}
@@ -0,0 +1,88 @@
+# 数据中心游标分页：逐页遍历与一次取全量的顺序一致，排序值相同或为 NULL 时不重不漏 (app/database_views.py)
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app import db
+from app.database_views import _fetch_page, _music_query_spec, _record_query_spec
+from app.models import ListenRecord, Music
+
+
+def _walk(app, build_spec, args, page_size):
+    """按 next_cursor 逐页取完，返回 (每页的行, 游标列表)。"""
+    app.config["DATA_CENTER_PAGE_SIZE"] = page_size
+    pages, cursor = [], None
+    with app.test_request_context(query_string=args):
+        spec = build_spec(MultiDict(args))
+        while True:
+            rows, cursor = _fetch_page(spec, cursor)
+            pages.append([dict(row) for row in rows])
+            if not cursor:
+                return pages
+
+
+def _ids(pages, key):
+    return [row[key] for page in pages for row in page]
+
+
+@pytest.fixture
+def records(app, make_user):
+    user_id = make_user("listener")
+    base = datetime(2026, 1, 1)
+    with app.app_context():
+        # 每 3 条共用一个播放时间，排序值相同时靠 id 决定顺序
+        db.session.add_all([
+            ListenRecord(user_id=user_id, song_name=f"歌曲{i % 4}", played_at=base + timedelta(minutes=i // 3))
+            for i in range(23)
+        ])
+        db.session.commit()
+
+
+@pytest.mark.parametrize("order", ["desc", "asc"])
+@pytest.mark.parametrize("sort", ["time", "song", "id"])
+def test_record_pages_match_unpaged_order(app, records, sort, order):
+    args = {"sort": sort, "order": order}
+    expected = _ids(_walk(app, _record_query_spec, args, page_size=1000), "id")
+
+    pages = _walk(app, _record_query_spec, args, page_size=5)
+
+    assert len(expected) == 23
+    assert _ids(pages, "id") == expected
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+
+
+@pytest.mark.parametrize("order", ["desc", "asc"])
+def test_null_sort_values_are_paged(app, make_user, order):
+    user_id = make_user("uploader")
+    with app.app_context():
+        db.session.add_all([
+            Music(user_id=user_id, title=f"t{i}", original_filename="a.mp3", stored_filename=f"{i}.mp3",
+                  status="rejected" if i % 2 else "approved", rejection_reason=f"原因{i % 3}" if i % 2 else None)
+            for i in range(11)
+        ])
+        db.session.commit()
+    args = {"sort": "reason", "order": order}
+    expected = _ids(_walk(app, _music_query_spec, args, page_size=1000), "music_id")
+
+    pages = _walk(app, _music_query_spec, args, page_size=3)
+
+    assert sorted(expected) == list(range(1, 12))
+    assert _ids(pages, "music_id") == expected
+
+
+def test_cursor_from_other_sort_restarts_from_first_page(app, records):
+    app.config["DATA_CENTER_PAGE_SIZE"] = 5
+    with app.test_request_context():
+        _, cursor = _fetch_page(_record_query_spec(MultiDict({"sort": "time"})), None)
+        first, _ = _fetch_page(_record_query_spec(MultiDict({"sort": "song"})), None)
+        reused, _ = _fetch_page(_record_query_spec(MultiDict({"sort": "song"})), cursor)
+
+    assert [row["id"] for row in reused] == [row["id"] for row in first]
+
+
+def test_only_selected_columns_are_fetched(app, records):
+    with app.test_request_context():
+        rows, _ = _fetch_page(_record_query_spec(MultiDict({"cols": ["song"], "sort": "time"})), None)
+
+    assert set(rows[0].keys()) == {"song_name", "played_at", "id"}
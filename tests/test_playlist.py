@@ -0,0 +1,90 @@
+# 房间歌单：按 position 排序、移动只改一行、按版本增量下发，删除后回退到完整歌单 (app/playlist_store.py)
+import pytest
+
+from app import db
+from app.models import Room
+from app.playlist_store import add_tracks, move_track, playlist_items
+
+
+@pytest.fixture
+def owner(room, login):
+    return login("owner")
+
+
+def _state(client, room, since=None):
+    query = f"?playlist_since={since}" if since is not None else ""
+    return client.get(f"/rooms/{room['code']}/state{query}").get_json()
+
+
+def _titles(state):
+    return [item["title"] for item in sorted(state["playlist"], key=lambda item: item["position"])]
+
+
+def test_add_appends_in_submitted_order(owner, room):
+    music_ids = room["music_ids"]
+    response = owner.post(f"/rooms/{room['code']}/playlist/add",
+                          data={"music_id": [music_ids[2], music_ids[0], music_ids[1]]})
+
+    assert response.status_code == 302
+    state = _state(owner, room)
+    assert _titles(state) == ["歌曲2", "歌曲0", "歌曲1"]
+    assert state["playlist_version"] == 1
+    assert state["playlist_delta"] is False
+
+
+def test_move_sends_only_the_moved_row_as_delta(owner, room):
+    owner.post(f"/rooms/{room['code']}/playlist/add", data={"music_id": room["music_ids"]})
+    before = _state(owner, room)
+    items = sorted(before["playlist"], key=lambda item: item["position"])
+
+    response = owner.post(f"/rooms/{room['code']}/playlist/move",
+                          data={"item_id": items[2]["id"], "before_id": items[0]["id"]})
+
+    assert response.get_json() == {"status": "success", "version": before["playlist_version"] + 1}
+    delta = _state(owner, room, since=before["playlist_version"])
+    assert delta["playlist_delta"] is True
+    assert [item["id"] for item in delta["playlist"]] == [items[2]["id"]]
+    assert _titles(_state(owner, room)) == ["歌曲2", "歌曲0", "歌曲1"]
+
+
+def test_delete_forces_full_playlist_for_older_clients(owner, room):
+    owner.post(f"/rooms/{room['code']}/playlist/add", data={"music_id": room["music_ids"]})
+    before = _state(owner, room)
+
+    owner.post(f"/rooms/{room['code']}/playlist/delete", data={"item_id": before["playlist"][0]["id"]})
+
+    state = _state(owner, room, since=before["playlist_version"])
+    assert state["playlist_delta"] is False
+    assert len(state["playlist"]) == 2
+    # 已是最新版本的客户端收到空增量
+    latest = _state(owner, room, since=state["playlist_version"])
+    assert latest["playlist_delta"] is True and latest["playlist"] == []
+
+
+def test_move_renumbers_when_gap_is_exhausted(app, room):
+    with app.app_context():
+        add_tracks(room["id"], room["music_ids"])
+        db.session.commit()
+        room_row = db.session.get(Room, room["id"])
+        first, second, third = [item["id"] for item in playlist_items(room_row)[0]]
+        # 反复把第三首插到前两首之间，直到间隔耗尽触发重新编号
+        for _ in range(60):
+            move_track(room["id"], third, second)
+            move_track(room["id"], second, third)
+        move_track(room["id"], third, second)
+        db.session.commit()
+        db.session.expire_all()
+        items, _ = playlist_items(db.session.get(Room, room["id"]))
+
+    assert [item["id"] for item in items] == [first, third, second]
+    positions = [item["position"] for item in items]
+    assert positions == sorted(positions) and len(set(positions)) == 3
+
+
+def test_other_members_cannot_reorder(room, make_user, login):
+    make_user("bob")
+    client = login("bob")
+
+    response = client.post(f"/rooms/{room['code']}/playlist/move", data={"item_id": 1})
+
+    assert response.status_code == 403
@@ -0,0 +1,66 @@
+# 限流：令牌耗尽后返回 429 + Retry-After；fetch 请求得到 JSON，表单提交 flash 后跳回来源页 (app/rate_limit.py)
+import pytest
+
+from app.rate_limit import MemoryBackend, rate_limiter
+
+
+@pytest.fixture
+def limited(app, room, make_user, login):
+    app.config.update(RATE_LIMIT_ENABLED=True, RATE_LIMITS={
+        "chat": {"rate": 0.01, "burst": 2},
+        "room": {"rate": 0.01, "burst": 1},
+    })
+    rate_limiter.init_app(app)
+    make_user("bob")
+    return login("bob")
+
+
+def _chat(client, room, **headers):
+    return client.post(f"/rooms/{room['code']}/messages", data={"content": "hi"}, headers=headers)
+
+
+def test_fetch_requests_get_json_429(limited, room):
+    assert [_chat(limited, room, Accept="application/json").status_code for _ in range(2)] == [200, 200]
+
+    response = _chat(limited, room, Accept="application/json")
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.get_json()["status"] == "error"
+
+
+def test_form_posts_flash_and_redirect_back(limited, room):
+    back = "http://localhost/dashboard"
+    limited.post("/rooms/join", data={"code": room["code"]}, headers={"Referer": back})
+
+    response = limited.post("/rooms/join", data={"code": room["code"]},
+                            headers={"Accept": "text/html", "Referer": back})
+
+    assert response.status_code == 429
+    assert response.headers["Location"] == back
+    assert "Retry-After" in response.headers
+    assert "操作太频繁" in limited.get("/dashboard").get_data(as_text=True)
+
+
+def test_buckets_are_per_room_and_get_requests_are_not_limited(limited, room):
+    for _ in range(2):
+        _chat(limited, room, Accept="application/json")
+
+    assert _chat(limited, room, Accept="application/json").status_code == 429
+    assert limited.get(f"/rooms/{room['code']}/state").status_code == 200
+    # 其他房间 (不存在) 使用独立的令牌桶：限流之后才会返回 404
+    assert limited.post("/rooms/999999/messages", data={"content": "hi"}).status_code == 404
+
+
+def test_memory_backend_refills_and_evicts_oldest_bucket():
+    backend = MemoryBackend(max_keys=2)
+    assert backend.take("a", rate=1000.0, burst=1) == (True, 0.0)
+    allowed, retry_after = backend.take("a", rate=1.0, burst=1)
+    assert not allowed and 0 < retry_after <= 1
+
+    backend.take("b", rate=1.0, burst=1)
+    backend.take("c", rate=1.0, burst=1)
+
+    assert len(backend) == 2
+    # "a" 已被淘汰，视为补满
+    assert backend.take("a", rate=1.0, burst=1)[0]
@@ -0,0 +1,57 @@
+# 数据库事件总线：跳过的 id 单独重新检查，空洞之后的已读行不会被反复读取 (DatabaseEventBus.pump)
+import time
+
+from sqlalchemy import event
+
+from app import db
+from app.room_events import DatabaseEventBus, EventCursor
+
+
+def _insert_events(app, ids):
+    with app.app_context():
+        for event_id in ids:
+            db.session.execute(db.text("""
+                INSERT INTO room_event (id, room_id, kind, origin, payload)
+                VALUES (:id, 1, 'message', 'other-worker', NULL)
+            """), {"id": event_id})
+        db.session.commit()
+
+
+def _pump(app, bus):
+    """执行一轮 pump，返回本轮执行的 SELECT 次数。"""
+    selects = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            bus.pump(db.engine)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+    return len(selects)
+
+
+def test_gap_is_rechecked_without_rereading_seen_rows(app):
+    bus = DatabaseEventBus()
+    bus.batch_size = 3
+    bus._cursor = EventCursor(gap_seconds=60)
+    bus._last_trim = time.monotonic()
+    received = []
+    bus.subscribe(lambda e: received.append(e["id"]))
+
+    # id 2 的事务尚未提交：之后的 7 行 (超过一批) 先出现
+    _insert_events(app, [1] + list(range(3, 10)))
+    _pump(app, bus)
+    assert received == [1, 3, 4, 5, 6, 7, 8, 9]
+
+    # 空洞未到期时，下一轮只查询空洞与末尾之后的新行
+    assert _pump(app, bus) == 2
+    assert received == [1, 3, 4, 5, 6, 7, 8, 9]
+
+    _insert_events(app, [2, 10])
+    _pump(app, bus)
+    assert received == [1, 3, 4, 5, 6, 7, 8, 9, 2, 10]
+    assert bus._cursor.pending(bus.batch_size) == []
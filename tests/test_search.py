@@ -0,0 +1,22 @@
+# 数据中心搜索条件 (app/search.py)：听歌流水按流水自身的歌名检索，不依赖当前曲库
+import app.search as search
+
+
+def test_song_search_uses_listen_song_name_index(app, monkeypatch):
+    monkeypatch.setattr(search, "is_mysql", lambda: True)
+    app.config["SEARCH_USE_FULLTEXT"] = True
+    params = {}
+    with app.app_context():
+        sql = search.song_name_condition("lr.song_name", "晴天", "q_song", params)
+
+    assert "listen_song_name" in sql and "musics" not in sql
+    assert params == {"q_song": '"晴天"'}
+
+
+def test_short_terms_and_sqlite_fall_back_to_like(app):
+    params = {}
+    with app.app_context():
+        sql = search.song_name_condition("lr.song_name", "晴", "q_song", params)
+
+    assert sql == "lr.song_name LIKE :q_song"
+    assert params == {"q_song": "%晴%"}
@@ -0,0 +1,59 @@
+# 写后缓冲：一行坏数据不能堵住队列；连接错误时整批保留重试 (app/write_behind.py)
+from datetime import datetime
+
+import pytest
+from sqlalchemy import exc
+
+from app.write_behind import write_buffer
+
+from .conftest import scalar
+
+
+def _listen(song, user_id=1):
+    return {"user_id": user_id, "song_name": song, "played_at": datetime.utcnow()}
+
+
+@pytest.fixture
+def buffer(app, make_user):
+    make_user("listener")
+    write_buffer.flush()
+    yield write_buffer
+    write_buffer._queue.clear()
+
+
+def test_bad_row_is_isolated_and_dropped_after_max_attempts(app, buffer):
+    before = buffer.stats()["failed_rows"]
+    for i in range(3):
+        buffer._queue.append(("listen_record", _listen(f"good{i}"), 0))
+    # song_name NOT NULL：整批插入失败
+    buffer._queue.append(("listen_record", {"user_id": 1, "song_name": None, "played_at": None}, 0))
+    buffer._queue.append(("room_participation_record",
+                          {"user_id": 1, "room_code": "100001", "participated_at": datetime.utcnow()}, 0))
+
+    assert buffer.flush() == 4
+    assert scalar(app, "SELECT COUNT(*) FROM listen_record") == 3
+    assert scalar(app, "SELECT COUNT(*) FROM room_participation_record") == 1
+    assert len(buffer._queue) == 1
+
+    for _ in range(buffer.max_attempts - 1):
+        buffer.flush()
+
+    assert len(buffer._queue) == 0
+    assert buffer.stats()["failed_rows"] == before + 1
+    assert scalar(app, "SELECT COUNT(*) FROM listen_record") == 3
+
+
+def test_connection_error_requeues_whole_batch(app, buffer, monkeypatch):
+    def disconnected(items):
+        raise exc.OperationalError("INSERT", {}, Exception("server has gone away"), connection_invalidated=True)
+
+    buffer._queue.append(("listen_record", _listen("a"), 0))
+    buffer._queue.append(("listen_record", _listen("b"), 0))
+    monkeypatch.setattr(buffer, "_write", disconnected)
+
+    assert buffer.flush() == 0
+    assert [(row["song_name"], attempts) for _, row, attempts in buffer._queue] == [("a", 0), ("b", 0)]
+
+    monkeypatch.undo()
+    assert buffer.flush() == 2
+    assert scalar(app, "SELECT COUNT(*) FROM listen_record") == 2